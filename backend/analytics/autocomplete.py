@@ -0,0 +1,183 @@
+"""
+In-memory typeahead index over artist, album, track and composer names.
+
+Each process keeps one sorted list of ``(key, kind, id, label)`` entries,
+where a key is the normalized name from the start of one of its words, so
+"beat" finds "The Beatles". A lookup is a bisect plus a short scan and
+never touches the database. The index is built on first use, patched by
+model signals after each commit (copy-on-write, so lookups need no lock),
+and rebuilt when the catalog's cache
+versions show that another process wrote to it (checked at most every
+``AUTOCOMPLETE_REFRESH_SECONDS``).
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .cache import get_model_versions
+from .models import Album, Artist, Track
+
+CATALOG = (Artist, Album, Track)
+MAX_KEY_LENGTH = 64
+COMPOSER_SPLIT_RE = re.compile(r'\s*(?:[,/&;]|\band\b)\s*', re.IGNORECASE)
+
+
+def normalize(text):
+    """Case-fold and strip accents so "Beyoncé" and "beyonce" share keys"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+def word_keys(label):
+    """The normalized label starting from each of its words"""
+    text = normalize(label)
+    return {
+        text[i:i + MAX_KEY_LENGTH]
+        for i, char in enumerate(text)
+        if char.isalnum() and (i == 0 or not text[i - 1].isalnum())
+    }
+
+
+def composer_names(composer):
+    return {name for name in COMPOSER_SPLIT_RE.split(composer or '') if name}
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+        # (kind, id) -> keys, so an entry can be found again for removal
+        self.keys = {}
+        # Composers are shared between tracks: name -> track count, track id -> names
+        self.composer_counts = {}
+        self.track_composers = {}
+        self.versions = None
+        self.checked_at = 0
+
+    def reset(self):
+        with self.lock:
+            self.entries = None
+
+    @property
+    def built(self):
+        return self.entries is not None
+
+    def build(self, request=None):
+        entries, keys = [], {}
+        composer_counts, track_composers = {}, {}
+
+        def add(kind, pk, label):
+            entry_keys = word_keys(label)
+            keys[(kind, pk)] = entry_keys
+            entries.extend((key, kind, pk, label) for key in entry_keys)
+
+        versions = get_model_versions(CATALOG, request)
+        for pk, name in Artist.objects.order_by().values_list('pk', 'name').iterator():
+            add('artist', pk, name)
+        for pk, title in Album.objects.order_by().values_list('pk', 'title').iterator():
+            add('album', pk, title)
+        for pk, name, composer in Track.objects.order_by().values_list('pk', 'name', 'composer').iterator():
+            add('track', pk, name)
+            names = composer_names(composer)
+            if names:
+                track_composers[pk] = names
+                for composer_name in names:
+                    composer_counts[composer_name] = composer_counts.get(composer_name, 0) + 1
+        for composer_name in composer_counts:
+            add('composer', composer_name, composer_name)
+        entries.sort()
+
+        with self.lock:
+            self.entries, self.keys = entries, keys
+            self.composer_counts, self.track_composers = composer_counts, track_composers
+            self.versions, self.checked_at = versions, time.monotonic()
+
+    def ensure_fresh(self, request=None):
+        """
+        Build or rebuild the index if needed. Given the request, the catalog
+        versions come from its one cache version lookup.
+        """
+        if not self.built:
+            self.build(request)
+            return
+        if time.monotonic() - self.checked_at < settings.AUTOCOMPLETE_REFRESH_SECONDS:
+            return
+        self.checked_at = time.monotonic()
+        if get_model_versions(CATALOG, request) != self.versions:
+            self.build(request)
+
+    def lookup(self, query, limit=10, request=None):
+        """Up to ``limit`` entries whose name has a word starting with ``query``"""
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        self.ensure_fresh(request)
+        entries = self.entries
+        results, seen = [], set()
+        for i in range(bisect_left(entries, (prefix,)), len(entries)):
+            key, kind, pk, label = entries[i]
+            if not key.startswith(prefix):
+                break
+            if (kind, pk) not in seen:
+                seen.add((kind, pk))
+                results.append({'type': kind, 'id': pk if kind != 'composer' else None, 'label': label})
+                if len(results) == limit:
+                    break
+        return results
+
+    # Incremental maintenance from model signals; a no-op until the index is built.
+    # Writers patch a copy and swap it in, so lookups never see a list mid-change.
+
+    def _remove(self, entries, kind, pk):
+        for key in self.keys.pop((kind, pk), ()):
+            # (key, kind, pk) sorts just before its entry, whatever the label
+            index = bisect_left(entries, (key, kind, pk))
+            if index < len(entries) and entries[index][:3] == (key, kind, pk):
+                del entries[index]
+
+    def _add(self, entries, kind, pk, label):
+        self.keys[(kind, pk)] = word_keys(label)
+        for key in self.keys[(kind, pk)]:
+            insort(entries, (key, kind, pk, label))
+
+    def update(self, kind, pk, label, composer=None):
+        with self.lock:
+            if not self.built:
+                return
+            entries = list(self.entries)
+            self._remove(entries, kind, pk)
+            self._add(entries, kind, pk, label)
+            if kind == 'track':
+                self._set_track_composers(entries, pk, composer_names(composer))
+            self.entries = entries
+
+    def remove(self, kind, pk):
+        with self.lock:
+            if not self.built:
+                return
+            entries = list(self.entries)
+            self._remove(entries, kind, pk)
+            if kind == 'track':
+                self._set_track_composers(entries, pk, set())
+            self.entries = entries
+
+    def _set_track_composers(self, entries, track_id, names):
+        previous = self.track_composers.pop(track_id, set())
+        if names:
+            self.track_composers[track_id] = names
+        for name in previous - names:
+            self.composer_counts[name] -= 1
+            if not self.composer_counts[name]:
+                del self.composer_counts[name]
+                self._remove(entries, 'composer', name)
+        for name in names - previous:
+            self.composer_counts[name] = self.composer_counts.get(name, 0) + 1
+            if self.composer_counts[name] == 1:
+                self._add(entries, 'composer', name, name)
+
+
+catalog_index = PrefixIndex()
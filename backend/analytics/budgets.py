@@ -0,0 +1,79 @@
+"""
+Per-endpoint query budgets.
+
+Views declare how many queries and how much SQL time one request may use
+with ``@query_budget``; ``QueryBudgetMiddleware`` measures every request and
+logs (or, with ``QUERY_BUDGET_RAISE``, raises on) requests that go over.
+"""
+import time
+
+from django.conf import settings
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised instead of logging when settings.QUERY_BUDGET_RAISE is on (tests)"""
+
+
+class QueryBudget:
+    def __init__(self, max_queries=None, max_sql_ms=None):
+        self.max_queries = max_queries
+        self.max_sql_ms = max_sql_ms
+
+    def violations(self, stats, allowance=0):
+        """Describe how ``stats`` exceed the budget; ``allowance`` extra queries are tolerated"""
+        problems = []
+        if self.max_queries is not None and stats.count > self.max_queries + allowance:
+            problems.append(f'{stats.count} queries (budget {self.max_queries} + {allowance})')
+        if self.max_sql_ms is not None and stats.sql_ms > self.max_sql_ms:
+            problems.append(f'{stats.sql_ms:.1f}ms of SQL (budget {self.max_sql_ms}ms)')
+        return problems
+
+
+def query_budget(max_queries=None, max_sql_ms=None):
+    """
+    Declare a query budget on a view class, a viewset or a single action.
+    Action-level budgets take precedence over the class budget.
+    """
+    def decorator(view):
+        view.query_budget = QueryBudget(max_queries, max_sql_ms)
+        return view
+    return decorator
+
+
+def request_allowance(request):
+    """
+    Queries tolerated on top of a view's budget: loading the authenticated
+    user, and the one cache version lookup of cached views, are not its cost.
+    """
+    user = getattr(request, 'user', None)
+    allowance = settings.QUERY_BUDGET_AUTH_ALLOWANCE if user and user.is_authenticated else 0
+    if getattr(request, '_analytics_versions', None) is not None:
+        allowance += settings.QUERY_BUDGET_CACHE_ALLOWANCE
+    return allowance
+
+
+def get_query_budget(view_func, method):
+    """Resolve the budget for the handler a resolved view will dispatch to"""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, 'query_budget', None)
+    # DRF viewsets map HTTP methods to action names; plain views use the method name
+    actions = getattr(view_func, 'actions', None) or {}
+    handler = getattr(cls, actions.get(method.lower(), method.lower()), None)
+    return getattr(handler, 'query_budget', None) or getattr(cls, 'query_budget', None)
+
+
+class QueryStats:
+    """Database execute wrapper counting queries and their wall time"""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.sql_ms += (time.perf_counter() - started) * 1000
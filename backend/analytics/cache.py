@@ -0,0 +1,284 @@
+"""
+Response caching for read-only analytics actions.
+
+``cached_action`` stores an action's response data in the ``analytics``
+cache, keyed on the request path, the normalized query string, the caller's
+role and a version number for every model the action depends on. Model
+signals bump those versions, so a write makes every dependent entry
+unreachable without having to enumerate keys; stale entries then age out
+through the normal cache timeout. Versions live in the ``CacheVersion``
+table, so they are never culled with cache entries and every process
+(workers, commands, the report worker) sees the same ones whatever the
+cache backend. Signals bump them once per transaction, in one UPDATE after
+it commits. A request reads them once, in a single query.
+
+``public_cache`` applies the same versions at the HTTP level for public
+views: ETag and Last-Modified validators with conditional GET handling,
+Cache-Control headers, and a full-response cache for anonymous readers.
+Since the validators come from the database, every worker computes the
+same ETag for the same data and sees writes made anywhere.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import (
+    Album, Artist, CacheVersion, Customer, CustomerMetrics, Genre, Invoice, InvoiceLine, Track
+)
+
+CACHE_ALIAS = 'analytics'
+
+# Models whose writes invalidate cached analytics responses
+TRACKED_MODELS = (Invoice, InvoiceLine, Track, Customer, Album, Artist, Genre)
+SALES_MODELS = (Invoice, InvoiceLine, Track, Customer)
+CATALOG_MODELS = (Track, Album, Artist, Genre, InvoiceLine)
+# Responses read from CustomerMetrics, which rescoring changes without any invoice write
+CUSTOMER_MODELS = (*SALES_MODELS, CustomerMetrics)
+
+_cached_actions = []
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _incr(key):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing key: add() so a concurrent first write doesn't reset the counter
+        if not cache.add(key, 1, timeout=None):
+            return cache.incr(key)
+        return 1
+
+
+def invalidate_model(*models):
+    """Invalidate every cached response that depends on any of ``models``"""
+    bump_versions(*(model._meta.label_lower for model in models))
+
+
+def bump_versions(*labels):
+    """Increment the CacheVersion rows for ``labels`` in the current transaction"""
+    versions = CacheVersion.objects.filter(model__in=labels)
+    changes = {'version': F('version') + 1, 'changed_at': timezone.now()}
+    if versions.update(**changes) < len(labels):
+        # First bump of a label: insert its row (ignore_conflicts lets a concurrent
+        # writer win) and bump again; a second bump of the others is harmless
+        CacheVersion.objects.bulk_create([CacheVersion(model=label) for label in labels], ignore_conflicts=True)
+        versions.update(**changes)
+
+
+def _flush_pending_versions():
+    labels = transaction.get_connection().__dict__.pop('_pending_versions', None)
+    if labels:
+        bump_versions(*sorted(labels))
+
+
+def bump_versions_on_commit(*labels):
+    """
+    Bump ``labels`` once the current transaction commits, merged with every
+    other label bumped in it into one UPDATE. Writers then never wait on each
+    other's CacheVersion row locks, and a bulk write bumps each label once.
+    """
+    transaction.get_connection().__dict__.setdefault('_pending_versions', set()).update(labels)
+    # The first flush to run bumps every gathered label and the rest find nothing
+    # left. Labels of a rolled back transaction join the next one's bump, which
+    # only invalidates more than needed.
+    transaction.on_commit(_flush_pending_versions)
+
+
+def get_version(label):
+    """The CacheVersion counter for ``label``, 0 before its first bump"""
+    return CacheVersion.objects.filter(model=label).values_list('version', flat=True).first() or 0
+
+
+def _model_state(request=None):
+    """Model label -> (version, changed_at), read once per request when one is given"""
+    request = getattr(request, '_request', request)
+    state = getattr(request, '_analytics_versions', None)
+    if state is None:
+        state = {
+            model: (version, changed_at)
+            for model, version, changed_at in CacheVersion.objects.values_list('model', 'version', 'changed_at')
+        }
+        if request is not None:
+            request._analytics_versions = state
+    return state
+
+
+def get_model_versions(models, request=None):
+    """Current invalidation version of each model, in order"""
+    state = _model_state(request)
+    return [state.get(model._meta.label_lower, (0, None))[0] for model in models]
+
+
+def get_last_modified(models, request=None):
+    """Epoch seconds of the latest recorded write to any of ``models``, None if none was recorded"""
+    state = _model_state(request)
+    stamps = [state[model._meta.label_lower][1] for model in models if model._meta.label_lower in state]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return int(max(stamps).timestamp()) if stamps else None
+
+
+def _request_role(request):
+    user = request.user
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    return getattr(user, 'role', None) or 'user'
+
+
+def cache_key(request, name, depends_on, vary_on=None):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in sorted(request.query_params.getlist(key))
+    )
+    raw = repr((
+        name,
+        request.path,
+        params,
+        _request_role(request),
+        vary_on(request) if vary_on else None,
+        get_model_versions(depends_on, request),
+    ))
+    return f'analytics:response:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cached_action(depends_on=SALES_MODELS, timeout=None, vary_on=None):
+    """
+    Cache a DRF action's successful GET responses.
+
+    ``depends_on`` lists the models whose writes invalidate the entry and
+    ``timeout`` overrides the ``analytics`` cache's default TTL (seconds).
+    ``vary_on`` is an optional function of the request whose result joins
+    the cache key, for responses that depend on more than role and query.
+    Apply it beneath ``@action`` so the router still sees the action.
+    """
+    def decorator(func):
+        name = func.__name__
+        _cached_actions.append(name)
+
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return func(self, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = cache_key(request, name, depends_on, vary_on)
+            data = cache.get(key)
+            if data is not None:
+                _incr(f'analytics:stats:{name}:hits')
+                return Response(data)
+
+            _incr(f'analytics:stats:{name}:misses')
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                if timeout is None:
+                    cache.set(key, response.data)
+                else:
+                    cache.set(key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_cache_stats():
+    """Hit/miss counters for every cached action"""
+    keys = [
+        f'analytics:stats:{name}:{kind}'
+        for name in _cached_actions
+        for kind in ('hits', 'misses')
+    ]
+    counters = get_cache().get_many(keys)
+    stats = {}
+    for name in _cached_actions:
+        hits = counters.get(f'analytics:stats:{name}:hits', 0)
+        misses = counters.get(f'analytics:stats:{name}:misses', 0)
+        lookups = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        }
+    return stats
+
+
+def _is_anonymous(request):
+    user = getattr(request, 'user', None)
+    return 'HTTP_AUTHORIZATION' not in request.META and not (user and user.is_authenticated)
+
+
+def public_cache(depends_on, max_age=None, private=False):
+    """
+    HTTP caching for a public view's GET requests.
+
+    Responses carry an ETag built from the path, the query string and the
+    versions of ``depends_on``, plus a Last-Modified from their latest
+    write, so matching conditional requests get a 304 without running the
+    view. Anonymous responses are ``public`` for ``max_age`` seconds
+    (default ``settings.PUBLIC_CACHE_MAX_AGE``) and are served from the
+    ``analytics`` cache until a dependency changes. ``private`` views, which
+    return personal data, only get the validators: every response is
+    ``private, no-cache`` and none is kept server-side. Decorate
+    ``dispatch`` with ``method_decorator`` to cover every action of a view.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            params = sorted((key, value) for key in request.GET for value in request.GET.getlist(key))
+            versions = get_model_versions(depends_on, request)
+            digest = hashlib.md5(repr((request.path, params, versions)).encode()).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = get_last_modified(depends_on, request)
+            shared = not private and _is_anonymous(request)
+
+            def add_headers(response):
+                response.headers['ETag'] = etag
+                if last_modified is not None:
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if shared:
+                    patch_cache_control(response, public=True, max_age=max_age or settings.PUBLIC_CACHE_MAX_AGE)
+                else:
+                    patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Authorization', 'Cookie'))
+                return response
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return add_headers(response)
+
+            key = f'analytics:public:{digest}'
+            if shared:
+                cached = get_cache().get(key)
+                if cached is not None:
+                    content, content_type = cached
+                    return add_headers(HttpResponse(content, content_type=content_type))
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            if shared and not response.streaming:
+                def store(rendered):
+                    get_cache().set(key, (rendered.content, rendered.headers.get('Content-Type')))
+
+                if getattr(response, 'is_rendered', True):
+                    store(response)
+                else:
+                    response.add_post_render_callback(store)
+            return add_headers(response)
+        return wrapper
+    return decorator
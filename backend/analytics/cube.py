@@ -0,0 +1,245 @@
+"""
+In-process columnar sales cube for ad-hoc slicing.
+
+``SalesCube`` keeps every invoice line in NumPy column arrays: dictionary
+encoded codes for each dimension (genre, artist, album, customer country,
+invoice year/quarter/month) next to the line's quantity, revenue in cents,
+invoice, customer and day. A query is a boolean mask per filter and one
+``np.unique``/``np.bincount`` pass per measure, so any combination of
+dimensions is answered in memory instead of by a handwritten aggregate
+query. NumPy is optional; without it ``CubeError`` is raised.
+
+Each process loads the cube on first use. Afterwards, at most every
+``ANALYTICS_CUBE_REFRESH_SECONDS``, it checks database state: updates and
+deletes of invoices, lines, customers or the catalog bump the cube's
+``CacheVersion`` row when they commit, and a changed version reloads
+the whole cube. Otherwise lines with a higher id than the last one loaded
+are appended, and the lines up to that id are counted; a line that
+committed late with a lower id (ids are not assigned in commit order on
+PostgreSQL) makes the count exceed the cube's size and also reloads it.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from .cache import bump_versions, get_version
+from .models import InvoiceLine
+from .rollups import invoice_day
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# CacheVersion row counting the writes that make every process reload its cube
+REWRITES_VERSION = 'analytics.salescube'
+LOAD_CHUNK_SIZE = 5000
+
+# Dimension -> InvoiceLine lookup its labels come from
+DIMENSIONS = {
+    'genre': 'track__genre__name',
+    'artist': 'track__album__artist__name',
+    'album': 'track__album__title',
+    'country': 'invoice__customer__country',
+    'year': None,
+    'quarter': None,
+    'month': None,
+}
+MEASURES = ('revenue', 'units', 'orders', 'customers', 'average_order_value')
+LOOKUPS = ('pk', 'invoice_id', 'invoice__customer_id', 'invoice__invoice_date', 'quantity', 'unit_price',
+           *(lookup for lookup in DIMENSIONS.values() if lookup))
+
+
+class CubeError(ValueError):
+    """A cube query that is invalid or cannot run here"""
+
+
+def record_rewrite(*models):
+    """
+    Make every process reload its cube at its next refresh (once the
+    caller's transaction commits), invalidating the cached responses that
+    depend on ``models`` in the same query
+    """
+    bump_versions(REWRITES_VERSION, *(model._meta.label_lower for model in models))
+
+
+def _rewrites():
+    return get_version(REWRITES_VERSION)
+
+
+def _time_labels(day):
+    return {
+        'year': str(day.year),
+        'quarter': f'{day.year}-Q{(day.month - 1) // 3 + 1}',
+        'month': f'{day.year}-{day.month:02d}',
+    }
+
+
+class Dictionary:
+    """Append-only mapping between dimension labels and integer codes"""
+    def __init__(self):
+        self.labels = []
+        self.codes = {}
+
+    def encode(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+class SalesCube:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = None
+        self.dictionaries = {}
+        self.watermark = 0
+        self.rewrites = None
+        self.checked_at = 0
+
+    @property
+    def built(self):
+        return self.columns is not None
+
+    @property
+    def size(self):
+        return len(self.columns['quantity']) if self.built else 0
+
+    def reset(self):
+        with self.lock:
+            self.columns = None
+
+    def _load(self, dictionaries, after=0):
+        """Column arrays for the lines with an id above ``after``"""
+        names = ('line', 'invoice', 'customer', 'day', 'quantity', 'cents', *DIMENSIONS)
+        values = {name: [] for name in names}
+        rows = InvoiceLine.objects.filter(pk__gt=after).order_by('pk').values_list(*LOOKUPS)
+        for line, invoice, customer, invoiced_at, quantity, unit_price, *labels in rows.iterator(
+            chunk_size=LOAD_CHUNK_SIZE
+        ):
+            day = invoice_day(invoiced_at)
+            values['line'].append(line)
+            values['invoice'].append(invoice)
+            values['customer'].append(customer)
+            values['day'].append(day.toordinal())
+            values['quantity'].append(quantity)
+            values['cents'].append(int(unit_price * 100) * quantity)
+            labels = dict(zip((name for name, lookup in DIMENSIONS.items() if lookup), labels), **_time_labels(day))
+            for name in DIMENSIONS:
+                values[name].append(dictionaries[name].encode(labels[name]))
+        columns = {name: np.array(values[name], dtype=np.int64) for name in ('line', 'invoice', 'customer', 'cents')}
+        columns.update({name: np.array(values[name], dtype=np.int32) for name in ('day', 'quantity', *DIMENSIONS)})
+        return columns
+
+    def build(self):
+        if np is None:
+            raise CubeError('The analytics cube needs numpy installed')
+        rewrites = _rewrites()
+        dictionaries = {name: Dictionary() for name in DIMENSIONS}
+        columns = self._load(dictionaries)
+        self.columns, self.dictionaries = columns, dictionaries
+        self.watermark = int(columns['line'][-1]) if len(columns['line']) else 0
+        self.rewrites, self.checked_at = rewrites, time.monotonic()
+
+    def _append(self):
+        added = self._load(self.dictionaries, after=self.watermark)
+        if len(added['line']):
+            # New arrays, so queries already holding the old ones are unaffected
+            self.columns = {name: np.concatenate([column, added[name]]) for name, column in self.columns.items()}
+            self.watermark = int(added['line'][-1])
+
+    def ensure_fresh(self):
+        with self.lock:
+            if not self.built:
+                self.build()
+                return
+            if time.monotonic() - self.checked_at < settings.ANALYTICS_CUBE_REFRESH_SECONDS:
+                return
+            self.checked_at = time.monotonic()
+            if _rewrites() != self.rewrites:
+                self.build()
+                return
+            self._append()
+            if InvoiceLine.objects.filter(pk__lte=self.watermark).count() != self.size:
+                self.build()
+
+    def query(self, group_by=(), measures=('revenue',), filters=None, start_date=None, end_date=None,
+              order_by=None, limit=100):
+        """
+        Aggregate ``measures`` over the lines matching ``filters`` (dimension
+        -> allowed labels) and the date range, one row per ``group_by``
+        combination, sorted by ``order_by`` (a measure) descending.
+        Returns ``{'rows': [...], 'total_groups': n}``.
+        """
+        unknown = [name for name in [*group_by, *(filters or {})] if name not in DIMENSIONS]
+        if unknown:
+            raise CubeError(f"Unknown dimension: {unknown[0]} (choose from {', '.join(DIMENSIONS)})")
+        if not measures:
+            raise CubeError('At least one measure is required')
+        unknown = [name for name in [*measures, *([order_by] if order_by else [])] if name not in MEASURES]
+        if unknown:
+            raise CubeError(f"Unknown measure: {unknown[0]} (choose from {', '.join(MEASURES)})")
+        if np is None:
+            raise CubeError('The analytics cube needs numpy installed')
+        self.ensure_fresh()
+        with self.lock:
+            columns, dictionaries = self.columns, self.dictionaries
+
+        mask = np.ones(len(columns['line']), dtype=bool)
+        for name, labels in (filters or {}).items():
+            codes = [dictionaries[name].codes[label] for label in labels if label in dictionaries[name].codes]
+            mask &= np.isin(columns[name], codes)
+        if start_date:
+            mask &= columns['day'] >= start_date.toordinal()
+        if end_date:
+            mask &= columns['day'] <= end_date.toordinal()
+        if not mask.any():
+            return {'rows': [], 'total_groups': 0}
+
+        if group_by:
+            keys = np.stack([columns[name][mask] for name in group_by], axis=1)
+        else:
+            keys = np.zeros((int(mask.sum()), 1), dtype=np.int32)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        totals = self._measures(measures, columns, mask, inverse, len(groups))
+
+        order_by = order_by or measures[0]
+        ranking = totals.get(order_by)
+        if ranking is None:
+            ranking = self._measures([order_by], columns, mask, inverse, len(groups))[order_by]
+        order = np.argsort(-ranking, kind='stable')[:limit]
+        rows = []
+        for index in order:
+            row = {name: dictionaries[name].labels[groups[index, position]] for position, name in enumerate(group_by)}
+            for name in measures:
+                value = totals[name][index]
+                row[name] = (Decimal(int(round(value))) / 100 if name in ('revenue', 'average_order_value')
+                             else int(value))
+            rows.append(row)
+        return {'rows': rows, 'total_groups': len(groups)}
+
+    @staticmethod
+    def _distinct(column, mask, inverse, size):
+        pairs = np.unique(np.stack([inverse, column[mask]], axis=1), axis=0)
+        return np.bincount(pairs[:, 0], minlength=size)
+
+    def _measures(self, measures, columns, mask, inverse, size):
+        totals = {}
+        if {'revenue', 'average_order_value'} & set(measures):
+            totals['revenue'] = np.bincount(inverse, weights=columns['cents'][mask], minlength=size)
+        if {'orders', 'average_order_value'} & set(measures):
+            totals['orders'] = self._distinct(columns['invoice'], mask, inverse, size)
+        if 'units' in measures:
+            totals['units'] = np.bincount(inverse, weights=columns['quantity'][mask], minlength=size)
+        if 'customers' in measures:
+            totals['customers'] = self._distinct(columns['customer'], mask, inverse, size)
+        if 'average_order_value' in measures:
+            totals['average_order_value'] = totals['revenue'] / np.maximum(totals['orders'], 1)
+        return totals
+
+
+sales_cube = SalesCube()
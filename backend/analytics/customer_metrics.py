@@ -0,0 +1,186 @@
+"""
+Per-customer lifetime value and RFM segmentation table.
+
+``CustomerMetrics`` holds one row per purchasing customer with lifetime
+spend, order count and first/last purchase, plus recency, frequency and
+monetary quintile scores (1-5) and the segment they map to. Customer
+rankings and segment reports then read this table alone instead of
+summing every invoice per request.
+
+Inserted invoices increment their customer's row; edits and deletes
+recompute it. Either way only that customer is rescored, against the
+quintile thresholds (``CustomerScoreThreshold``) saved by the last full
+ranking, so a write never scans the table. ``rescore_customer_metrics``
+re-ranks the whole table and refreshes the thresholds periodically (from
+``run_report_scheduler``, or the ``rebuild_customer_metrics`` command).
+Rescores and rebuilds invalidate the cached responses that depend on
+CustomerMetrics.
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .cache import invalidate_model
+from .models import Customer, CustomerMetrics, CustomerScoreThreshold, Invoice
+
+# Score fields and the metric each ranks customers by (higher is better)
+SCORED_FIELDS = {
+    'recency_score': 'last_purchase',
+    'frequency_score': 'order_count',
+    'monetary_score': 'lifetime_value',
+}
+
+# (segment, recency range, frequency range); the first match wins and
+# together they cover every recency/frequency combination
+SEGMENT_RULES = [
+    ('champions', (4, 5), (4, 5)),
+    ('loyal', (3, 5), (3, 5)),
+    ('new', (4, 5), (1, 1)),
+    ('promising', (3, 5), (1, 2)),
+    ('at_risk', (1, 2), (3, 5)),
+    ('about_to_sleep', (2, 2), (1, 2)),
+    ('hibernating', (1, 1), (1, 2)),
+]
+SEGMENTS = [name for name, _, _ in SEGMENT_RULES]
+
+
+def segment_for(recency, frequency):
+    for name, (r_low, r_high), (f_low, f_high) in SEGMENT_RULES:
+        if r_low <= recency <= r_high and f_low <= frequency <= f_high:
+            return name
+    return 'hibernating'
+
+
+def quintile(lower, total):
+    """Score 1-5 for a value with ``lower`` of ``total`` customers strictly below it"""
+    return 1 + 5 * lower // total if total else 1
+
+
+def score_customer(customer_id):
+    """
+    Rescore one customer's row against the saved thresholds. Until the first
+    full ranking there are none and the row keeps the lowest scores.
+    """
+    metrics = CustomerMetrics.objects.filter(customer_id=customer_id).first()
+    if metrics is None:
+        return
+    thresholds = list(CustomerScoreThreshold.objects.all())
+    for score, field in SCORED_FIELDS.items():
+        value = getattr(metrics, field)
+        setattr(metrics, score, 1 + sum(
+            1 for threshold in thresholds
+            if getattr(threshold, field) is None or (value is not None and value > getattr(threshold, field))
+        ))
+    metrics.segment = segment_for(metrics.recency_score, metrics.frequency_score)
+    metrics.save(update_fields=[*SCORED_FIELDS, 'segment'])
+
+
+def _increment(customer_id, total, purchased_at):
+    return CustomerMetrics.objects.filter(customer_id=customer_id).update(
+        lifetime_value=F('lifetime_value') + total,
+        order_count=F('order_count') + 1,
+        first_purchase=Least(Coalesce('first_purchase', Value(purchased_at)), Value(purchased_at)),
+        last_purchase=Greatest(Coalesce('last_purchase', Value(purchased_at)), Value(purchased_at))
+    )
+
+
+def record_invoice(invoice):
+    """Add a newly inserted invoice to its customer's metrics row"""
+    if not _increment(invoice.customer_id, invoice.total, invoice.invoice_date):
+        country = Customer.objects.filter(pk=invoice.customer_id).values_list('country', flat=True).first()
+        # ignore_conflicts lets a concurrent writer win the insert; both then increment
+        CustomerMetrics.objects.bulk_create(
+            [CustomerMetrics(customer_id=invoice.customer_id, country=country)], ignore_conflicts=True
+        )
+        _increment(invoice.customer_id, invoice.total, invoice.invoice_date)
+    score_customer(invoice.customer_id)
+
+
+def _totals():
+    return {
+        'lifetime_value': Sum('total'),
+        'order_count': Count('pk'),
+        'first_purchase': Min('invoice_date'),
+        'last_purchase': Max('invoice_date'),
+    }
+
+
+def refresh_customer(customer_id):
+    """Recompute a customer's metrics row from their invoices (after updates/deletes)"""
+    totals = Invoice.objects.filter(customer_id=customer_id).aggregate(**_totals())
+    if not totals['order_count']:
+        CustomerMetrics.objects.filter(customer_id=customer_id).delete()
+        return
+    country = Customer.objects.filter(pk=customer_id).values_list('country', flat=True).first()
+    CustomerMetrics.objects.update_or_create(customer_id=customer_id, defaults={**totals, 'country': country})
+    score_customer(customer_id)
+
+
+def sync_customer_country(customer):
+    """Carry a customer's country change over to their metrics row"""
+    CustomerMetrics.objects.filter(customer_id=customer.pk).exclude(
+        country=customer.country
+    ).update(country=customer.country)
+
+
+def assign_scores(rows):
+    """Set the quintile scores and segment on every row, ranked against each other"""
+    for score, field in SCORED_FIELDS.items():
+        ranked = sorted(getattr(row, field) for row in rows)
+        for row in rows:
+            setattr(row, score, quintile(bisect_left(ranked, getattr(row, field)), len(rows)))
+    for row in rows:
+        row.segment = segment_for(row.recency_score, row.frequency_score)
+    return rows
+
+
+def save_thresholds(rows):
+    """
+    Replace the saved thresholds with those of ``rows``: a value scores at
+    least ``score`` when more than ``lower`` of the ranked values lie below
+    it, i.e. when it exceeds ``ranked[lower - 1]``
+    """
+    thresholds = []
+    if rows:
+        ranked = {field: sorted(getattr(row, field) for row in rows) for field in SCORED_FIELDS.values()}
+        for score in range(2, 6):
+            # Smallest count below a value that quintile() maps to ``score``
+            lower = -(-(score - 1) * len(rows) // 5)
+            thresholds.append(CustomerScoreThreshold(score=score, **{
+                field: values[lower - 1] if lower else None for field, values in ranked.items()
+            }))
+    CustomerScoreThreshold.objects.all().delete()
+    CustomerScoreThreshold.objects.bulk_create(thresholds)
+
+
+@transaction.atomic
+def rescore_customer_metrics():
+    """Re-rank every row against the current table. Returns the number of rows changed."""
+    rows = list(CustomerMetrics.objects.select_for_update())
+    before = {row.pk: (row.recency_score, row.frequency_score, row.monetary_score, row.segment) for row in rows}
+    changed = [
+        row for row in assign_scores(rows)
+        if before[row.pk] != (row.recency_score, row.frequency_score, row.monetary_score, row.segment)
+    ]
+    CustomerMetrics.objects.bulk_update(changed, [*SCORED_FIELDS, 'segment'], batch_size=1000)
+    save_thresholds(rows)
+    if changed:
+        invalidate_model(CustomerMetrics)
+    return len(changed)
+
+
+@transaction.atomic
+def rebuild_customer_metrics():
+    """Rebuild the whole table from invoices. Returns the row count."""
+    CustomerMetrics.objects.all().delete()
+    rows = Invoice.objects.values('customer_id').annotate(
+        country=F('customer__country'), **_totals()
+    ).order_by()
+    created = CustomerMetrics.objects.bulk_create(
+        assign_scores([CustomerMetrics(**row) for row in rows]), batch_size=1000
+    )
+    save_thresholds(created)
+    invalidate_model(CustomerMetrics)
+    return len(created)
@@ -0,0 +1,198 @@
+"""
+Streaming file exports.
+
+``export_response`` turns a queryset into a ``StreamingHttpResponse`` that
+reads rows with ``values_list().iterator()`` (a server-side cursor on
+PostgreSQL) and encodes them ``EXPORT_CHUNK_SIZE`` rows at a time, so an
+export's memory use does not grow with its row count. CSV and NDJSON are
+always available; Parquet needs the optional ``pyarrow`` package.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """An export format that is unknown or unavailable here"""
+
+
+def export_formats():
+    """File formats this installation can export"""
+    return [name for name in CONTENT_TYPES if name != 'parquet' or pyarrow is not None]
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv_value(value):
+    return json.dumps(value, cls=DjangoJSONEncoder) if isinstance(value, (dict, list)) else value
+
+
+def _stream_csv(header, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for chunk in chunks:
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _stream_ndjson(header, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n' for row in chunk)
+
+
+def resolve_field(model, lookup):
+    """The model field a ``values_list`` lookup such as ``track__album__title`` reads"""
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    field = model._meta.get_field(name)
+    if field.is_relation:
+        field = field.target_field
+    return field
+
+
+def arrow_type(field):
+    """The Arrow type used for a model field's values"""
+    if isinstance(field, (models.AutoField, models.BigAutoField, models.IntegerField)):
+        return pyarrow.int64()
+    if isinstance(field, models.DecimalField):
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+def arrow_schema(model, header, lookups):
+    fields = []
+    for name, lookup in zip(header, lookups):
+        try:
+            field_type = arrow_type(resolve_field(model, lookup))
+        except FieldDoesNotExist:
+            field_type = pyarrow.string()
+        fields.append(pyarrow.field(name, field_type))
+    return pyarrow.schema(fields)
+
+
+def arrow_batch(schema, rows):
+    """A RecordBatch of ``rows`` (tuples in schema order), JSON-encoding non-scalar strings"""
+    columns = list(zip(*rows)) or [[] for _ in schema]
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pyarrow.types.is_string(field.type):
+            values = [
+                value if value is None or isinstance(value, str) else json.dumps(value, cls=DjangoJSONEncoder)
+                for value in values
+            ]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever has been written since the last ``drain``"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return data
+
+
+def _stream_parquet(schema, chunks):
+    sink = _ChunkSink()
+    # One row group per chunk; each is flushed to the client as soon as it is written
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(arrow_batch(schema, chunk))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_response(queryset, columns, file_format, filename):
+    """
+    Stream ``queryset`` as a ``file_format`` attachment named ``filename``.
+
+    ``columns`` maps output column names to ``values_list`` lookups.
+    """
+    if file_format not in CONTENT_TYPES:
+        raise ExportError(f'Unsupported format: {file_format}. Choose from {", ".join(export_formats())}')
+    if file_format not in export_formats():
+        raise ExportError(f'{file_format} export requires the pyarrow package')
+
+    header, lookups = list(columns), list(columns.values())
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    chunks = chunked(queryset.values_list(*lookups).iterator(chunk_size=chunk_size), chunk_size)
+    if file_format == 'csv':
+        content = _stream_csv(header, chunks)
+    elif file_format == 'ndjson':
+        content = _stream_ndjson(header, chunks)
+    else:
+        content = _stream_parquet(arrow_schema(queryset.model, header, lookups), chunks)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{file_format}"'
+    return response
+
+
+class ExportMixin:
+    """Viewset actions that stream a queryset as ``?file_format=csv|ndjson|parquet``"""
+
+    def export_queryset(self, queryset, columns, filename):
+        file_format = self.request.query_params.get('file_format', 'csv').lower()
+        try:
+            return export_response(queryset, columns, file_format, filename)
+        except ExportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
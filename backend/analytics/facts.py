@@ -0,0 +1,83 @@
+"""
+Per-track sales fact table.
+
+``TrackSales`` carries one row per sold track with its album, artist and
+genre ids copied along, so the catalog rankings are single-table
+``ORDER BY ... LIMIT`` or small GROUP BY queries instead of joins through
+every invoice line.
+"""
+from django.db import transaction
+from django.db.models import F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import InvoiceLine, Track, TrackSales
+
+
+def _dimensions(track_id):
+    return Track.objects.filter(pk=track_id).values(
+        'album_id', 'genre_id', artist_id=F('album__artist_id')
+    ).first()
+
+
+def _increment(track_id, quantity, revenue, sold_at):
+    return TrackSales.objects.filter(track_id=track_id).update(
+        quantity_sold=F('quantity_sold') + quantity,
+        revenue=F('revenue') + revenue,
+        last_sale_date=Greatest(Coalesce('last_sale_date', Value(sold_at)), Value(sold_at))
+    )
+
+
+def record_line(line):
+    """Add a newly inserted invoice line to its track's sales row"""
+    revenue = line.total_price
+    sold_at = line.invoice.invoice_date
+    if _increment(line.track_id, line.quantity, revenue, sold_at):
+        return
+    dimensions = _dimensions(line.track_id)
+    if dimensions is None:
+        return
+    # ignore_conflicts lets a concurrent writer win the insert; both then increment
+    TrackSales.objects.bulk_create([TrackSales(track_id=line.track_id, **dimensions)], ignore_conflicts=True)
+    _increment(line.track_id, line.quantity, revenue, sold_at)
+
+
+def refresh_track(track_id):
+    """Recompute a track's sales row from its invoice lines (after updates/deletes)"""
+    totals = InvoiceLine.objects.filter(track_id=track_id).aggregate(
+        quantity_sold=Sum('quantity'),
+        revenue=Sum(InvoiceLine.revenue_expression()),
+        last_sale_date=Max('invoice__invoice_date')
+    )
+    dimensions = _dimensions(track_id)
+    if not totals['quantity_sold'] or dimensions is None:
+        TrackSales.objects.filter(track_id=track_id).delete()
+        return
+    TrackSales.objects.update_or_create(track_id=track_id, defaults={**totals, **dimensions})
+
+
+def refresh_invoice_tracks(invoice_id):
+    """Recompute the sales rows of every track on an invoice (after its date changes)"""
+    track_ids = InvoiceLine.objects.filter(invoice_id=invoice_id).values_list('track_id', flat=True).distinct()
+    for track_id in track_ids:
+        refresh_track(track_id)
+
+
+def sync_track_dimensions(track):
+    """Carry a track's album/artist/genre change over to its sales row"""
+    TrackSales.objects.filter(track_id=track.pk).update(**_dimensions(track.pk))
+
+
+@transaction.atomic
+def rebuild_track_sales():
+    """Rebuild the whole fact table from invoice lines. Returns the row count."""
+    TrackSales.objects.all().delete()
+    rows = InvoiceLine.objects.values('track_id').annotate(
+        album_id=F('track__album_id'),
+        artist_id=F('track__album__artist_id'),
+        genre_id=F('track__genre_id'),
+        quantity_sold=Sum('quantity'),
+        revenue=Sum(InvoiceLine.revenue_expression()),
+        last_sale_date=Max('invoice__invoice_date')
+    ).order_by()
+    created = TrackSales.objects.bulk_create((TrackSales(**row) for row in rows), batch_size=1000)
+    return len(created)
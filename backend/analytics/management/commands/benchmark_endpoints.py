@@ -0,0 +1,208 @@
+import json
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from analytics.cache import get_cache
+from analytics.models import Customer, Genre
+from analytics.urls import router as analytics_router, urlpatterns as analytics_urlpatterns
+from audit.urls import router as audit_router
+from guest.urls import urlpatterns as guest_urlpatterns
+
+DEFAULT_SCALES = '10000,100000,1000000'
+# Regression thresholds for --compare: relative latency growth and absolute query growth
+LATENCY_TOLERANCE = 1.25
+QUERY_TOLERANCE = 0
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def discover_routes():
+    """GET routes of the analytics, guest and audit URL confs as (name, url, params)"""
+    routes = []
+    for router in (analytics_router, audit_router):
+        for prefix, viewset, basename in router.registry:
+            if hasattr(viewset, 'list'):
+                routes.append((f'{basename}-list', reverse(f'{basename}-list'), {}))
+            if hasattr(viewset, 'retrieve'):
+                pk = viewset.queryset.model.objects.values_list('pk', flat=True).first() \
+                    if viewset.queryset is not None else None
+                if pk is not None:
+                    routes.append((f'{basename}-detail', reverse(f'{basename}-detail', args=[pk]), {}))
+            for extra in viewset.get_extra_actions():
+                if not extra.detail and 'get' in extra.mapping:
+                    name = f'{basename}-{extra.url_name}'
+                    routes.append((name, reverse(name), {}))
+    for pattern in (*analytics_urlpatterns, *guest_urlpatterns):
+        # Skip the router include; its routes are listed above
+        if getattr(pattern, 'name', None) and hasattr(pattern.callback.view_class, 'get'):
+            routes.append((pattern.name, reverse(pattern.name), {}))
+
+    # Actions that require query parameters
+    required = {
+        'track-by-genre': {'genre_id': Genre.objects.values_list('pk', flat=True).first()},
+        'customer-by-country': {'country': Customer.objects.values_list('country', flat=True).first()},
+        'analytics-search-analytics': {'q': 'Load'},
+        'autocomplete': {'q': 'Load Tr'},
+    }
+    return [(name, url, required.get(name, params)) for name, url, params in routes]
+
+
+def benchmark_client():
+    """
+    A client signed in with a JWT access token, as the frontend is, so
+    requests go through real authentication and public_cache treats them as
+    authenticated (private responses, no shared cache)
+    """
+    user = get_user_model().objects.get(username='benchmark')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def fetch(client, url, params):
+    """GET ``url`` and read the whole body, so streamed responses are measured in full"""
+    response = client.get(url, params)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every analytics, guest and audit GET endpoint against generated '
+        'datasets of several sizes and writes a JSON report that can be diffed between commits'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES,
+                            help='Comma-separated invoice-line counts to benchmark at')
+        parser.add_argument('--requests', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the analytics response cache between requests (default: measure cold)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='benchmark_report.json', help='Where to write the JSON report')
+        parser.add_argument('--compare', help='Previous JSON report to check for regressions')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(value) for value in options['scales'].split(',') if value]
+        except ValueError:
+            raise CommandError('--scales must be a comma-separated list of integers')
+        if not scales or options['requests'] < 1:
+            raise CommandError('Need at least one scale and one request per endpoint')
+
+        # Benchmarks run against a throwaway test database, never the configured one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = {
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'warm_cache': options['warm_cache'],
+                'scales': {},
+            }
+            for lines in scales:
+                self.stdout.write(f'Seeding ~{lines} invoice lines...')
+                self.seed(lines, options['seed'])
+                report['scales'][str(lines)] = self.run_scale(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}"))
+
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def seed(self, lines, seed):
+        call_command('flush', interactive=False, verbosity=0)
+        call_command(
+            'generate_load_dataset',
+            invoices=max(1, lines // 5),
+            customers=max(10, lines // 100),
+            tracks=max(100, lines // 20),
+            seed=seed,
+            stdout=StringIO()
+        )
+        get_user_model().objects.create_superuser(
+            email='benchmark@example.com', username='benchmark', password='benchmark'
+        )
+
+    def run_scale(self, options):
+        client = benchmark_client()
+        cache = get_cache()
+        results = {}
+
+        for name, url, params in discover_routes():
+            timings = []
+            for _ in range(options['requests']):
+                if not options['warm_cache']:
+                    cache.clear()
+                started = time.perf_counter()
+                response = fetch(client, url, params)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            if not options['warm_cache']:
+                cache.clear()
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                fetch(client, url, params)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            timings.sort()
+            results[name] = {
+                'url': url,
+                'status': response.status_code,
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'mean_ms': round(statistics.mean(timings), 3),
+                'queries': len(queries),
+                'sql_ms': round(sum(float(query['time']) for query in queries.captured_queries) * 1000, 3),
+                'peak_memory_kib': round(peak / 1024, 1),
+            }
+            self.stdout.write(
+                f"  {name:<40} p50 {results[name]['p50_ms']:>9.2f}ms  p95 {results[name]['p95_ms']:>9.2f}ms  "
+                f"{results[name]['queries']:>4} queries  {results[name]['peak_memory_kib']:>9.1f} KiB"
+            )
+        return results
+
+    def compare(self, path, report):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for scale, routes in report['scales'].items():
+            for name, current in routes.items():
+                previous = baseline.get('scales', {}).get(scale, {}).get(name)
+                if not previous:
+                    continue
+                if current['p95_ms'] > previous['p95_ms'] * LATENCY_TOLERANCE:
+                    regressions.append(f"{scale} {name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+                if current['queries'] > previous['queries'] + QUERY_TOLERANCE:
+                    regressions.append(f"{scale} {name}: queries {previous['queries']} -> {current['queries']}")
+        for line in regressions:
+            self.stdout.write(self.style.WARNING(line))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions against {path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
@@ -0,0 +1,115 @@
+import json
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from analytics.models import Album, Artist, Customer, Invoice, InvoiceLine, Track
+from audit.models import AuditLog
+
+INDEXED_MODELS = (Artist, Album, Track, Customer, Invoice, InvoiceLine, AuditLog)
+
+
+def benchmark_queries():
+    """Representative query shapes from the analytics, guest and audit views"""
+    last_year = timezone.now() - timedelta(days=365)
+    return {
+        'invoice_date_range_totals': Invoice.objects.filter(
+            invoice_date__gte=last_year
+        ).order_by().values_list('invoice_date', 'total'),
+        'invoices_by_country': Invoice.objects.filter(billing_country='USA').order_by('-invoice_date')[:20],
+        'customer_spend': Invoice.objects.order_by().values('customer_id').annotate(total_spent=Sum('total')),
+        'line_revenue_by_invoice': InvoiceLine.objects.filter(
+            invoice_id__lte=1000
+        ).order_by().values('invoice_id').annotate(revenue=Sum(InvoiceLine.revenue_expression())),
+        'line_revenue_by_track': InvoiceLine.objects.order_by().values('track_id').annotate(
+            total_quantity=Sum('quantity'),
+            revenue=Sum(InvoiceLine.revenue_expression())
+        ),
+        'customers_by_country': Customer.objects.order_by().values('country').annotate(customers=Count('customer_id')),
+        'track_page_by_name': Track.objects.order_by('name', 'track_id')[:20],
+        'tracks_by_genre': Track.objects.filter(genre_id=1).order_by('name')[:20],
+        'album_page_by_title': Album.objects.order_by('title')[:20],
+        'artist_page_by_name': Artist.objects.order_by('name')[:20],
+        'audit_log_page': AuditLog.objects.order_by('-timestamp', 'id')[:20],
+        'audit_log_by_action': AuditLog.objects.filter(action='LOGIN').order_by('-timestamp')[:20],
+    }
+
+
+def is_test_database():
+    # The test runner points the connection at the database it created
+    return connection.settings_dict['NAME'] == connection.creation._get_test_db_name()
+
+
+class Command(BaseCommand):
+    help = (
+        'Times representative analytics queries and shows their EXPLAIN plans with and without the index plan. '
+        'Only runs with DEBUG on or against a test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the median is reported')
+        parser.add_argument('--explain', action='store_true', help='Print the EXPLAIN plan for every query')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def measure(self, repeat):
+        results = {}
+        for label, queryset in benchmark_queries().items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = {
+                'median_ms': round(statistics.median(timings), 3),
+                'plan': queryset.explain(),
+            }
+        return results
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        if not settings.DEBUG and not is_test_database():
+            # Dropping an index locks its table (ACCESS EXCLUSIVE on PostgreSQL) until the rollback
+            raise CommandError(
+                'benchmark_indexes drops the live indexes; run it with DEBUG on or against a copy of the database'
+            )
+
+        # Drop the plan's indexes inside a transaction that is always rolled back
+        with transaction.atomic():
+            editor = connection.schema_editor()
+            with connection.cursor() as cursor:
+                for model in INDEXED_MODELS:
+                    for index in model._meta.indexes:
+                        cursor.execute(str(index.remove_sql(model, editor)))
+            without_indexes = self.measure(repeat)
+            transaction.set_rollback(True)
+        with_indexes = self.measure(repeat)
+
+        report = {}
+        self.stdout.write(f"{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for label, after in with_indexes.items():
+            before = without_indexes[label]
+            speedup = before['median_ms'] / after['median_ms'] if after['median_ms'] else 0
+            report[label] = {
+                'before_ms': before['median_ms'],
+                'after_ms': after['median_ms'],
+                'before_plan': before['plan'],
+                'after_plan': after['plan'],
+            }
+            self.stdout.write(f"{label:<28} {before['median_ms']:>10.3f} {after['median_ms']:>10.3f} {speedup:>7.1f}x")
+            if options['explain']:
+                for name, plan in (('before', before['plan']), ('after', after['plan'])):
+                    self.stdout.write(f"  {name + ':':<8}" + plan.replace('\n', '\n' + ' ' * 10))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Benchmarked {len(report)} queries over {Invoice.objects.count()} invoices '
+            f'and {InvoiceLine.objects.count()} invoice lines.'
+        ))
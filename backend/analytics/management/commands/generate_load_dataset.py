@@ -0,0 +1,232 @@
+import calendar
+import random
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from analytics.cache import TRACKED_MODELS
+from analytics.cube import record_rewrite
+from analytics.customer_metrics import rebuild_customer_metrics
+from analytics.facts import rebuild_track_sales
+from analytics.models import Album, Artist, Customer, Genre, Invoice, InvoiceLine, Track
+from analytics.rollups import rebuild_rollups
+from analytics.search import rebuild_search_index
+
+GENRES = ['Rock', 'Pop', 'Jazz', 'Metal', 'Hip-Hop', 'Classical', 'Blues', 'Reggae', 'Country', 'Electronic']
+COUNTRIES = [
+    ('USA', 30), ('Canada', 10), ('Brazil', 8), ('France', 8), ('Germany', 8),
+    ('United Kingdom', 8), ('Norway', 3), ('Australia', 5), ('Japan', 6), ('India', 6),
+]
+FIRST_NAMES = ['Alex', 'Sam', 'Maria', 'Li', 'Fatima', 'Jonas', 'Aiko', 'Carlos', 'Emma', 'Noah']
+LAST_NAMES = ['Smith', 'Silva', 'Müller', 'Kim', 'Ali', 'Hansen', 'Sato', 'Garcia', 'Brown', 'Martin']
+# Cumulative relative sales volume per calendar month (holiday peak in Nov/Dec)
+MONTH_WEIGHTS = list(accumulate([0.8, 0.7, 0.8, 0.85, 0.9, 0.9, 0.95, 0.95, 0.9, 1.0, 1.25, 1.6]))
+PRICES = (Decimal('0.99'), Decimal('1.99'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic load-testing dataset with Zipfian track popularity and '
+        'seasonal invoice dates. The catalog and customers are bulk_created; invoices and invoice lines '
+        'are streamed in bounded-memory batches of raw multi-row INSERTs'
+    )
+
+    INVOICE_FIELDS = ('invoice_id', 'customer', 'invoice_date', 'billing_country', 'total')
+    LINE_FIELDS = ('invoice_line_id', 'invoice', 'track', 'unit_price', 'quantity')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--tracks', type=int, default=50000)
+        parser.add_argument('--invoices', type=int, default=100000)
+        parser.add_argument('--lines-per-invoice', type=int, default=5, help='Average invoice lines per invoice')
+        parser.add_argument('--years', type=int, default=5, help='Spread invoice dates over this many years')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for track popularity')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT batch')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible datasets')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild sales rollups, track sales facts, customer metrics and the search index afterwards')
+
+    def handle(self, *args, **options):
+        for name in ('customers', 'tracks', 'invoices', 'lines_per_invoice', 'years', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        track_ids, track_prices = self.create_catalog(options['tracks'])
+        customers = self.create_customers(options['customers'])
+        lines = self.create_invoices(options, track_ids, track_prices, customers)
+        self.reset_sequences()
+
+        if not options['skip_derived']:
+            self.stdout.write('Rebuilding sales rollups, track sales facts, customer metrics and the search index...')
+            rebuild_rollups()
+            rebuild_track_sales()
+            rebuild_customer_metrics()
+            rebuild_search_index()
+        record_rewrite(*TRACKED_MODELS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['invoices']} invoices with {lines} lines "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max(model._meta.pk.attname))['last'] or 0) + 1
+
+    def insert(self, model, objs):
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def create_catalog(self, track_count):
+        genres = [Genre.objects.get_or_create(name=name)[0].pk for name in GENRES]
+        artist_count = max(1, track_count // 100)
+        album_count = max(1, track_count // 10)
+
+        first_artist = self.next_id(Artist)
+        self.insert(Artist, [
+            Artist(artist_id=first_artist + i, name=f'Load Artist {first_artist + i}')
+            for i in range(artist_count)
+        ])
+        first_album = self.next_id(Album)
+        for start in range(0, album_count, self.batch_size):
+            self.insert(Album, [
+                Album(
+                    album_id=first_album + i,
+                    title=f'Load Album {first_album + i}',
+                    artist_id=first_artist + self.rng.randrange(artist_count)
+                )
+                for i in range(start, min(start + self.batch_size, album_count))
+            ])
+
+        first_track = self.next_id(Track)
+        prices = bytearray(track_count)
+        for start in range(0, track_count, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, track_count)):
+                # One track in ten is a video priced at 1.99
+                prices[i] = self.rng.random() < 0.1
+                batch.append(Track(
+                    track_id=first_track + i,
+                    name=f'Load Track {first_track + i}',
+                    album_id=first_album + i % album_count,
+                    genre_id=self.rng.choice(genres),
+                    media_type_id=2 if prices[i] else 1,
+                    composer=None,
+                    milliseconds=self.rng.randint(90000, 480000),
+                    bytes=self.rng.randint(2000000, 12000000),
+                    unit_price=PRICES[prices[i]]
+                ))
+            self.insert(Track, batch)
+        self.stdout.write(f'Created {artist_count} artists, {album_count} albums and {track_count} tracks.')
+        return range(first_track, first_track + track_count), prices
+
+    def create_customers(self, count):
+        first = self.next_id(Customer)
+        countries, weights = zip(*COUNTRIES)
+        cum_weights = list(accumulate(weights))
+        customers = []
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, count)):
+                country = countries[bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+                batch.append(Customer(
+                    customer_id=first + i,
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    email=f'load{first + i}@example.com',
+                    country=country,
+                    city=f'{country} City {self.rng.randint(1, 20)}'
+                ))
+            self.insert(Customer, batch)
+            customers.extend((customer.customer_id, customer.country) for customer in batch)
+        self.stdout.write(f'Created {count} customers.')
+        return customers
+
+    def random_invoice_date(self, now, years):
+        while True:
+            year = now.year - self.rng.randrange(years)
+            month = bisect(MONTH_WEIGHTS, self.rng.random() * MONTH_WEIGHTS[-1]) + 1
+            day = self.rng.randint(1, calendar.monthrange(year, month)[1])
+            value = timezone.make_aware(datetime(year, month, day)) + timedelta(seconds=self.rng.randrange(86400))
+            if value <= now:
+                return value
+
+    def create_invoices(self, options, track_ids, track_prices, customers):
+        track_count = len(track_ids)
+        # Zipfian popularity over a shuffled ranking so hits are spread across albums
+        popularity = list(range(track_count))
+        self.rng.shuffle(popularity)
+        cum_weights = list(accumulate(1 / (rank + 1) ** options['zipf'] for rank in range(track_count)))
+        total_weight = cum_weights[-1]
+        max_lines = 2 * options['lines_per_invoice'] - 1
+
+        ops = connection.ops
+        now = timezone.now()
+        first_invoice = self.next_id(Invoice)
+        next_line = self.next_id(InvoiceLine)
+        total_invoices = options['invoices']
+        line_count = 0
+
+        for start in range(0, total_invoices, self.batch_size):
+            invoices, lines = [], []
+            for i in range(start, min(start + self.batch_size, total_invoices)):
+                invoice_id = first_invoice + i
+                customer_id, country = self.rng.choice(customers)
+                total = Decimal('0')
+                for _ in range(self.rng.randint(1, max_lines)):
+                    index = popularity[min(bisect(cum_weights, self.rng.random() * total_weight), track_count - 1)]
+                    quantity = 1 if self.rng.random() < 0.9 else 2
+                    unit_price = PRICES[track_prices[index]]
+                    lines.append((next_line, invoice_id, track_ids[index], str(unit_price), quantity))
+                    next_line += 1
+                    total += unit_price * quantity
+                invoice_date = self.random_invoice_date(now, options['years'])
+                invoices.append((
+                    invoice_id, customer_id, ops.adapt_datetimefield_value(invoice_date), country, str(total)
+                ))
+
+            with transaction.atomic():
+                self.raw_insert(Invoice, self.INVOICE_FIELDS, invoices)
+                self.raw_insert(InvoiceLine, self.LINE_FIELDS, lines)
+            line_count += len(lines)
+            self.stdout.write(f'  {start + len(invoices)}/{total_invoices} invoices, {line_count} lines')
+        return line_count
+
+    def raw_insert(self, model, fields, rows):
+        """
+        Multi-row INSERT without model instances; at millions of rows the ORM's
+        per-object statement compilation dominates bulk_create's cost.
+        """
+        quote = connection.ops.quote_name
+        columns = [model._meta.get_field(name).column for name in fields]
+        row_sql = f"({', '.join(['%s'] * len(columns))})"
+        per_statement = connection.ops.bulk_batch_size(columns, rows) or len(rows)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), per_statement):
+                chunk = rows[start:start + per_statement]
+                cursor.execute(
+                    f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(map(quote, columns))}) "
+                    f"VALUES {', '.join([row_sql] * len(chunk))}",
+                    [value for row in chunk for value in row]
+                )
+
+    def reset_sequences(self):
+        # Explicit primary keys leave PostgreSQL sequences behind; SQLite needs nothing
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Artist, Album, Track, Customer, Invoice, InvoiceLine]
+        )
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
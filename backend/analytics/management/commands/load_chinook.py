@@ -0,0 +1,200 @@
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from analytics.cache import TRACKED_MODELS
+from analytics.cube import record_rewrite
+from analytics.customer_metrics import rebuild_customer_metrics
+from analytics.facts import rebuild_track_sales
+from analytics.models import Album, Artist, Customer, Genre, Invoice, InvoiceLine, SalesRollup, Track
+from analytics.rollups import rebuild_rollups
+from analytics.search import get_search_backend, rebuild_search_index
+
+# Chinook tables (in load order) and the models they fill; other tables are skipped
+TABLES = {
+    'genre': Genre,
+    'artist': Artist,
+    'album': Album,
+    'track': Track,
+    'customer': Customer,
+    'invoice': Invoice,
+    'invoice_line': InvoiceLine,
+}
+INSERT = re.compile(r'INSERT\s+INTO\s+"?(\w+)"?\s*\(([^)]*)\)\s*VALUES(.*)$', re.IGNORECASE | re.DOTALL)
+TOKEN = re.compile(
+    r"\s+|(?P<string>N?'(?:[^']|'')*')|(?P<null>NULL\b)|(?P<number>[-+]?\d+(?:\.\d+)?)|(?P<punct>[(),;])",
+    re.IGNORECASE
+)
+
+
+def iter_rows(lines):
+    """
+    Yield ``(table, columns, values)`` for every row of every INSERT ... VALUES
+    statement in ``lines``, reading one line at a time. Values are strings
+    (quotes removed) or None; only the current line is held in memory.
+    """
+    table = columns = row = None
+    pending = ''
+    for number, line in enumerate(lines, 1):
+        if table is None:
+            match = INSERT.match(line.strip())
+            if not match:
+                continue
+            table = match[1].lower()
+            columns = [column.strip().strip('"').lower() for column in match[2].split(',')]
+            line = match[3]
+        text = pending + line
+        if text.count("'") % 2:
+            # A string literal continues on the next line
+            pending = text
+            continue
+        pending = ''
+
+        position = 0
+        while position < len(text):
+            token = TOKEN.match(text, position)
+            if token is None:
+                raise CommandError(f'Unexpected SQL on line {number}: {text[position:position + 40]!r}')
+            position = token.end()
+            if token['string']:
+                row.append(token['string'].lstrip('Nn')[1:-1].replace("''", "'"))
+            elif token['null']:
+                row.append(None)
+            elif token['number']:
+                row.append(token['number'])
+            elif token['punct'] == '(':
+                row = []
+            elif token['punct'] == ')':
+                yield table, columns, row
+                row = None
+            elif token['punct'] == ';':
+                table = None
+                break
+
+
+def parse_timestamp(value):
+    """Chinook timestamps ('2021/1/1' or '2021-01-01 10:30:00') as aware UTC datetimes"""
+    date_part, _, time_part = value.replace('/', '-').partition(' ')
+    year, month, day = (int(part) for part in date_part.split('-'))
+    hour, minute, second = (int(float(part)) for part in (time_part or '0:0:0').split(':'))
+    return datetime(year, month, day, hour, minute, second, tzinfo=dt_timezone.utc)
+
+
+def row_builder(model, columns):
+    """A function turning a row of ``columns`` values into a ``model`` instance"""
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    converters = []
+    for index, column in enumerate(columns):
+        field = fields.get(column)
+        if field is None:
+            continue
+        convert = parse_timestamp if isinstance(field, models.DateTimeField) else field.to_python
+        converters.append((index, field.attname, convert))
+
+    def build(values):
+        return model(**{
+            name: None if values[index] is None else convert(values[index])
+            for index, name, convert in converters
+        })
+    return build
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads the Chinook sample database from Chinook_PostgreSql.sql, streaming its INSERT '
+        'statements into batched bulk_create calls in a single transaction'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(Path(settings.BASE_DIR) / 'Chinook_PostgreSql.sql'))
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk_create')
+        parser.add_argument('--flush', action='store_true', help='Delete existing catalog and sales data first')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild sales rollups, track sales facts, customer metrics and the search index afterwards')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'{path} does not exist')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            if options['flush']:
+                self.flush()
+            elif any(model.objects.exists() for model in TABLES.values()):
+                raise CommandError('The catalog already has data; use --flush to replace it')
+            counts = self.load(path)
+            self.reset_sequences()
+
+        if not options['skip_derived']:
+            self.stdout.write('Rebuilding sales rollups, track sales facts, customer metrics and the search index...')
+            rebuild_rollups()
+            rebuild_track_sales()
+            rebuild_customer_metrics()
+            rebuild_search_index()
+        record_rewrite(*TRACKED_MODELS)
+
+        summary = ', '.join(f'{count} {table}' for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Loaded {summary} in {time.perf_counter() - started:.1f}s.'))
+
+    def flush(self):
+        """
+        Delete the loaded tables and the rows that depend on them with one
+        DELETE each. Deleting through the ORM would fire every per-row signal
+        (facts, rollups, cache versions) for data that is rebuilt afterwards.
+        """
+        tables = list(TABLES.values())
+        dependents = [
+            relation.related_model for model in tables for relation in model._meta.related_objects
+            if relation.related_model not in tables
+        ]
+        for model in (SalesRollup, *dependents, *reversed(tables)):
+            model._base_manager.all()._raw_delete(model._base_manager.db)
+        get_search_backend().clear()
+
+    def load(self, path):
+        size = path.stat().st_size
+        counts = dict.fromkeys(TABLES, 0)
+        batch, model, builders = [], None, {}
+
+        def write():
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            counts[table_name] += len(batch)
+            batch.clear()
+            self.stdout.write(f'  {table_name}: {counts[table_name]} rows ({handle.tell() * 100 // size}%)')
+
+        with open(path, 'rb') as handle:
+            lines = (raw.decode('utf-8') for raw in handle)
+            for table, columns, values in iter_rows(lines):
+                if table not in TABLES:
+                    continue
+                if TABLES[table] is not model:
+                    if batch:
+                        write()
+                    model, table_name = TABLES[table], table
+                key = (table, tuple(columns))
+                if key not in builders:
+                    builders[key] = row_builder(model, columns)
+                batch.append(builders[key](values))
+                if len(batch) == self.batch_size:
+                    write()
+            if batch:
+                write()
+        return counts
+
+    def reset_sequences(self):
+        # Explicit primary keys leave PostgreSQL sequences behind; SQLite needs nothing
+        statements = connection.ops.sequence_reset_sql(no_style(), list(TABLES.values()))
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from analytics.customer_metrics import rebuild_customer_metrics, rescore_customer_metrics
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the customer lifetime value and RFM segmentation table from invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rescore-only', action='store_true',
+                            help='Keep the stored totals and only re-rank the quintile scores and segments')
+
+    def handle(self, *args, **options):
+        if options['rescore_only']:
+            rows = rescore_customer_metrics()
+            self.stdout.write(self.style.SUCCESS(f'Rescored {rows} customers.'))
+            return
+        rows = rebuild_customer_metrics()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt metrics for {rows} customers.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from analytics.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfills the daily, monthly and yearly sales rollups from raw invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Only rebuild from the year containing this date (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Only rebuild up to the year containing this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('start', 'end'):
+            value = options[name]
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+
+        days = rebuild_rollups(dates['start'], dates['end'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups for {days} days.'))
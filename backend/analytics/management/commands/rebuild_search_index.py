@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from analytics.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over artists, albums, tracks and customers'
+
+    def handle(self, *args, **options):
+        documents = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {documents} search documents.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from analytics.facts import rebuild_track_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-track sales fact table from invoice lines'
+
+    def handle(self, *args, **options):
+        rows = rebuild_track_sales()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales facts for {rows} tracks.'))
@@ -1,167 +1,222 @@
 import random
-from datetime import datetime, timedelta
-from django.core.management.base import BaseCommand
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils import timezone
+
+from analytics.cache import TRACKED_MODELS
+from analytics.cube import record_rewrite
+from analytics.customer_metrics import rebuild_customer_metrics
+from analytics.facts import rebuild_track_sales
 from analytics.models import Artist, Album, Genre, Track, Customer, Invoice, InvoiceLine
-from reports.models import ReportTemplate, GeneratedReport
+from analytics.rollups import rebuild_rollups
+from analytics.search import rebuild_search_index
 from audit.models import AuditLog
-from django.contrib.auth import get_user_model
+from reports.models import ReportTemplate, GeneratedReport
 
 User = get_user_model()
 
+GENRES = ['Rock', 'Pop', 'Jazz', 'Metal', 'Hip-Hop', 'Classical', 'Blues', 'Reggae', 'Country', 'Electronic']
+ARTISTS = [
+    'The Rolling Stones', 'Led Zeppelin', 'Miles Davis', 'Metallica', 'Eminem',
+    'Ludwig van Beethoven', 'B.B. King', 'Bob Marley', 'Johnny Cash', 'Daft Punk',
+    'Pink Floyd', 'Queen', 'The Beatles', 'AC/DC', 'Nirvana'
+]
+COUNTRIES = ['USA', 'Canada', 'Brazil', 'France', 'Germany', 'United Kingdom', 'Norway', 'Australia', 'Japan', 'India']
+CUSTOMERS = 30
+TEMPLATES = [
+    {'name': 'Revenue Summary', 'description': 'Financial overview with key metrics', 'category': 'Financial'},
+    {'name': 'Artist Performance', 'description': 'Detailed artist streaming and revenue stats', 'category': 'Analytics'},
+    {'name': 'Audience Demographics', 'description': 'Listener age, location, and platform breakdown', 'category': 'Analytics'},
+    {'name': 'Content Performance', 'description': 'Track and album performance metrics', 'category': 'Performance'},
+    {'name': 'Royalty Distribution', 'description': 'Breakdown of royalty payments', 'category': 'Financial'}
+]
+UNIT_PRICE = Decimal('0.99')
+
+
 class Command(BaseCommand):
-    help = 'Seeds the database with sample analytics data'
+    help = (
+        'Seeds the database with sample analytics data in batched bulk_create phases '
+        'inside a single transaction'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Multiply the number of artists (and so albums and tracks) and customers')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT batch')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild sales rollups, track sales facts, customer metrics and the search index afterwards')
 
     def handle(self, *args, **options):
+        if options['scale'] < 1:
+            raise CommandError('--scale must be at least 1')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.scale = options['scale']
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
         self.stdout.write('Seeding data...')
-        
-        # ... (rest of the handle remains same until # 7)
-
-        # 1. Create Genres
-        genres_names = ['Rock', 'Pop', 'Jazz', 'Metal', 'Hip-Hop', 'Classical', 'Blues', 'Reggae', 'Country', 'Electronic']
-        genre_objs = []
-        for name in genres_names:
-            genre, _ = Genre.objects.get_or_create(name=name)
-            genre_objs.append(genre)
-        self.stdout.write(f'Created {len(genre_objs)} genres.')
-
-        # 2. Create Artists
-        artist_names = [
-            'The Rolling Stones', 'Led Zeppelin', 'Miles Davis', 'Metallica', 'Eminem',
-            'Ludwig van Beethoven', 'B.B. King', 'Bob Marley', 'Johnny Cash', 'Daft Punk',
-            'Pink Floyd', 'Queen', 'The Beatles', 'AC/DC', 'Nirvana'
-        ]
-        artist_objs = []
-        for name in artist_names:
-            artist, _ = Artist.objects.get_or_create(name=name)
-            artist_objs.append(artist)
-        self.stdout.write(f'Created {len(artist_objs)} artists.')
-
-        # 3. Create Albums and Tracks
-        track_objs = []
-        if Album.objects.count() == 0:
-            for artist in artist_objs:
-                for i in range(random.randint(2, 4)):
-                    album = Album.objects.create(
-                        title=f'{artist.name} - Greatest Hits Vol {i+1}',
-                        artist=artist
-                    )
-                    for j in range(random.randint(8, 12)):
-                        track = Track.objects.create(
-                            name=f'{artist.name} - Track {i+1}-{j+1}',
-                            album=album,
-                            genre=random.choice(genre_objs),
-                            media_type_id=1,
-                            milliseconds=random.randint(180000, 420000),
-                            bytes=random.randint(3000000, 8000000),
-                            unit_price=0.99
-                        )
-                        track_objs.append(track)
-            self.stdout.write(f'Created {Album.objects.count()} albums and {len(track_objs)} tracks.')
-        else:
-            track_objs = list(Track.objects.all())
-
-        # 4. Create Customers
-        countries = ['USA', 'Canada', 'Brazil', 'France', 'Germany', 'United Kingdom', 'Norway', 'Australia', 'Japan', 'India']
-        customer_objs = []
-        if Customer.objects.count() == 0:
-            for i in range(30):
-                customer = Customer.objects.create(
-                    first_name=f'First{i+1}',
-                    last_name=f'Last{i+1}',
-                    email=f'customer{i+1}@example.com',
-                    country=random.choice(countries),
-                    city='Sample City',
-                    address='123 Sample St'
-                )
-                customer_objs.append(customer)
-            self.stdout.write(f'Created {len(customer_objs)} customers.')
-        else:
-            customer_objs = list(Customer.objects.all())
-
-        # 5. Create Invoices and InvoiceLines
-        if Invoice.objects.count() == 0:
-            for customer in customer_objs:
-                for i in range(random.randint(1, 5)):
-                    invoice_date = timezone.now() - timedelta(days=random.randint(0, 365*2))
-                    invoice = Invoice.objects.create(
-                        customer=customer,
-                        invoice_date=invoice_date,
-                        total=0,
-                        billing_country=customer.country
-                    )
-                    
-                    invoice_total = 0
-                    selected_tracks = random.sample(track_objs, random.randint(1, 10))
-                    for track in selected_tracks:
-                        quantity = random.randint(1, 2)
-                        unit_price = track.unit_price
-                        InvoiceLine.objects.create(
-                            invoice=invoice,
-                            track=track,
-                            unit_price=unit_price,
-                            quantity=quantity
-                        )
-                        invoice_total += unit_price * quantity
-                    
-                    invoice.total = invoice_total
-                    invoice.save()
-            self.stdout.write(f'Created {Invoice.objects.count()} invoices.')
-
-        # 6. Create Report Templates
-        templates = [
-            {'name': 'Revenue Summary', 'description': 'Financial overview with key metrics', 'category': 'Financial'},
-            {'name': 'Artist Performance', 'description': 'Detailed artist streaming and revenue stats', 'category': 'Analytics'},
-            {'name': 'Audience Demographics', 'description': 'Listener age, location, and platform breakdown', 'category': 'Analytics'},
-            {'name': 'Content Performance', 'description': 'Track and album performance metrics', 'category': 'Performance'},
-            {'name': 'Royalty Distribution', 'description': 'Breakdown of royalty payments', 'category': 'Financial'}
-        ]
-        template_objs = []
-        for t in templates:
-            template, _ = ReportTemplate.objects.get_or_create(
-                name=t['name'],
-                defaults={'description': t['description'], 'category': t['category']}
+
+        with transaction.atomic():
+            genres = self.create_named(Genre, GENRES)
+            self.stdout.write(f'Created {len(genres)} genres.')
+            artists = self.create_named(Artist, self.artist_names())
+            self.stdout.write(f'Created {len(artists)} artists.')
+            tracks = self.create_catalog(artists, genres)
+            customers = self.create_customers()
+            self.create_invoices(customers, tracks)
+            self.create_reports_and_audit_logs()
+
+        # bulk_create sends no post_save signals, so derived tables are rebuilt in one pass
+        if not options['skip_derived']:
+            rebuild_rollups()
+            rebuild_track_sales()
+            rebuild_customer_metrics()
+            rebuild_search_index()
+        record_rewrite(*TRACKED_MODELS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully seeded all data in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def artist_names(self):
+        names = list(ARTISTS)
+        for copy in range(2, self.scale + 1):
+            names.extend(f'{name} {copy}' for name in ARTISTS)
+        return names
+
+    def create_named(self, model, names, defaults=None):
+        """Instances of ``model`` for ``names``, creating the missing ones in one INSERT"""
+        defaults = defaults or {}
+        existing = {}
+        for obj in model.objects.filter(name__in=names).order_by('pk'):
+            existing.setdefault(obj.name, obj)
+        missing = [model(name=name, **defaults.get(name, {})) for name in names if name not in existing]
+        for obj in model.objects.bulk_create(missing, batch_size=self.batch_size):
+            existing[obj.name] = obj
+        return [existing[name] for name in names]
+
+    def create_catalog(self, artists, genres):
+        if Album.objects.exists():
+            return list(Track.objects.only('track_id', 'unit_price'))
+
+        albums, volumes = [], []
+        for artist in artists:
+            for i in range(random.randint(2, 4)):
+                albums.append(Album(title=f'{artist.name} - Greatest Hits Vol {i + 1}', artist=artist))
+                volumes.append((i + 1, random.randint(8, 12)))
+        Album.objects.bulk_create(albums, batch_size=self.batch_size)
+
+        tracks = []
+        for album, (volume, count) in zip(albums, volumes):
+            for j in range(count):
+                tracks.append(Track(
+                    name=f'{album.artist.name} - Track {volume}-{j + 1}',
+                    album=album,
+                    genre=random.choice(genres),
+                    media_type_id=1,
+                    milliseconds=random.randint(180000, 420000),
+                    bytes=random.randint(3000000, 8000000),
+                    unit_price=UNIT_PRICE
+                ))
+        Track.objects.bulk_create(tracks, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(albums)} albums and {len(tracks)} tracks.')
+        return tracks
+
+    def create_customers(self):
+        if Customer.objects.exists():
+            return list(Customer.objects.only('customer_id', 'country'))
+
+        customers = Customer.objects.bulk_create([
+            Customer(
+                first_name=f'First{i + 1}',
+                last_name=f'Last{i + 1}',
+                email=f'customer{i + 1}@example.com',
+                country=random.choice(COUNTRIES),
+                city='Sample City',
+                address='123 Sample St'
             )
-            template_objs.append(template)
-        self.stdout.write(f'Created {len(template_objs)} report templates.')
+            for i in range(CUSTOMERS * self.scale)
+        ], batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(customers)} customers.')
+        return customers
+
+    def create_invoices(self, customers, tracks):
+        if Invoice.objects.exists():
+            return
+
+        now = timezone.now()
+        invoices, lines_per_invoice = [], []
+        for customer in customers:
+            for _ in range(random.randint(1, 5)):
+                # Lines and the invoice total are worked out before anything is inserted
+                lines = [
+                    InvoiceLine(track=track, unit_price=track.unit_price, quantity=random.randint(1, 2))
+                    for track in random.sample(tracks, random.randint(1, min(10, len(tracks))))
+                ]
+                invoices.append(Invoice(
+                    customer=customer,
+                    invoice_date=now - timedelta(days=random.randint(0, 365 * 2)),
+                    total=sum((line.unit_price * line.quantity for line in lines), Decimal('0')),
+                    billing_country=customer.country
+                ))
+                lines_per_invoice.append(lines)
+        Invoice.objects.bulk_create(invoices, batch_size=self.batch_size)
+
+        all_lines = []
+        for invoice, lines in zip(invoices, lines_per_invoice):
+            for line in lines:
+                line.invoice = invoice
+            all_lines.extend(lines)
+        InvoiceLine.objects.bulk_create(all_lines, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(invoices)} invoices with {len(all_lines)} lines.')
+
+    def create_reports_and_audit_logs(self):
+        templates = self.create_named(
+            ReportTemplate,
+            [t['name'] for t in TEMPLATES],
+            {t['name']: {'description': t['description'], 'category': t['category']} for t in TEMPLATES}
+        )
+        self.stdout.write(f'Created {len(templates)} report templates.')
 
-        # 7. Create some reports for the admin user
         admin = User.objects.filter(role='admin').first()
-        if admin:
-            # Recent reports
-            for i in range(5):
-                GeneratedReport.objects.create(
-                    user=admin,
-                    template=random.choice(template_objs),
-                    name=f"Admin Report {i+1}",
-                    report_type="Financial",
-                    status="COMPLETED"
-                )
-            # Scheduled reports
-            for i in range(3):
-                GeneratedReport.objects.create(
-                    user=admin,
-                    template=random.choice(template_objs),
-                    name=f"Scheduled Admin Report {i+1}",
-                    report_type="Analytics",
-                    status="SCHEDULED",
-                    scheduled_for=timezone.now() + timedelta(days=random.randint(1, 30))
-                )
-            self.stdout.write('Created mock reports for admin user.')
-
-        # 8. Create mock audit logs
-        if admin:
-            actions = ['LOGIN', 'CREATE', 'UPDATE', 'DELETE', 'EXPORT']
-            resources = ['USER', 'REPORT', 'TRACK', 'ALBUM', 'ARTIST']
-            for i in range(20):
-                AuditLog.objects.create(
-                    user=admin,
-                    action=random.choice(actions),
-                    resource_type=random.choice(resources),
-                    resource_id=str(random.randint(1, 100)),
-                    details={'info': f'Mock audit log entry {i+1}'},
-                    ip_address='127.0.0.1'
-                )
-            self.stdout.write('Created mock audit logs.')
-
-        self.stdout.write(self.style.SUCCESS('Successfully seeded all data.'))
+        if not admin:
+            return
+
+        now = timezone.now()
+        reports = [
+            GeneratedReport(
+                user=admin, template=random.choice(templates), name=f'Admin Report {i + 1}',
+                report_type='Financial', status='COMPLETED'
+            )
+            for i in range(5)
+        ]
+        reports += [
+            GeneratedReport(
+                user=admin, template=random.choice(templates), name=f'Scheduled Admin Report {i + 1}',
+                report_type='Analytics', status='SCHEDULED',
+                scheduled_for=now + timedelta(days=random.randint(1, 30))
+            )
+            for i in range(3)
+        ]
+        GeneratedReport.objects.bulk_create(reports)
+        self.stdout.write('Created mock reports for admin user.')
+
+        actions = ['LOGIN', 'CREATE', 'UPDATE', 'DELETE', 'EXPORT']
+        resources = ['USER', 'REPORT', 'TRACK', 'ALBUM', 'ARTIST']
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                user=admin,
+                action=random.choice(actions),
+                resource_type=random.choice(resources),
+                resource_id=str(random.randint(1, 100)),
+                details={'info': f'Mock audit log entry {i + 1}'},
+                ip_address='127.0.0.1'
+            )
+            for i in range(20)
+        ])
+        self.stdout.write('Created mock audit logs.')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.snapshots import SNAPSHOT_FORMATS, SnapshotError, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Writes a Parquet/Arrow snapshot of the sales star schema to SNAPSHOT_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=list(SNAPSHOT_FORMATS), default='parquet')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Append only invoices newer than the last snapshot watermark')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = write_snapshot(options['file_format'], incremental=options['incremental'])
+        except SnapshotError as exc:
+            raise CommandError(str(exc))
+        for name, table in manifest['tables'].items():
+            self.stdout.write(f"{name}: {table['rows']} rows in {len(table['parts'])} parts")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {manifest['mode']} snapshot {manifest['snapshot_id']} (invoice watermark {manifest['watermark']})."
+        ))
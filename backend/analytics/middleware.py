@@ -0,0 +1,38 @@
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .budgets import QueryBudgetExceeded, QueryStats, get_query_budget, request_allowance
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """Record queries and SQL time per request and enforce declared query budgets"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        request.query_stats = stats
+
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={stats.sql_ms:.2f};desc="{stats.count} queries"'
+
+        budget = getattr(request, 'query_budget', None)
+        problems = []
+        if budget:
+            problems = budget.violations(stats, request_allowance(request))
+        if problems:
+            message = f'{request.method} {request.path} exceeded its query budget: {", ".join(problems)}'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request.method)
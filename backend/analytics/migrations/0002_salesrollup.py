@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-17 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('month', 'Month'), ('year', 'Year')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_orders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'SalesRollup',
+                'ordering': ['granularity', 'period_start'],
+                'unique_together': {('granularity', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-17 18:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_salesrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackSales',
+            fields=[
+                ('track', models.OneToOneField(db_column='TrackId', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='analytics.track')),
+                ('quantity_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_sale_date', models.DateTimeField(blank=True, null=True)),
+                ('album', models.ForeignKey(blank=True, db_column='AlbumId', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='analytics.album')),
+                ('artist', models.ForeignKey(blank=True, db_column='ArtistId', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='analytics.artist')),
+                ('genre', models.ForeignKey(blank=True, db_column='GenreId', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='analytics.genre')),
+            ],
+            options={
+                'db_table': 'TrackSales',
+                'indexes': [models.Index(fields=['-quantity_sold'], name='tracksales_quantity_idx'), models.Index(fields=['-revenue'], name='tracksales_revenue_idx'), models.Index(fields=['artist', 'revenue'], name='tracksales_artist_idx'), models.Index(fields=['album', 'revenue'], name='tracksales_album_idx'), models.Index(fields=['genre', 'revenue'], name='tracksales_genre_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-17 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_index_plan'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-invoice_date', 'invoice_id'], name='invoice_keyset_idx'),
+        ),
+    ]
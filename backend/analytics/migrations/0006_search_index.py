@@ -0,0 +1,63 @@
+from itertools import islice
+
+from django.db import migrations
+
+# Entity, document key code and indexed fields; mirrors analytics.search
+SEARCHABLE = {
+    'artist': (1, ('name',)),
+    'album': (2, ('title',)),
+    'track': (3, ('name',)),
+    'customer': (4, ('first_name', 'last_name', 'email')),
+}
+ENTITY_SLOTS = 8
+
+TABLES = {
+    'sqlite': ('rowid', [
+        "CREATE VIRTUAL TABLE analytics_search USING fts5("
+        "entity UNINDEXED, object_id UNINDEXED, body, tokenize = 'unicode61 remove_diacritics 2')",
+    ]),
+    'postgresql': ('doc_id', [
+        "CREATE TABLE analytics_search ("
+        "doc_id bigint PRIMARY KEY, entity varchar(20) NOT NULL, object_id integer NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)",
+        "CREATE INDEX analytics_search_document_idx ON analytics_search USING GIN (document)",
+        "CREATE INDEX analytics_search_object_idx ON analytics_search (entity, object_id)",
+    ]),
+}
+
+
+def create_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in TABLES:
+        return
+    key_column, statements = TABLES[connection.vendor]
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+        for entity, (code, fields) in SEARCHABLE.items():
+            rows = apps.get_model('analytics', entity).objects.values_list('pk', *fields).iterator()
+            while batch := list(islice(rows, 2000)):
+                cursor.executemany(
+                    f'INSERT INTO analytics_search ({key_column}, entity, object_id, body) VALUES (%s, %s, %s, %s)',
+                    [
+                        (pk * ENTITY_SLOTS + code, entity, pk, ' '.join(str(value) for value in values if value))
+                        for pk, *values in batch
+                    ]
+                )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in TABLES:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE analytics_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_invoice_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-17 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerMetrics',
+            fields=[
+                ('customer', models.OneToOneField(db_column='CustomerId', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metrics', serialize=False, to='analytics.customer')),
+                ('country', models.CharField(blank=True, max_length=40, null=True)),
+                ('lifetime_value', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('order_count', models.IntegerField(default=0)),
+                ('first_purchase', models.DateTimeField(blank=True, null=True)),
+                ('last_purchase', models.DateTimeField(blank=True, null=True)),
+                ('recency_score', models.PositiveSmallIntegerField(default=1)),
+                ('frequency_score', models.PositiveSmallIntegerField(default=1)),
+                ('monetary_score', models.PositiveSmallIntegerField(default=1)),
+                ('segment', models.CharField(choices=[('champions', 'Champions'), ('loyal', 'Loyal'), ('new', 'New'), ('promising', 'Promising'), ('at_risk', 'At risk'), ('about_to_sleep', 'About to sleep'), ('hibernating', 'Hibernating')], default='hibernating', max_length=20)),
+            ],
+            options={
+                'db_table': 'CustomerMetrics',
+                'indexes': [models.Index(fields=['-lifetime_value'], name='custmetrics_value_idx'), models.Index(fields=['segment', 'lifetime_value'], name='custmetrics_segment_idx'), models.Index(fields=['country', 'lifetime_value'], name='custmetrics_country_idx')],
+            },
+        ),
+    ]
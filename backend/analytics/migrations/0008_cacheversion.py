@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_customermetrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('model', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'CacheVersion',
+            },
+        ),
+    ]
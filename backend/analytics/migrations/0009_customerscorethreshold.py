@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerScoreThreshold',
+            fields=[
+                ('score', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('last_purchase', models.DateTimeField(blank=True, null=True)),
+                ('order_count', models.IntegerField(blank=True, null=True)),
+                ('lifetime_value', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+            ],
+            options={
+                'db_table': 'CustomerScoreThreshold',
+                'ordering': ['score'],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F
 
 
 class Artist(models.Model):
@@ -9,6 +10,9 @@ class Artist(models.Model):
     class Meta:
         db_table = 'Artist'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='artist_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -23,6 +27,9 @@ class Album(models.Model):
     class Meta:
         db_table = 'Album'
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['title'], name='album_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -56,6 +63,11 @@ class Track(models.Model):
     class Meta:
         db_table = 'Track'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'track_id'], name='track_name_idx'),
+            models.Index(fields=['genre', 'name'], name='track_genre_name_idx'),
+            models.Index(fields=['album', 'name'], name='track_album_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -85,6 +97,10 @@ class Customer(models.Model):
     class Meta:
         db_table = 'Customer'
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['country', 'city'], name='customer_country_city_idx'),
+            models.Index(fields=['last_name', 'first_name'], name='customer_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -105,6 +121,14 @@ class Invoice(models.Model):
     class Meta:
         db_table = 'Invoice'
         ordering = ['-invoice_date']
+        indexes = [
+            # Date-range aggregates read (invoice_date, total) from the index alone
+            models.Index(fields=['invoice_date', 'total'], name='invoice_date_total_idx'),
+            # Serves the default listing order and its keyset pagination
+            models.Index(fields=['-invoice_date', 'invoice_id'], name='invoice_keyset_idx'),
+            models.Index(fields=['billing_country', 'invoice_date'], name='invoice_country_date_idx'),
+            models.Index(fields=['customer', 'total'], name='invoice_customer_total_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_id} - {self.customer}"
@@ -120,6 +144,11 @@ class InvoiceLine(models.Model):
 
     class Meta:
         db_table = 'InvoiceLine'
+        indexes = [
+            # Covering indexes for line-revenue aggregation by invoice and by track
+            models.Index(fields=['invoice', 'track', 'unit_price', 'quantity'], name='invoiceline_invoice_cover_idx'),
+            models.Index(fields=['track', 'unit_price', 'quantity'], name='invoiceline_track_cover_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice Line {self.invoice_line_id}"
@@ -128,3 +157,139 @@ class InvoiceLine(models.Model):
     def total_price(self):
         """Calculate total price for this line item"""
         return self.unit_price * self.quantity
+
+    @staticmethod
+    def revenue_expression(prefix=''):
+        """
+        SQL expression for line revenue (unit_price * quantity), the canonical
+        revenue measure for catalog rankings. ``prefix`` is the lookup path to
+        the invoice line, e.g. ``'invoiceline__'`` when aggregating from Track.
+        """
+        return ExpressionWrapper(
+            F(f'{prefix}unit_price') * F(f'{prefix}quantity'),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2)
+        )
+
+
+class SalesRollup(models.Model):
+    """Pre-aggregated invoice totals per day, month and year"""
+    GRANULARITY_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+        ('year', 'Year'),
+    ]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    total_sales = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'SalesRollup'
+        ordering = ['granularity', 'period_start']
+        unique_together = ('granularity', 'period_start')
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start}: {self.total_sales}"
+
+    @property
+    def average_order_value(self):
+        """Average invoice total for the period"""
+        return self.total_sales / self.total_orders if self.total_orders else 0
+
+
+class TrackSales(models.Model):
+    """Denormalized per-track sales fact, maintained from InvoiceLine writes"""
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, db_column='TrackId', related_name='sales')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, db_column='AlbumId', null=True, blank=True, db_index=False, related_name='+')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, db_column='ArtistId', null=True, blank=True, db_index=False, related_name='+')
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, db_column='GenreId', null=True, blank=True, db_index=False, related_name='+')
+    quantity_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_sale_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'TrackSales'
+        indexes = [
+            models.Index(fields=['-quantity_sold'], name='tracksales_quantity_idx'),
+            models.Index(fields=['-revenue'], name='tracksales_revenue_idx'),
+            models.Index(fields=['artist', 'revenue'], name='tracksales_artist_idx'),
+            models.Index(fields=['album', 'revenue'], name='tracksales_album_idx'),
+            models.Index(fields=['genre', 'revenue'], name='tracksales_genre_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales for track {self.track_id}: {self.quantity_sold}"
+
+
+class CustomerMetrics(models.Model):
+    """Per-customer lifetime value and RFM scores, maintained from Invoice writes"""
+    SEGMENT_CHOICES = [
+        ('champions', 'Champions'),
+        ('loyal', 'Loyal'),
+        ('new', 'New'),
+        ('promising', 'Promising'),
+        ('at_risk', 'At risk'),
+        ('about_to_sleep', 'About to sleep'),
+        ('hibernating', 'Hibernating'),
+    ]
+
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, db_column='CustomerId', related_name='metrics')
+    country = models.CharField(max_length=40, null=True, blank=True)
+    lifetime_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    first_purchase = models.DateTimeField(null=True, blank=True)
+    last_purchase = models.DateTimeField(null=True, blank=True)
+    # Quintile scores, 1 (lowest fifth of customers) to 5 (highest fifth)
+    recency_score = models.PositiveSmallIntegerField(default=1)
+    frequency_score = models.PositiveSmallIntegerField(default=1)
+    monetary_score = models.PositiveSmallIntegerField(default=1)
+    segment = models.CharField(max_length=20, choices=SEGMENT_CHOICES, default='hibernating')
+
+    class Meta:
+        db_table = 'CustomerMetrics'
+        indexes = [
+            models.Index(fields=['-lifetime_value'], name='custmetrics_value_idx'),
+            models.Index(fields=['segment', 'lifetime_value'], name='custmetrics_segment_idx'),
+            models.Index(fields=['country', 'lifetime_value'], name='custmetrics_country_idx'),
+        ]
+
+    def __str__(self):
+        return f"Metrics for customer {self.customer_id}: {self.lifetime_value}"
+
+
+class CustomerScoreThreshold(models.Model):
+    """
+    Per quintile score (2-5), the highest metric values that still scored
+    below it at the last full rescore; a customer needs more to reach it.
+    Lets one customer be scored without ranking the whole table. A null
+    threshold means every customer reaches the score.
+    """
+    score = models.PositiveSmallIntegerField(primary_key=True)
+    last_purchase = models.DateTimeField(null=True, blank=True)
+    order_count = models.IntegerField(null=True, blank=True)
+    lifetime_value = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        db_table = 'CustomerScoreThreshold'
+        ordering = ['score']
+
+    def __str__(self):
+        return f"Score {self.score} thresholds"
+
+
+class CacheVersion(models.Model):
+    """
+    Invalidation version and last write time of a model (or of another
+    derived structure, such as the sales cube), shared by every process
+    """
+    model = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'CacheVersion'
+
+    def __str__(self):
+        return f"{self.model} v{self.version}"
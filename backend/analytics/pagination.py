@@ -0,0 +1,182 @@
+"""
+List pagination for the API.
+
+``SelectablePagination`` is the project-wide default. It serves page
+numbers unless a view that declares ``keyset_ordering`` opts into keyset
+(cursor) pages, either for every request with ``pagination_mode = 'cursor'``
+or per request with ``?pagination=cursor``. Keyset pages seek past the last
+row seen instead of using ``OFFSET``, so deep pages cost the same as the
+first one, and they never run ``COUNT(*)``. ``?count=estimate`` adds an
+approximate total to keyset pages and replaces the exact count of page
+number pages.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Approximate a queryset's row count without a full ``COUNT(*)`` scan.
+
+    PostgreSQL reports the planner's row estimate. Elsewhere an unfiltered
+    queryset with an integer primary key is sized from the primary key range;
+    anything else falls back to an exact count.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    if not queryset.query.where and queryset.model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return 0
+        return bounds['high'] - bounds['low'] + 1
+    return queryset.count()
+
+
+def wants_estimate(request):
+    return request.query_params.get('count') == 'estimate'
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class EstimatedPageNumberPagination(PageNumberPagination):
+    """Page numbers whose total comes from ``estimate_count`` on ``?count=estimate``"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if wants_estimate(request):
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over the view's ``keyset_ordering``, e.g.
+    ``('-invoice_date', 'invoice_id')``. The ordering must end in a unique
+    column and always replaces ``?ordering=``. Cursors are opaque tokens
+    holding the boundary row's ordering values and the direction.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = api_settings.PAGE_SIZE
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in view.keyset_ordering]
+        self.fields = [queryset.model._meta.get_field(name) for name, _ in self.ordering]
+        position, reverse = self.decode_cursor(request)
+
+        self.count = estimate_count(queryset) if wants_estimate(request) else None
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, reverse))
+        queryset = queryset.order_by(*[
+            ('-' if descending != reverse else '') + name for name, descending in self.ordering
+        ])
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        # Walking backwards from a cursor always leaves a next page behind it
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.page = rows
+        return rows
+
+    def seek(self, position, reverse):
+        """
+        Rows strictly after ``position`` in the (possibly reversed) ordering:
+        ``a < x OR (a = x AND b > y) ...`` with a redundant ``a <= x`` bound
+        so the leading column's index can start the range scan.
+        """
+        clauses = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            clauses |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        name, descending = self.ordering[0]
+        bound = 'lte' if descending != reverse else 'gte'
+        return Q(**{f'{name}__{bound}': position[0]}) & clauses
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        values = [field.value_to_string(row) for field in self.fields]
+        token = base64.urlsafe_b64encode(json.dumps({'p': values, 'r': int(reverse)}).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+
+class SelectablePagination(BasePagination):
+    """Page numbers by default, keyset pages where the view or the request asks for them"""
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.mode_query_param) or getattr(view, 'pagination_mode', 'page')
+        if KeysetPagination.cursor_query_param in request.query_params:
+            mode = 'cursor'
+        if mode == 'cursor' and getattr(view, 'keyset_ordering', None):
+            self.delegate = KeysetPagination()
+        else:
+            self.delegate = EstimatedPageNumberPagination()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
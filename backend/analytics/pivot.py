@@ -0,0 +1,151 @@
+"""
+Pivot queries over invoice lines.
+
+A pivot request names dimensions from ``DIMENSIONS`` and measures from
+``MEASURES``. ``pivot`` compiles it into one grouped query on InvoiceLine,
+``values(<dimensions>).annotate(<measures>)``, with the filters and the date
+range pushed into its WHERE clause. New breakdowns therefore need neither
+a new endpoint nor a handwritten aggregate. ``PIVOT_MAX_ROWS`` bounds the
+result: the query fetches one row past the limit, and a larger result is
+rejected rather than silently truncated.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, DateField, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, ExtractYear, TruncMonth, TruncQuarter
+
+from .models import InvoiceLine
+from .rollups import start_of_day
+
+# ``expression`` builds the GROUP BY term, ``filter_lookup`` is the InvoiceLine
+# lookup filters on the dimension use (None: not filterable, use the date
+# range) and ``label`` formats a grouped value for the response
+Dimension = namedtuple('Dimension', ['expression', 'filter_lookup', 'label'])
+
+
+def _same(value):
+    return value
+
+
+def _month(value):
+    return value.strftime('%Y-%m') if value else None
+
+
+def _quarter(value):
+    return f'{value.year}-Q{(value.month - 1) // 3 + 1}' if value else None
+
+
+DIMENSIONS = {
+    'genre': Dimension(lambda: F('track__genre__name'), 'track__genre__name', _same),
+    'artist': Dimension(lambda: F('track__album__artist__name'), 'track__album__artist__name', _same),
+    'album': Dimension(lambda: F('track__album__title'), 'track__album__title', _same),
+    'media_type': Dimension(lambda: F('track__media_type_id'), 'track__media_type_id', _same),
+    'country': Dimension(lambda: F('invoice__customer__country'), 'invoice__customer__country', _same),
+    'city': Dimension(lambda: F('invoice__customer__city'), 'invoice__customer__city', _same),
+    'year': Dimension(lambda: ExtractYear('invoice__invoice_date'), 'invoice__invoice_date__year', _same),
+    'quarter': Dimension(lambda: TruncQuarter('invoice__invoice_date', output_field=DateField()), None, _quarter),
+    'month': Dimension(lambda: TruncMonth('invoice__invoice_date', output_field=DateField()), None, _month),
+}
+
+
+def _revenue():
+    return Sum(InvoiceLine.revenue_expression())
+
+
+MEASURES = {
+    'revenue': _revenue,
+    'units': lambda: Sum('quantity'),
+    'orders': lambda: Count('invoice', distinct=True),
+    # Cast so SQLite does not integer-divide whole-number revenue
+    'average_order_value': lambda: ExpressionWrapper(
+        Cast(_revenue(), FloatField()) / Count('invoice', distinct=True), output_field=FloatField()
+    ),
+    'customers': lambda: Count('invoice__customer', distinct=True),
+}
+
+
+class PivotError(ValueError):
+    """A pivot request that is invalid or whose result is too large"""
+
+
+def _money(value):
+    # SQLite returns sums over decimal columns as floats
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def _filter(filters, start_date, end_date):
+    condition = Q()
+    for name, values in filters.items():
+        lookup = DIMENSIONS[name].filter_lookup
+        if lookup is None:
+            raise PivotError(f'Cannot filter on {name}; use start_date/end_date instead')
+        condition &= Q(**{f'{lookup}__in': values})
+    if start_date:
+        condition &= Q(invoice__invoice_date__gte=start_of_day(start_date))
+    if end_date:
+        condition &= Q(invoice__invoice_date__lt=start_of_day(end_date + timedelta(days=1)))
+    return condition
+
+
+def _ordering(order_by, dimensions, measures):
+    if not order_by:
+        return list(dimensions)
+    name = order_by.lstrip('-')
+    if name not in dimensions and name not in measures:
+        raise PivotError(f'order_by must be one of the requested dimensions or measures, not {name}')
+    return [order_by, *(dimension for dimension in dimensions if dimension != name)]
+
+
+def pivot(dimensions, measures, filters=None, start_date=None, end_date=None, order_by=None):
+    """
+    Rows of ``measures`` grouped by ``dimensions`` over the invoice lines
+    matching ``filters`` (dimension -> allowed values) and the date range,
+    computed by a single query.
+    """
+    unknown = [name for name in [*dimensions, *(filters or {})] if name not in DIMENSIONS]
+    if unknown:
+        raise PivotError(f"Unknown dimension: {unknown[0]} (choose from {', '.join(DIMENSIONS)})")
+    if len(set(dimensions)) != len(dimensions):
+        raise PivotError('Each dimension can only be requested once')
+    if not measures:
+        raise PivotError('At least one measure is required')
+    unknown = [name for name in measures if name not in MEASURES]
+    if unknown:
+        raise PivotError(f"Unknown measure: {unknown[0]} (choose from {', '.join(MEASURES)})")
+
+    condition = _filter(filters or {}, start_date, end_date)
+    try:
+        lines = InvoiceLine.objects.filter(condition)
+    except (TypeError, ValueError) as exc:
+        raise PivotError(f'Invalid filter value: {exc}') from exc
+
+    aggregates = {name: MEASURES[name]() for name in measures}
+    if 'average_order_value' in measures:
+        # The SQL ratio is a float and only orders the rows; the value returned is exact
+        aggregates.setdefault('revenue', _revenue())
+        aggregates.setdefault('orders', MEASURES['orders']())
+    if not dimensions:
+        rows = [lines.aggregate(**aggregates)]
+    else:
+        max_rows = settings.PIVOT_MAX_ROWS
+        grouped = lines.values(**{name: DIMENSIONS[name].expression() for name in dimensions}).annotate(
+            **aggregates
+        ).order_by(*_ordering(order_by, dimensions, measures))
+        rows = list(grouped[:max_rows + 1])
+        if len(rows) > max_rows:
+            raise PivotError(f'The pivot has more than {max_rows} rows; add filters or drop a dimension')
+
+    results = []
+    for row in rows:
+        result = {name: DIMENSIONS[name].label(row[name]) for name in dimensions}
+        for name in measures:
+            if name == 'average_order_value':
+                orders = row['orders'] or 0
+                result[name] = (_money(row['revenue']) / orders).quantize(Decimal('0.01')) if orders else _money(0)
+            else:
+                result[name] = _money(row[name]) if name == 'revenue' else row[name] or 0
+        results.append(result)
+    return results
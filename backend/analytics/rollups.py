@@ -0,0 +1,299 @@
+"""
+Sales rollups: per-day, per-month and per-year invoice aggregates.
+
+The dashboard time series read closed periods from ``SalesRollup`` rows and
+only go back to the raw ``Invoice`` table for today's invoices, so their cost
+no longer grows with the size of the invoice history. Weekly and quarterly
+series are summed from the daily and monthly rows. Rollup days follow the
+server's time zone, so a series in another time zone buckets the invoices
+themselves by local day in one grouped query.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Invoice, SalesRollup
+
+# Stored rollup levels, and the granularities a series can be bucketed by
+GRANULARITIES = ('day', 'month', 'year')
+SERIES_GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+# The rollup level each series granularity is summed from
+ROLLUP_LEVELS = {'day': 'day', 'week': 'day', 'month': 'month', 'quarter': 'month', 'year': 'year'}
+MAX_SERIES_PERIODS = 5000
+
+
+def period_start(day, granularity):
+    """Return the first day of the ``granularity`` period containing ``day``"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def next_period(start, granularity):
+    """Return the first day of the period following the one starting at ``start``"""
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if granularity == 'quarter':
+        month = start.month + 3
+        return start.replace(year=start.year + (month > 12), month=(month - 1) % 12 + 1, day=1)
+    if granularity == 'year':
+        return start.replace(year=start.year + 1, month=1, day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def previous_period(start, granularity):
+    """Return the first day of the period before the one starting at ``start``"""
+    return period_start(start - timedelta(days=1), granularity)
+
+
+def period_label(start, granularity):
+    """Display label for the period starting at ``start``, e.g. 2024-W05 or 2024-Q1"""
+    if granularity == 'week':
+        year, week, _ = start.isocalendar()
+        return f'{year}-W{week:02d}'
+    if granularity == 'quarter':
+        return f'{start.year}-Q{(start.month - 1) // 3 + 1}'
+    return start.strftime({'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}[granularity])
+
+
+def start_of_day(day, tz=None):
+    """Aware datetime for midnight at the start of ``day`` (in ``tz``, default the current zone)"""
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def invoice_day(value):
+    """Local calendar day an invoice datetime belongs to"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localdate(value)
+
+
+def _store(granularity, start, totals):
+    if totals['total_orders']:
+        SalesRollup.objects.update_or_create(
+            granularity=granularity,
+            period_start=start,
+            defaults={
+                'total_sales': totals['total_sales'] or 0,
+                'total_orders': totals['total_orders'],
+            }
+        )
+    else:
+        SalesRollup.objects.filter(granularity=granularity, period_start=start).delete()
+
+
+def refresh_day(day):
+    """Recompute the day, month and year rollups that cover ``day``"""
+    totals = Invoice.objects.filter(
+        invoice_date__gte=start_of_day(day),
+        invoice_date__lt=start_of_day(day + timedelta(days=1))
+    ).aggregate(total_sales=Sum('total'), total_orders=Count('invoice_id'))
+    _store('day', day, totals)
+
+    # Coarser periods are summed from the next finer rollup level
+    for finer, granularity in (('day', 'month'), ('month', 'year')):
+        start = period_start(day, granularity)
+        totals = SalesRollup.objects.filter(
+            granularity=finer,
+            period_start__gte=start,
+            period_start__lt=next_period(start, granularity)
+        ).aggregate(total_sales=Sum('total_sales'), total_orders=Sum('total_orders'))
+        _store(granularity, start, totals)
+
+
+@transaction.atomic
+def rebuild_rollups(start=None, end=None):
+    """
+    Rebuild rollups from the raw invoices, optionally limited to the calendar
+    years spanned by ``start``/``end``. Returns the number of daily rows written.
+    """
+    invoices = Invoice.objects.all()
+    rollups = SalesRollup.objects.all()
+    if start:
+        start = period_start(start, 'year')
+        invoices = invoices.filter(invoice_date__gte=start_of_day(start))
+        rollups = rollups.filter(period_start__gte=start)
+    if end:
+        end = next_period(period_start(end, 'year'), 'year')
+        invoices = invoices.filter(invoice_date__lt=start_of_day(end))
+        rollups = rollups.filter(period_start__lt=end)
+    rollups.delete()
+
+    daily = invoices.annotate(day=TruncDate('invoice_date')).values('day').annotate(
+        total_sales=Sum('total'),
+        total_orders=Count('invoice_id')
+    ).order_by('day')
+
+    buckets = {granularity: defaultdict(lambda: [Decimal('0'), 0]) for granularity in GRANULARITIES}
+    for row in daily:
+        for granularity in GRANULARITIES:
+            bucket = buckets[granularity][period_start(row['day'], granularity)]
+            bucket[0] += row['total_sales'] or 0
+            bucket[1] += row['total_orders']
+
+    SalesRollup.objects.bulk_create([
+        SalesRollup(
+            granularity=granularity,
+            period_start=period,
+            total_sales=total_sales,
+            total_orders=total_orders
+        )
+        for granularity in GRANULARITIES
+        for period, (total_sales, total_orders) in buckets[granularity].items()
+    ], batch_size=1000)
+    return len(buckets['day'])
+
+
+def _local_daily_totals(tz, start, end):
+    """Invoice totals per calendar day in ``tz``, straight from the Invoice table"""
+    invoices = Invoice.objects.all()
+    if start:
+        invoices = invoices.filter(invoice_date__gte=start_of_day(start, tz))
+    if end:
+        invoices = invoices.filter(invoice_date__lt=start_of_day(end + timedelta(days=1), tz))
+    return invoices.annotate(day=TruncDate('invoice_date', tzinfo=tz)).values('day').annotate(
+        total_sales=Sum('total'),
+        total_orders=Count('invoice_id')
+    ).values_list('day', 'total_sales', 'total_orders')
+
+
+def sales_series(granularity, start=None, end=None, tz=None):
+    """
+    Sales totals per ``granularity`` period for invoices between the ``start``
+    and ``end`` dates (both inclusive, either may be None), as calendar days
+    in ``tz`` (default: the server's time zone).
+
+    Closed periods that lie wholly inside the range are read from the rollup
+    rows of their level (``ROLLUP_LEVELS``), partially covered or still-open
+    periods are summed from daily rollups, and only invoices from today
+    onwards touch the Invoice table. In any other time zone the invoices are
+    bucketed by local day in one query instead.
+    """
+    if start and end and start > end:
+        return []
+
+    buckets = defaultdict(lambda: [Decimal('0'), 0])
+
+    def add(day, total_sales, total_orders):
+        bucket = buckets[period_start(day, granularity)]
+        bucket[0] += total_sales or 0
+        bucket[1] += total_orders or 0
+
+    if tz is not None and str(tz) != timezone.get_current_timezone_name():
+        for row in _local_daily_totals(tz, start, end):
+            add(*row)
+        return _series_rows(buckets)
+
+    today = timezone.localdate()
+    level = ROLLUP_LEVELS[granularity]
+
+    # Whole, closed periods straight from the matching rollup level
+    covered_from = None
+    if start:
+        covered_from = period_start(start, level)
+        if covered_from != start:
+            covered_from = next_period(covered_from, level)
+    covered_to = period_start(today, level)
+    if end:
+        covered_to = min(covered_to, period_start(end + timedelta(days=1), level))
+
+    coarse = SalesRollup.objects.filter(granularity=level, period_start__lt=covered_to)
+    if covered_from:
+        coarse = coarse.filter(period_start__gte=covered_from)
+    for row in coarse.values_list('period_start', 'total_sales', 'total_orders'):
+        add(*row)
+
+    # Remaining days before today from daily rollups
+    if level != 'day':
+        fine = SalesRollup.objects.filter(granularity='day', period_start__lt=today)
+        if start:
+            fine = fine.filter(period_start__gte=start)
+        if end:
+            fine = fine.filter(period_start__lte=end)
+        covered = Q(period_start__lt=covered_to)
+        if covered_from:
+            covered &= Q(period_start__gte=covered_from)
+        for row in fine.exclude(covered).values_list('period_start', 'total_sales', 'total_orders'):
+            add(*row)
+
+    # The open day is always computed live
+    if end is None or end >= today:
+        raw = Invoice.objects.filter(invoice_date__gte=start_of_day(max(today, start or today)))
+        if end:
+            raw = raw.filter(invoice_date__lt=start_of_day(end + timedelta(days=1)))
+        live = raw.annotate(day=TruncDate('invoice_date')).values('day').annotate(
+            total_sales=Sum('total'),
+            total_orders=Count('invoice_id')
+        ).values_list('day', 'total_sales', 'total_orders')
+        for row in live:
+            add(*row)
+
+    return _series_rows(buckets)
+
+
+def _series_row(period, total_sales, total_orders):
+    return {
+        'period': period,
+        'total_sales': total_sales,
+        'total_orders': total_orders,
+        'average_order_value': total_sales / total_orders if total_orders else 0,
+    }
+
+
+def _series_rows(buckets):
+    return [
+        _series_row(period, total_sales, total_orders)
+        for period, (total_sales, total_orders) in sorted(buckets.items())
+        if total_orders
+    ]
+
+
+def fill_gaps(rows, granularity, start=None, end=None):
+    """
+    ``rows`` from ``sales_series`` with a zero row for every empty period
+    from the one containing ``start`` (default: the first row) to the one
+    containing ``end`` (default: the last row).
+    """
+    by_period = {row['period']: row for row in rows}
+    first = period_start(start, granularity) if start else min(by_period, default=None)
+    last = period_start(end, granularity) if end else max(by_period, default=None)
+    filled = []
+    period = first
+    while first is not None and last is not None and period <= last:
+        if len(filled) == MAX_SERIES_PERIODS:
+            raise ValueError(f'The range covers more than {MAX_SERIES_PERIODS} {granularity} periods')
+        filled.append(by_period.get(period) or _series_row(period, Decimal('0'), 0))
+        period = next_period(period, granularity)
+    return filled
+
+
+def add_rolling_average(rows, window):
+    """
+    Set ``rolling_average`` on each of the consecutive ``rows``: the mean
+    ``total_sales`` of the row and the ``window - 1`` rows before it, or
+    None while fewer rows than that precede it.
+    """
+    running = Decimal('0')
+    for index, row in enumerate(rows):
+        running += row['total_sales']
+        if index >= window:
+            running -= rows[index - window]['total_sales']
+        row['rolling_average'] = running / window if index + 1 >= window else None
+    return rows
@@ -0,0 +1,70 @@
+"""
+Random row sampling without ``ORDER BY RANDOM()``.
+
+``random_sample`` draws candidate primary keys from the model's id range
+and fetches only those rows, so a sample costs O(sample size) instead of a
+sort of the whole table. The id range is cached in the ``analytics`` cache
+under the model's invalidation version, so any write to the model makes
+the next sample re-read it. Pass the request so every sample it draws
+shares one version lookup.
+"""
+import random
+
+from django.db.models import Max, Min
+
+from .cache import get_cache, get_model_versions
+
+# Candidate ids drawn per missing row, and lookup rounds before falling back to a range scan
+OVERSAMPLE = 2
+SAMPLE_ROUNDS = 3
+
+
+def id_range(model, request=None):
+    """(lowest, highest) primary key of ``model``; (None, None) when empty"""
+    key = f'analytics:sample:range:{model._meta.label_lower}:{get_model_versions([model], request)[0]}'
+    bounds = get_cache().get(key)
+    if bounds is None:
+        aggregate = model._default_manager.aggregate(low=Min('pk'), high=Max('pk'))
+        bounds = (aggregate['low'], aggregate['high'])
+        get_cache().set(key, bounds)
+    return bounds
+
+
+def random_sample(queryset, size, rng=random, request=None):
+    """
+    Up to ``size`` distinct random rows of ``queryset``, in random order.
+
+    Works on integer primary keys. Gaps in the id range (and rows the
+    queryset filters out) are covered by further rounds, then by reading on
+    from a random id, so tables with sparse ids still fill the sample.
+    """
+    low, high = id_range(queryset.model, request)
+    if low is None or size < 1:
+        return []
+    queryset = queryset.order_by()
+    population = range(low, high + 1)
+    rows = {}
+
+    for _ in range(SAMPLE_ROUNDS):
+        wanted = size - len(rows)
+        drawn = rng.sample(population, min(len(population), wanted * OVERSAMPLE))
+        for obj in queryset.filter(pk__in=set(drawn) - rows.keys())[:wanted]:
+            rows[obj.pk] = obj
+        if len(rows) == size or len(drawn) == len(population):
+            # Either done, or every id was a candidate and nothing else can match
+            return _shuffled(rows, rng)
+
+    start = rng.choice(population)
+    remaining = queryset.exclude(pk__in=rows.keys())
+    for obj in remaining.filter(pk__gte=start).order_by('pk')[:size - len(rows)]:
+        rows[obj.pk] = obj
+    if len(rows) < size:
+        for obj in remaining.filter(pk__lt=start).order_by('pk')[:size - len(rows)]:
+            rows[obj.pk] = obj
+    return _shuffled(rows, rng)
+
+
+def _shuffled(rows, rng):
+    sample = list(rows.values())
+    rng.shuffle(sample)
+    return sample
@@ -0,0 +1,196 @@
+"""
+Full-text search over artists, albums, tracks and customers.
+
+Every searchable row has one document in the ``analytics_search`` table:
+an FTS5 virtual table on SQLite, or a table with a generated ``tsvector``
+column behind a GIN index on PostgreSQL. Other databases fall back to
+``icontains`` filters. ``search()`` joins the documents into the entity's
+own queryset and orders by relevance, so each entity costs one query, and
+every search term matches as a prefix. Signals keep documents in step with
+saves and deletes; ``rebuild_search_index()`` repopulates the table after
+bulk loads that bypass them.
+"""
+import re
+from abc import ABC, abstractmethod
+from functools import reduce
+from operator import or_
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from .models import Album, Artist, Customer, Track
+
+SEARCH_TABLE = 'analytics_search'
+
+# Fields whose text makes up each entity's document
+SEARCHABLE_FIELDS = {
+    Artist: ('name',),
+    Album: ('title',),
+    Track: ('name',),
+    Customer: ('first_name', 'last_name', 'email'),
+}
+# Document keys carry the entity in their low bits: pk * ENTITY_SLOTS + code
+ENTITY_CODES = {Artist: 1, Album: 2, Track: 3, Customer: 4}
+ENTITY_SLOTS = 8
+REBUILD_BATCH_SIZE = 2000
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+def document_key(model, pk):
+    return pk * ENTITY_SLOTS + ENTITY_CODES[model]
+
+
+def document_body(values):
+    return ' '.join(str(value) for value in values if value)
+
+
+class SearchBackend:
+    """``icontains`` fallback for databases without a full-text index"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def filter(self, queryset, terms):
+        fields = SEARCHABLE_FIELDS[queryset.model]
+        for term in terms:
+            queryset = queryset.filter(reduce(or_, (Q(**{f'{field}__icontains': term}) for field in fields)))
+        return queryset
+
+    def insert(self, model, rows):
+        pass
+
+    def delete(self, model, pks):
+        pass
+
+    def clear(self):
+        pass
+
+
+class IndexedSearchBackend(SearchBackend, ABC):
+    """Shared document maintenance and query join for the full-text backends"""
+    key_column = None
+
+    @property
+    def table(self):
+        return self.connection.ops.quote_name(SEARCH_TABLE)
+
+    @abstractmethod
+    def match(self, terms):
+        """Return (where SQL, rank SQL, parameter); higher ranks sort first"""
+
+    def filter(self, queryset, terms):
+        model = queryset.model
+        quote = self.connection.ops.quote_name
+        where, rank, param = self.match(terms)
+        return queryset.extra(
+            select={'search_rank': rank},
+            select_params=[param] if '%s' in rank else [],
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{self.table}.object_id = {quote(model._meta.db_table)}.{quote(model._meta.pk.column)}',
+                f'{self.table}.entity = %s',
+                where,
+            ],
+            params=[model._meta.model_name, param],
+            order_by=['-search_rank', 'pk'],
+        )
+
+    def insert(self, model, rows):
+        """Add documents for ``rows`` of (pk, body)"""
+        entity = model._meta.model_name
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} ({self.key_column}, entity, object_id, body) VALUES (%s, %s, %s, %s)',
+                [(document_key(model, pk), entity, pk, body) for pk, body in rows]
+            )
+
+    def delete(self, model, pks):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE {self.key_column} = %s',
+                [(document_key(model, pk),) for pk in pks]
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+
+class SQLiteSearchBackend(IndexedSearchBackend):
+    key_column = 'rowid'
+
+    def match(self, terms):
+        # Quoted so FTS5 operators in user input stay literal; * makes each a prefix query
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        # Unlike bm25(), the rank column (also bm25) can be used in GROUP BY queries
+        return f'{self.table} MATCH %s', f'-{self.table}.rank', expression
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    key_column = 'doc_id'
+
+    def match(self, terms):
+        expression = ' & '.join(f'{term}:*' for term in terms)
+        return (
+            f"{self.table}.document @@ to_tsquery('simple', %s)",
+            f"ts_rank({self.table}.document, to_tsquery('simple', %s))",
+            expression,
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    return BACKENDS.get(connection.vendor, SearchBackend)(connection)
+
+
+def search(queryset, query):
+    """Filter ``queryset`` to rows matching every term of ``query``, best matches first"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_search_backend(queryset.db).filter(queryset, terms)
+
+
+def index_instances(model, instances, using=DEFAULT_DB_ALIAS):
+    """Write (or rewrite) the documents for saved ``instances``"""
+    fields = SEARCHABLE_FIELDS[model]
+    backend = get_search_backend(using)
+    rows = [(obj.pk, document_body(getattr(obj, field) for field in fields)) for obj in instances]
+    backend.delete(model, [pk for pk, _ in rows])
+    backend.insert(model, rows)
+
+
+def remove_instances(model, pks, using=DEFAULT_DB_ALIAS):
+    get_search_backend(using).delete(model, pks)
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """Repopulate every document from the entity tables. Returns the document count."""
+    backend = get_search_backend(using)
+    count = 0
+    with transaction.atomic(using=using):
+        backend.clear()
+        for model, fields in SEARCHABLE_FIELDS.items():
+            batch = []
+            for pk, *values in model.objects.using(using).order_by().values_list('pk', *fields).iterator(
+                chunk_size=REBUILD_BATCH_SIZE
+            ):
+                batch.append((pk, document_body(values)))
+                if len(batch) == REBUILD_BATCH_SIZE:
+                    backend.insert(model, batch)
+                    count += len(batch)
+                    batch = []
+            backend.insert(model, batch)
+            count += len(batch)
+    return count
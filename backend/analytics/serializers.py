@@ -1,5 +1,34 @@
 from rest_framework import serializers
-from .models import Artist, Album, Genre, Track, Customer, Invoice, InvoiceLine
+from .models import Artist, Album, Genre, Track, Customer, CustomerMetrics, Invoice, InvoiceLine
+
+
+def parse_field_list(value):
+    """Split a comma-separated query parameter into a set of names"""
+    return {item.strip() for item in (value or '').split(',') if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Honour ``?fields=`` (a whitelist of top-level fields) and ``?expand=``
+    (opt-in for the heavy nested fields in ``Meta.expandable_fields``, which
+    are left out unless the view sets ``expand_by_default`` in the context).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        expand = parse_field_list(request.query_params.get('expand'))
+        only = parse_field_list(request.query_params.get('fields'))
+        if not self.context.get('expand_by_default'):
+            for name in getattr(self.Meta, 'expandable_fields', []):
+                if name not in expand:
+                    self.fields.pop(name, None)
+        if only:
+            for name in list(self.fields):
+                if name not in only and name not in expand:
+                    self.fields.pop(name)
 
 
 class ArtistSerializer(serializers.ModelSerializer):
@@ -59,7 +88,7 @@ class InvoiceLineSerializer(serializers.ModelSerializer):
         fields = ['invoice_line_id', 'track', 'unit_price', 'quantity', 'total_price']
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     invoice_lines = InvoiceLineSerializer(source='invoiceline_set', many=True, read_only=True)
     
@@ -70,6 +99,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'billing_city', 'billing_state', 'billing_country',
             'billing_postal_code', 'total', 'invoice_lines'
         ]
+        expandable_fields = ['invoice_lines']
 
 
 # Analytics-specific serializers
@@ -79,6 +109,7 @@ class SalesAnalyticsSerializer(serializers.Serializer):
     total_sales = serializers.DecimalField(max_digits=15, decimal_places=2)
     total_orders = serializers.IntegerField()
     average_order_value = serializers.DecimalField(max_digits=10, decimal_places=2)
+    rolling_average = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
 
 
 class GenreAnalyticsSerializer(serializers.Serializer):
@@ -136,6 +167,25 @@ class TopCustomerSerializer(serializers.Serializer):
     total_orders = serializers.IntegerField()
 
 
+class CustomerMetricsSerializer(serializers.ModelSerializer):
+    """Serializer for a customer's lifetime value and RFM scores"""
+    class Meta:
+        model = CustomerMetrics
+        fields = [
+            'customer_id', 'country', 'lifetime_value', 'order_count', 'first_purchase',
+            'last_purchase', 'recency_score', 'frequency_score', 'monetary_score', 'segment'
+        ]
+
+
+class CustomerSegmentSerializer(serializers.Serializer):
+    """Serializer for RFM segment counts"""
+    segment = serializers.CharField()
+    customer_count = serializers.IntegerField()
+    lifetime_value = serializers.DecimalField(max_digits=15, decimal_places=2)
+    average_customer_value = serializers.DecimalField(max_digits=15, decimal_places=2)
+    average_orders = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
 class DashboardSummarySerializer(serializers.Serializer):
     """Serializer for dashboard summary data"""
     total_customers = serializers.IntegerField()
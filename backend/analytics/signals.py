@@ -0,0 +1,161 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import catalog_index
+from .cache import TRACKED_MODELS, bump_versions_on_commit
+from .cube import REWRITES_VERSION
+from .customer_metrics import record_invoice, refresh_customer, sync_customer_country
+from .facts import record_line, refresh_invoice_tracks, refresh_track, sync_track_dimensions
+from .models import Album, Artist, Customer, Invoice, InvoiceLine, Track, TrackSales
+from .rollups import invoice_day, refresh_day
+from .search import SEARCHABLE_FIELDS, index_instances, remove_instances
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_day(sender, instance, raw=False, **kwargs):
+    """Remember the stored date and customer so a moved invoice updates both sides"""
+    instance._rollup_previous_day = instance._metrics_previous_customer = instance._sales_previous_date = None
+    if raw or instance.pk is None:
+        return
+    previous = Invoice.objects.filter(pk=instance.pk).values_list('invoice_date', 'customer_id').first()
+    if previous:
+        instance._rollup_previous_day = invoice_day(previous[0])
+        instance._sales_previous_date = previous[0]
+        instance._metrics_previous_customer = previous[1]
+
+
+@receiver(post_save, sender=Invoice)
+def update_sales_rollups(sender, instance, raw=False, **kwargs):
+    """Keep sales rollups in sync with invoice writes (loaddata uses the backfill command)"""
+    if raw:
+        return
+    days = {invoice_day(instance.invoice_date), getattr(instance, '_rollup_previous_day', None)}
+    for day in days - {None}:
+        refresh_day(day)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    refresh_day(invoice_day(instance.invoice_date))
+
+
+@receiver(post_save, sender=Invoice)
+def update_customer_metrics(sender, instance, created, raw=False, **kwargs):
+    """Inserts increment the customer's metrics row; edits recompute it"""
+    if raw:
+        return
+    if created:
+        record_invoice(instance)
+        return
+    previous = getattr(instance, '_metrics_previous_customer', None)
+    for customer_id in {instance.customer_id, previous} - {None}:
+        refresh_customer(customer_id)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_from_customer_metrics(sender, instance, **kwargs):
+    refresh_customer(instance.customer_id)
+
+
+@receiver(post_save, sender=Customer)
+def update_customer_metrics_country(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        sync_customer_country(instance)
+
+
+@receiver(post_save, sender=Invoice)
+def update_track_sales_dates(sender, instance, created, raw=False, **kwargs):
+    """A moved invoice can change the last sale date of every track on it"""
+    if raw or created:
+        return
+    previous = getattr(instance, '_sales_previous_date', None)
+    if previous is not None and previous != instance.invoice_date:
+        refresh_invoice_tracks(instance.pk)
+
+
+@receiver(pre_save, sender=InvoiceLine)
+def remember_line_track(sender, instance, raw=False, **kwargs):
+    """Remember the stored track so re-pointing a line refreshes both tracks"""
+    instance._sales_previous_track = None
+    if raw or instance.pk is None:
+        return
+    instance._sales_previous_track = InvoiceLine.objects.filter(
+        pk=instance.pk
+    ).values_list('track_id', flat=True).first()
+
+
+@receiver(post_save, sender=InvoiceLine)
+def update_track_sales(sender, instance, created, raw=False, **kwargs):
+    """Inserts increment the track's sales row; edits recompute it"""
+    if raw:
+        return
+    previous = getattr(instance, '_sales_previous_track', None)
+    if created and previous is None:
+        record_line(instance)
+        return
+    for track_id in {instance.track_id, previous} - {None}:
+        refresh_track(track_id)
+
+
+@receiver(post_delete, sender=InvoiceLine)
+def remove_from_track_sales(sender, instance, **kwargs):
+    refresh_track(instance.track_id)
+
+
+@receiver(post_save, sender=Track)
+def update_track_sales_dimensions(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        sync_track_dimensions(instance)
+
+
+@receiver(post_save, sender=Album)
+def update_album_sales_dimensions(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        TrackSales.objects.filter(album_id=instance.pk).update(artist_id=instance.artist_id)
+
+
+def update_search_document(sender, instance, **kwargs):
+    index_instances(sender, [instance], using=instance._state.db)
+
+
+def remove_search_document(sender, instance, **kwargs):
+    remove_instances(sender, [instance.pk], using=instance._state.db)
+
+
+for model in SEARCHABLE_FIELDS:
+    post_save.connect(update_search_document, sender=model, dispatch_uid=f'analytics_search_{model.__name__}_save')
+    post_delete.connect(remove_search_document, sender=model, dispatch_uid=f'analytics_search_{model.__name__}_delete')
+
+
+def update_autocomplete_entry(sender, instance, **kwargs):
+    label = instance.title if sender is Album else instance.name
+    composer = instance.composer if sender is Track else None
+    kind, pk = sender._meta.model_name, instance.pk
+    transaction.on_commit(lambda: catalog_index.update(kind, pk, label, composer))
+
+
+def remove_autocomplete_entry(sender, instance, **kwargs):
+    kind, pk = sender._meta.model_name, instance.pk
+    transaction.on_commit(lambda: catalog_index.remove(kind, pk))
+
+
+for model in (Artist, Album, Track):
+    post_save.connect(update_autocomplete_entry, sender=model, dispatch_uid=f'analytics_autocomplete_{model.__name__}_save')
+    post_delete.connect(remove_autocomplete_entry, sender=model, dispatch_uid=f'analytics_autocomplete_{model.__name__}_delete')
+
+
+def expire_cached_responses(sender, created=False, raw=False, **kwargs):
+    """
+    Invalidate responses that depend on ``sender`` when the write commits.
+    Inserts reach the sales cube at its next refresh; other writes make it reload.
+    """
+    labels = [sender._meta.label_lower]
+    if not created and not raw:
+        labels.append(REWRITES_VERSION)
+    bump_versions_on_commit(*labels)
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(expire_cached_responses, sender=model, dispatch_uid=f'analytics_cache_{model.__name__}_save')
+    post_delete.connect(expire_cached_responses, sender=model, dispatch_uid=f'analytics_cache_{model.__name__}_delete')
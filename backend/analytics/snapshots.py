@@ -0,0 +1,216 @@
+"""
+Columnar snapshots of the sales star schema.
+
+``write_snapshot`` dumps Artist, Genre, Album, Track, Customer, Invoice and
+InvoiceLine as Parquet (or Arrow IPC) files under ``settings.SNAPSHOT_ROOT``,
+one directory per table so each can be read as a dataset::
+
+    SNAPSHOT_ROOT/
+        manifest.json
+        invoice/part-20240101T000000Z.parquet
+        invoice/part-20240108T000000Z.parquet   (incremental)
+        artist/part-20240108T000000Z.parquet
+
+All tables are read in one read-only transaction (REPEATABLE READ on
+PostgreSQL), so the files agree with each other, and rows stream through
+server-side cursors ``SNAPSHOT_ROW_GROUP_SIZE`` at a time, one row group
+per chunk. Incremental snapshots append a part holding only invoices (and
+their lines) past the manifest's ``invoice_id`` watermark, unless the
+invoices and lines up to it no longer match the row counts already written
+(late commits with lower ids, deletes), in which case they write a full
+snapshot; the small dimension tables are always rewritten in full. Snapshots hold an exclusive
+lock on ``SNAPSHOT_ROOT/.snapshot.lock`` from reading the previous manifest
+to removing unlisted parts, so concurrent runs take turns instead of
+overwriting each other's manifest or deleting each other's parts.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .exports import arrow_batch, arrow_schema, chunked, pyarrow
+from .models import Album, Artist, Customer, Genre, Invoice, InvoiceLine, Track
+
+if pyarrow is not None:
+    import pyarrow.ipc
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+DIMENSION_MODELS = (Artist, Genre, Album, Track, Customer)
+FACT_MODELS = (Invoice, InvoiceLine)
+SNAPSHOT_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+MANIFEST = 'manifest.json'
+LOCK_FILE = '.snapshot.lock'
+
+# Serializes snapshots within a process; the file lock covers other processes
+_local_lock = threading.Lock()
+
+
+class SnapshotError(Exception):
+    """A snapshot that cannot be written as requested"""
+
+
+def table_name(model):
+    return model._meta.model_name
+
+
+def snapshot_root():
+    return Path(settings.SNAPSHOT_ROOT)
+
+
+def read_manifest():
+    """The latest snapshot's manifest, or None before the first snapshot"""
+    try:
+        with open(snapshot_root() / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def snapshot_lock(root):
+    """Hold the exclusive snapshot lock for ``root`` (blocks until it is free)"""
+    root.mkdir(parents=True, exist_ok=True)
+    with _local_lock, open(root / LOCK_FILE, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def check_format(file_format):
+    """Raise SnapshotError unless snapshots in ``file_format`` can be written here"""
+    if pyarrow is None:
+        raise SnapshotError('Snapshots require the pyarrow package')
+    if file_format not in SNAPSHOT_FORMATS:
+        raise SnapshotError(f'Unsupported format: {file_format}. Choose from {", ".join(SNAPSHOT_FORMATS)}')
+
+
+def _write_atomic(path, write):
+    temporary = path.with_name(f'.{path.name}.tmp')
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def _write_table(path, queryset, file_format):
+    """Stream ``queryset``'s concrete columns into ``path``; return the rows written"""
+    columns = [field.attname for field in queryset.model._meta.concrete_fields]
+    schema = arrow_schema(queryset.model, columns, columns)
+    size = settings.SNAPSHOT_ROW_GROUP_SIZE
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=size)
+    written = 0
+
+    def write(target):
+        nonlocal written
+        if file_format == 'parquet':
+            writer = pyarrow.parquet.ParquetWriter(str(target), schema)
+        else:
+            writer = pyarrow.ipc.new_file(str(target), schema)
+        with writer:
+            for chunk in chunked(rows, size):
+                writer.write_batch(arrow_batch(schema, chunk))
+                written += len(chunk)
+
+    _write_atomic(path, write)
+    return written
+
+
+def write_snapshot(file_format='parquet', incremental=False):
+    """
+    Write a snapshot and return its manifest.
+
+    ``incremental`` appends only invoices newer than the previous snapshot's
+    watermark; it falls back to a full snapshot when there is none, or when
+    the previous snapshot used another format.
+    """
+    check_format(file_format)
+    with snapshot_lock(snapshot_root()):
+        return _write_snapshot(file_format, incremental)
+
+
+def _write_snapshot(file_format, incremental):
+    previous = read_manifest()
+    if not (incremental and previous and previous['format'] == file_format):
+        previous, incremental = None, False
+    watermark = previous['watermark'] if previous else 0
+    root = snapshot_root()
+    run_id = timezone.now().strftime('%Y%m%dT%H%M%S%fZ')
+    part = f'part-{run_id}.{SNAPSHOT_FORMATS[file_format]}'
+
+    tables = {}
+    # Postgres only honours the isolation level as the transaction's first statement
+    repeatable_read = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if repeatable_read:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        if previous and not _previous_rows_match(previous):
+            previous, incremental, watermark = None, False, 0
+        high_water = Invoice.objects.aggregate(high=Max('invoice_id'))['high'] or watermark
+        for model in DIMENSION_MODELS + FACT_MODELS:
+            queryset = model._default_manager.all()
+            if model in FACT_MODELS:
+                queryset = queryset.filter(invoice_id__gt=watermark, invoice_id__lte=high_water)
+            directory = root / table_name(model)
+            directory.mkdir(parents=True, exist_ok=True)
+            rows = _write_table(directory / part, queryset, file_format)
+            if model in FACT_MODELS and previous:
+                earlier = previous['tables'][table_name(model)]
+                if rows:
+                    tables[table_name(model)] = {'parts': earlier['parts'] + [part], 'rows': earlier['rows'] + rows}
+                else:
+                    (directory / part).unlink()
+                    tables[table_name(model)] = earlier
+            else:
+                tables[table_name(model)] = {'parts': [part], 'rows': rows}
+
+    manifest = {
+        'snapshot_id': run_id,
+        'created_at': timezone.now().isoformat(),
+        'format': file_format,
+        'mode': 'incremental' if incremental else 'full',
+        'watermark': high_water,
+        'tables': tables,
+    }
+    _write_atomic(root / MANIFEST, lambda target: target.write_text(json.dumps(manifest, indent=2)))
+    _remove_unlisted_parts(root, manifest)
+    return manifest
+
+
+def _previous_rows_match(previous):
+    """
+    Whether the facts up to the previous watermark are still the rows it
+    wrote. Ids are not assigned in commit order on PostgreSQL, so an invoice
+    can commit after a snapshot with an id below its watermark; that (or a
+    delete) changes the counts and the next snapshot is written in full.
+    """
+    for model in FACT_MODELS:
+        rows = model._default_manager.filter(invoice_id__lte=previous['watermark']).count()
+        if rows != previous['tables'][table_name(model)]['rows']:
+            return False
+    return True
+
+
+def _remove_unlisted_parts(root, manifest):
+    """Delete part files the new manifest no longer references (replaced dimensions, old full snapshots)"""
+    for name, table in manifest['tables'].items():
+        keep = set(table['parts'])
+        for path in (root / name).glob('part-*'):
+            if path.name not in keep:
+                path.unlink()
@@ -0,0 +1,20 @@
+from .budgets import QueryBudgetExceeded, request_allowance
+
+
+class QueryBudgetTestMixin:
+    """
+    Assertions for the per-request stats QueryBudgetMiddleware attaches to
+    ``response.wsgi_request``.
+    """
+
+    def assertWithinQueryBudget(self, response):
+        request = response.wsgi_request
+        budget = getattr(request, 'query_budget', None)
+        self.assertIsNotNone(budget, f'{request.path} declares no query budget')
+        problems = budget.violations(request.query_stats, request_allowance(request))
+        if problems:
+            raise QueryBudgetExceeded(f'{request.path}: {", ".join(problems)}')
+
+    def assertMaxQueries(self, response, max_queries):
+        count = response.wsgi_request.query_stats.count
+        self.assertLessEqual(count, max_queries, f'{response.wsgi_request.path} ran {count} queries')
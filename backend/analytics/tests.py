@@ -1,8 +1,48 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from collections import defaultdict
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Count, F, Sum
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Artist, Genre, Track, Customer, Invoice
+from audit.models import AuditLog
+from reports.models import GeneratedReport
+from users.models import UserProfile
+from .models import (
+    Artist, Album, CacheVersion, Genre, Track, Customer, CustomerMetrics, Invoice, InvoiceLine, SalesRollup,
+    TrackSales
+)
+from .budgets import QueryBudget, QueryBudgetExceeded
+from .rollups import start_of_day
+from .sampling import id_range, random_sample
+from .customer_metrics import rescore_customer_metrics, score_customer
+from .search import IndexedSearchBackend, SearchBackend, search
+from .autocomplete import catalog_index
+from .cache import invalidate_model
+from .exports import export_formats, pyarrow
+from .cube import np as numpy, record_rewrite, sales_cube
+from .management.commands.benchmark_endpoints import Command as BenchmarkCommand, benchmark_client, fetch
+from .management.commands.load_chinook import iter_rows
+from .snapshots import read_manifest, snapshot_lock, snapshot_root
+from .testing import QueryBudgetTestMixin
+from .views import AnalyticsViewSet
 
 
 class AnalyticsModelTests(TestCase):
@@ -43,3 +83,1449 @@ class AnalyticsAPITests(APITestCase):
         self.assertIn('total_customers', response.data)
         self.assertIn('total_tracks', response.data)
         self.assertIn('total_artists', response.data)
+
+
+class SalesRollupTests(APITestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        self.today = timezone.localdate()
+        for days_ago, total in [(400, '10.00'), (40, '5.50'), (40, '4.50'), (3, '2.00'), (0, '1.99')]:
+            self.create_invoice(self.today - timedelta(days=days_ago), total)
+
+    def create_invoice(self, day, total):
+        return Invoice.objects.create(
+            customer=self.customer,
+            invoice_date=start_of_day(day) + timedelta(hours=12),
+            total=Decimal(total)
+        )
+
+    def rollup(self, granularity, day):
+        return SalesRollup.objects.get(granularity=granularity, period_start=day)
+
+    def test_rollups_follow_invoice_writes(self):
+        day = self.today - timedelta(days=40)
+        self.assertEqual(self.rollup('day', day).total_sales, Decimal('10.00'))
+        self.assertEqual(self.rollup('day', day).total_orders, 2)
+
+        invoice = Invoice.objects.filter(invoice_date__date=day).first()
+        invoice.invoice_date = invoice.invoice_date - timedelta(days=1)
+        invoice.save()
+        self.assertEqual(self.rollup('day', day).total_orders, 1)
+        self.assertEqual(self.rollup('day', day - timedelta(days=1)).total_orders, 1)
+
+        invoice.delete()
+        self.assertFalse(SalesRollup.objects.filter(granularity='day', period_start=day - timedelta(days=1)).exists())
+        year = self.rollup('year', day.replace(month=1, day=1))
+        expected = Invoice.objects.filter(invoice_date__year=day.year)
+        self.assertEqual(year.total_orders, expected.count())
+
+    def test_rebuild_command_matches_incremental_rollups(self):
+        incremental = sorted(SalesRollup.objects.values_list('granularity', 'period_start', 'total_sales', 'total_orders'))
+        SalesRollup.objects.all().delete()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        rebuilt = sorted(SalesRollup.objects.values_list('granularity', 'period_start', 'total_sales', 'total_orders'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_sales_overview_matches_raw_invoices(self):
+        start = self.today - timedelta(days=45)
+        response = self.client.get(reverse('analytics-sales-overview'), {'start_date': start.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        expected = {}
+        for invoice in Invoice.objects.filter(invoice_date__gte=start_of_day(start)):
+            period = timezone.localdate(invoice.invoice_date).strftime('%Y-%m')
+            sales, orders = expected.get(period, (Decimal('0'), 0))
+            expected[period] = (sales + invoice.total, orders + 1)
+        actual = {
+            item['period']: (Decimal(item['total_sales']), item['total_orders'])
+            for item in response.data
+        }
+        self.assertEqual(actual, expected)
+
+    def test_sales_overview_rejects_invalid_dates(self):
+        response = self.client.get(reverse('analytics-sales-overview'), {'start_date': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_yearly_comparison_includes_today(self):
+        response = self.client.get(reverse('analytics-yearly-comparison'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(item['total_orders'] for item in response.data), Invoice.objects.count())
+        self.assertEqual(sum(item['total_sales'] for item in response.data), Decimal('23.99'))
+
+
+class SalesOverviewTests(APITestCase):
+    def setUp(self):
+        caches['analytics'].clear()
+        customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        for stamp, total in [('2020-01-06 12:00', '10.00'), ('2020-01-08 12:00', '5.00'),
+                             ('2020-01-27 23:30', '3.00'), ('2020-03-02 12:00', '2.00')]:
+            Invoice.objects.create(
+                customer=customer, invoice_date=timezone.make_aware(timezone.datetime.fromisoformat(stamp)),
+                total=Decimal(total)
+            )
+        self.url = reverse('analytics-sales-overview')
+
+    def series(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['period'], Decimal(row['total_sales']), row['total_orders']) for row in response.data]
+
+    def test_weeks_and_quarters_are_gap_filled(self):
+        self.assertEqual(self.series(granularity='week', start_date='2020-01-06', end_date='2020-01-31'), [
+            ('2020-W02', Decimal('15.00'), 2), ('2020-W03', Decimal('0'), 0),
+            ('2020-W04', Decimal('0'), 0), ('2020-W05', Decimal('3.00'), 1),
+        ])
+        self.assertEqual(self.series(granularity='quarter', start_date='2020-01-01', end_date='2020-12-31'), [
+            ('2020-Q1', Decimal('20.00'), 4), ('2020-Q2', Decimal('0'), 0),
+            ('2020-Q3', Decimal('0'), 0), ('2020-Q4', Decimal('0'), 0),
+        ])
+        self.assertEqual([period for period, _, _ in self.series()], ['2020-01', '2020-02', '2020-03'])
+
+    def test_rolling_average_reaches_back_before_the_range(self):
+        response = self.client.get(self.url, {'start_date': '2020-02-01', 'end_date': '2020-03-31', 'rolling': 2})
+        self.assertEqual([(row['period'], row['rolling_average']) for row in response.data],
+                         [('2020-02', '9.00'), ('2020-03', '1.00')])
+        response = self.client.get(self.url, {'granularity': 'month', 'rolling': 3})
+        self.assertEqual([row['rolling_average'] for row in response.data], [None, None, '6.67'])
+        self.assertNotIn('rolling_average', self.client.get(self.url).data[0])
+
+    def test_rolling_lookback_leaves_a_partial_first_period(self):
+        params = {'start_date': '2020-01-15', 'end_date': '2020-03-31'}
+        self.assertEqual(self.series(**params)[0], ('2020-01', Decimal('3.00'), 1))
+        response = self.client.get(self.url, {**params, 'rolling': 3})
+        self.assertEqual([(row['period'], row['total_sales'], row['rolling_average']) for row in response.data], [
+            ('2020-01', '3.00', '1.00'), ('2020-02', '0.00', '1.00'), ('2020-03', '2.00', '1.67'),
+        ])
+
+    def test_buckets_follow_the_profile_timezone(self):
+        params = {'granularity': 'day', 'start_date': '2020-01-27', 'end_date': '2020-01-28'}
+        self.assertEqual(self.series(**params), [
+            ('2020-01-27', Decimal('3.00'), 1), ('2020-01-28', Decimal('0'), 0),
+        ])
+        user = get_user_model().objects.create_user(email='nz@example.com', username='nz', password='pass12345')
+        UserProfile.objects.create(user=user, timezone='Pacific/Auckland')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.series(**params), [
+            ('2020-01-27', Decimal('0'), 0), ('2020-01-28', Decimal('3.00'), 1),
+        ])
+        self.assertEqual(self.series(granularity='week', start_date='2020-01-06', end_date='2020-01-12')[0][1:],
+                         (Decimal('15.00'), 2))
+
+    def test_invalid_parameters(self):
+        for params in ({'granularity': 'hour'}, {'rolling': 'two'}, {'rolling': 500},
+                       {'granularity': 'day', 'start_date': '2000-01-01', 'end_date': '2030-01-01'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TrackSalesTests(APITestCase):
+    def setUp(self):
+        self.genre = Genre.objects.create(name="Rock")
+        self.artist = Artist.objects.create(name="Band")
+        self.album = Album.objects.create(title="Record", artist=self.artist)
+        self.tracks = [
+            Track.objects.create(
+                name=f"Song {i}", album=self.album, genre=self.genre,
+                media_type_id=1, milliseconds=200000, unit_price=Decimal('0.99')
+            )
+            for i in range(3)
+        ]
+        customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        self.invoice = Invoice.objects.create(customer=customer, invoice_date=timezone.now(), total=Decimal('0'))
+
+    def add_line(self, track, quantity, unit_price='0.99'):
+        return InvoiceLine.objects.create(
+            invoice=self.invoice, track=track, unit_price=Decimal(unit_price), quantity=quantity
+        )
+
+    def test_lines_increment_track_sales(self):
+        self.add_line(self.tracks[0], 2)
+        self.add_line(self.tracks[0], 1, '1.99')
+        sales = TrackSales.objects.get(track=self.tracks[0])
+        self.assertEqual(sales.quantity_sold, 3)
+        self.assertEqual(sales.revenue, Decimal('3.97'))
+        self.assertEqual(sales.artist_id, self.artist.artist_id)
+        self.assertEqual(sales.genre_id, self.genre.genre_id)
+        self.assertEqual(sales.last_sale_date, self.invoice.invoice_date)
+
+    def test_line_edits_and_deletes_recompute_track_sales(self):
+        line = self.add_line(self.tracks[0], 2)
+        line.track = self.tracks[1]
+        line.save()
+        self.assertFalse(TrackSales.objects.filter(track=self.tracks[0]).exists())
+        self.assertEqual(TrackSales.objects.get(track=self.tracks[1]).quantity_sold, 2)
+        line.delete()
+        self.assertFalse(TrackSales.objects.exists())
+
+    def test_invoice_date_changes_recompute_last_sale_date(self):
+        self.add_line(self.tracks[0], 1)
+        self.add_line(self.tracks[1], 1)
+        self.invoice.invoice_date -= timedelta(days=30)
+        self.invoice.save()
+        for track in self.tracks[:2]:
+            self.assertEqual(TrackSales.objects.get(track=track).last_sale_date, self.invoice.invoice_date)
+
+    def test_rebuild_command_matches_incremental_facts(self):
+        self.add_line(self.tracks[0], 2)
+        self.add_line(self.tracks[1], 1)
+        fields = ('track', 'album', 'artist', 'genre', 'quantity_sold', 'revenue', 'last_sale_date')
+        incremental = sorted(TrackSales.objects.values_list(*fields))
+        call_command('rebuild_track_sales', stdout=StringIO())
+        self.assertEqual(sorted(TrackSales.objects.values_list(*fields)), incremental)
+
+    def test_top_tracks_reads_track_sales(self):
+        self.add_line(self.tracks[2], 5)
+        self.add_line(self.tracks[1], 1)
+        response = self.client.get(reverse('track-top-tracks'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['track_id'] for item in response.data],
+                         [self.tracks[2].track_id, self.tracks[1].track_id])
+        self.assertEqual(response.data[0]['total_sold'], 5)
+
+
+class CustomerMetricsTests(APITestCase):
+    def setUp(self):
+        caches['analytics'].clear()
+        self.now = timezone.now()
+        self.customers = [
+            Customer.objects.create(first_name=f"Customer{i}", last_name="Doe", email=f"c{i}@example.com", country="Norway")
+            for i in range(5)
+        ]
+
+    def buy(self, customer, total, days_ago=0):
+        return Invoice.objects.create(
+            customer=customer, invoice_date=self.now - timedelta(days=days_ago), total=Decimal(total)
+        )
+
+    def test_invoices_increment_customer_metrics(self):
+        self.buy(self.customers[0], '3.00', days_ago=10)
+        self.buy(self.customers[0], '2.50', days_ago=1)
+        metrics = CustomerMetrics.objects.get(customer=self.customers[0])
+        self.assertEqual(metrics.lifetime_value, Decimal('5.50'))
+        self.assertEqual(metrics.order_count, 2)
+        self.assertEqual(metrics.first_purchase, self.now - timedelta(days=10))
+        self.assertEqual(metrics.last_purchase, self.now - timedelta(days=1))
+        self.assertEqual(metrics.country, "Norway")
+
+    def test_edits_and_deletes_recompute_customer_metrics(self):
+        invoice = self.buy(self.customers[0], '3.00')
+        invoice.customer = self.customers[1]
+        invoice.total = Decimal('4.00')
+        invoice.save()
+        self.assertFalse(CustomerMetrics.objects.filter(customer=self.customers[0]).exists())
+        self.assertEqual(CustomerMetrics.objects.get(customer=self.customers[1]).lifetime_value, Decimal('4.00'))
+        self.customers[1].country = "Sweden"
+        self.customers[1].save()
+        self.assertEqual(CustomerMetrics.objects.get(customer=self.customers[1]).country, "Sweden")
+        invoice.delete()
+        self.assertFalse(CustomerMetrics.objects.exists())
+
+    def test_scores_rank_customers_into_quintiles(self):
+        for i, customer in enumerate(self.customers):
+            for _ in range(i + 1):
+                self.buy(customer, f'{i + 1}.00', days_ago=50 - 10 * i)
+        call_command('rebuild_customer_metrics', '--rescore-only', stdout=StringIO())
+        scores = list(CustomerMetrics.objects.order_by('lifetime_value').values_list(
+            'recency_score', 'frequency_score', 'monetary_score', 'segment'
+        ))
+        self.assertEqual(scores, [
+            (1, 1, 1, 'hibernating'), (2, 2, 2, 'about_to_sleep'), (3, 3, 3, 'loyal'),
+            (4, 4, 4, 'champions'), (5, 5, 5, 'champions'),
+        ])
+        # The latest customer was scored incrementally against the others already
+        self.assertEqual(CustomerMetrics.objects.get(customer=self.customers[4]).segment, 'champions')
+
+    def test_single_customers_are_scored_against_saved_thresholds(self):
+        for i, customer in enumerate(self.customers):
+            for _ in range(i + 1):
+                self.buy(customer, f'{i + 1}.00', days_ago=50 - 10 * i)
+        call_command('rebuild_customer_metrics', '--rescore-only', stdout=StringIO())
+        ranked = dict(CustomerMetrics.objects.values_list('customer_id', 'segment'))
+        CustomerMetrics.objects.update(recency_score=1, frequency_score=1, monetary_score=1, segment='hibernating')
+        for customer in self.customers:
+            score_customer(customer.pk)
+        self.assertEqual(dict(CustomerMetrics.objects.values_list('customer_id', 'segment')), ranked)
+
+        # An invoice rescores its customer without ranking the whole table
+        with CaptureQueriesContext(connection) as queries:
+            self.buy(self.customers[0], '9.00')
+        rankings = [query for query in queries if 'COUNT(' in query['sql'] and '"CustomerMetrics"' in query['sql']]
+        self.assertEqual(rankings, [])
+        self.assertEqual(CustomerMetrics.objects.get(customer=self.customers[0]).recency_score, 5)
+
+    def test_rebuild_command_matches_incremental_metrics(self):
+        for i, customer in enumerate(self.customers[:3]):
+            self.buy(customer, '1.99', days_ago=i)
+            self.buy(customer, '0.99', days_ago=i + 5)
+        call_command('rebuild_customer_metrics', '--rescore-only', stdout=StringIO())
+        fields = ('customer', 'country', 'lifetime_value', 'order_count', 'first_purchase', 'last_purchase',
+                  'recency_score', 'frequency_score', 'monetary_score', 'segment')
+        incremental = sorted(CustomerMetrics.objects.values_list(*fields))
+        call_command('rebuild_customer_metrics', stdout=StringIO())
+        self.assertEqual(sorted(CustomerMetrics.objects.values_list(*fields)), incremental)
+
+    def test_segment_endpoints_read_the_metrics_table(self):
+        for i, customer in enumerate(self.customers):
+            for _ in range(i + 1):
+                self.buy(customer, f'{i + 1}.00', days_ago=50 - 10 * i)
+        call_command('rebuild_customer_metrics', '--rescore-only', stdout=StringIO())
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('customer-segments'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts = {row['segment']: row['customer_count'] for row in response.data}
+        self.assertEqual(counts['champions'], 2)
+        self.assertEqual(counts['new'], 0)
+        self.assertEqual(sum(counts.values()), 5)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('customer-segment-top'), {'limit': 1})
+        top = {row['segment']: row['customers'] for row in response.data}
+        self.assertEqual([row['customer_id'] for row in top['champions']], [self.customers[4].customer_id])
+        self.assertEqual(top['champions'][0]['lifetime_value'], '25.00')
+
+        response = self.client.get(reverse('customer-segment-top'), {'segment': 'champions'})
+        self.assertEqual([row['customer_id'] for row in response.data[0]['customers']],
+                         [self.customers[4].customer_id, self.customers[3].customer_id])
+        response = self.client.get(reverse('customer-segment-top'), {'segment': 'whales'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_scheduler_rescores_and_refreshes_cached_segments(self):
+        for i, customer in enumerate(self.customers):
+            for _ in range(i + 1):
+                self.buy(customer, f'{i + 1}.00', days_ago=50 - 10 * i)
+
+        def segment_counts():
+            response = self.client.get(reverse('customer-segments'))
+            return {row['segment']: row['customer_count'] for row in response.data}
+
+        # Before the first full ranking there are no thresholds, so every row scores 1
+        self.assertEqual(segment_counts()['about_to_sleep'], 0)
+        out = StringIO()
+        call_command('run_report_scheduler', once=True, stdout=out)
+        self.assertIn('Rescored', out.getvalue())
+        self.assertEqual(segment_counts()['about_to_sleep'], 1)
+
+    def test_top_customers_and_country_analysis_read_the_metrics_table(self):
+        self.buy(self.customers[0], '3.00')
+        self.buy(self.customers[1], '5.00')
+        self.buy(self.customers[1], '1.00')
+        response = self.client.get(reverse('customer-top-customers'))
+        self.assertEqual([row['customer_id'] for row in response.data],
+                         [self.customers[1].customer_id, self.customers[0].customer_id])
+        self.assertEqual(response.data[0]['total_orders'], 2)
+        response = self.client.get(reverse('analytics-country-analysis'))
+        self.assertEqual(response.data[0]['customer_count'], 2)
+        self.assertEqual(Decimal(response.data[0]['average_customer_value']), Decimal('4.50'))
+
+
+class CatalogRevenueRegressionTests(APITestCase):
+    """Compare catalog rankings against a brute-force pass over the seeded invoice lines"""
+
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(1234)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        self.quantity = defaultdict(int)
+        self.revenue = {'track': defaultdict(Decimal), 'album': defaultdict(Decimal),
+                        'artist': defaultdict(Decimal), 'genre': defaultdict(Decimal)}
+        for line in InvoiceLine.objects.select_related('track__album'):
+            revenue = line.unit_price * line.quantity
+            self.quantity[line.track_id] += line.quantity
+            self.revenue['track'][line.track_id] += revenue
+            self.revenue['album'][line.track.album_id] += revenue
+            self.revenue['artist'][line.track.album.artist_id] += revenue
+            self.revenue['genre'][line.track.genre_id] += revenue
+
+    def expected_top(self, dimension, limit=10):
+        totals = self.revenue[dimension]
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def test_line_revenue_adds_up_to_invoice_totals(self):
+        total_lines = sum(self.revenue['track'].values())
+        total_invoices = sum(Invoice.objects.values_list('total', flat=True))
+        self.assertEqual(total_lines, total_invoices)
+        self.assertEqual(sum(self.revenue['genre'].values()), total_invoices)
+
+    def test_top_artists(self):
+        response = self.client.get(reverse('artist-top-artists'))
+        actual = [(item['artist_id'], item['total_sales']) for item in response.data]
+        self.assertEqual(actual, self.expected_top('artist'))
+
+    def test_top_albums(self):
+        response = self.client.get(reverse('album-top-albums'))
+        actual = [(item['album_id'], item['total_sales']) for item in response.data]
+        self.assertEqual(actual, self.expected_top('album'))
+
+    def test_top_tracks(self):
+        response = self.client.get(reverse('track-top-tracks'))
+        expected = sorted(self.quantity.items(), key=lambda item: (-item[1], item[0]))[:10]
+        actual = [(item['track_id'], item['total_sold']) for item in response.data]
+        self.assertEqual(actual, expected)
+        for item in response.data:
+            self.assertEqual(item['total_revenue'], self.revenue['track'][item['track_id']])
+
+    def test_genre_analysis(self):
+        response = self.client.get(reverse('analytics-genre-analysis'))
+        names = dict(Genre.objects.values_list('genre_id', 'name'))
+        expected = [(names[genre_id], total) for genre_id, total in self.expected_top('genre', limit=None)]
+        actual = [(item['genre_name'], Decimal(item['total_sales'])) for item in response.data]
+        self.assertEqual(actual, expected)
+
+    def test_sql_revenue_expression_matches_python(self):
+        totals = dict(
+            Track.objects.values_list('track_id').annotate(
+                revenue=Sum(InvoiceLine.revenue_expression('invoiceline__'))
+            ).filter(revenue__isnull=False)
+        )
+        self.assertEqual(totals, dict(self.revenue['track']))
+
+
+class DashboardSummaryTests(APITestCase):
+    def setUp(self):
+        caches['analytics'].clear()
+        self.customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        for total in ('1.98', '3.96', '0.99'):
+            Invoice.objects.create(customer=self.customer, invoice_date=timezone.now(), total=Decimal(total))
+        self.url = reverse('analytics-dashboard-summary')
+
+    def test_summary_uses_two_queries_then_cache(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['total_orders'], 3)
+        self.assertEqual(response.data['total_customers'], 1)
+        self.assertEqual(response.data['total_revenue'], Decimal('6.93'))
+        self.assertEqual(response.data['average_order_value'], Decimal('2.31'))
+        self.assertEqual(len(response.data['recent_orders']), 3)
+        self.assertEqual(response.data['recent_orders'][0]['customer_name'], "Jane Doe")
+
+        with self.assertNumQueries(1):  # the cache version lookup only
+            self.client.get(self.url)
+
+    def test_new_invoice_invalidates_cached_summary(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.objects.create(customer=self.customer, invoice_date=timezone.now(), total=Decimal('1.00'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['total_orders'], 4)
+
+
+class CachedActionTests(APITestCase):
+    def setUp(self):
+        caches['analytics'].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer = Customer.objects.create(
+                first_name="Jane", last_name="Doe", email="jane@example.com", country="Norway"
+            )
+            Invoice.objects.create(customer=self.customer, invoice_date=timezone.now(), total=Decimal('1.98'))
+        self.url = reverse('analytics-country-analysis')
+
+    def test_repeated_requests_are_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):  # the cache version lookup only
+            response = self.client.get(self.url)
+        self.assertEqual(response.data[0]['country'], "Norway")
+
+    def test_query_params_are_normalized(self):
+        url = reverse('analytics-sales-overview')
+        self.client.get(url, {'start_date': '2020-01-01', 'end_date': '2030-01-01'})
+        with self.assertNumQueries(1):  # the cache version lookup only
+            self.client.get(f'{url}?end_date=2030-01-01&start_date=2020-01-01')
+
+    def test_model_writes_invalidate_dependent_responses(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            customer = Customer.objects.create(
+                first_name="Ola", last_name="Nordmann", email="ola@example.com", country="Norway"
+            )
+            Invoice.objects.create(customer=customer, invoice_date=timezone.now(), total=Decimal('3.00'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data[0]['customer_count'], 2)
+
+    def test_writes_bump_versions_once_per_transaction(self):
+        record_rewrite(Invoice)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                invoices = [
+                    Invoice.objects.create(customer=self.customer, invoice_date=timezone.now(), total=Decimal('1.00'))
+                    for _ in range(3)
+                ]
+                invoices[0].total = Decimal('2.00')
+                invoices[0].save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "CacheVersion"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_versions_are_shared_through_the_database(self):
+        url = reverse('analytics-dashboard-summary')
+        self.client.get(url)
+        # Written without signals, as if by another process: this process's cache still answers
+        Invoice.objects.bulk_create([Invoice(customer=self.customer, invoice_date=timezone.now(), total=Decimal('3.00'))])
+        self.assertEqual(self.client.get(url).data['total_orders'], 1)
+        # The other process's version bump reaches this one through the database alone
+        CacheVersion.objects.filter(model='analytics.invoice').update(version=F('version') + 1)
+        self.assertEqual(self.client.get(url).data['total_orders'], 2)
+
+    def test_roles_get_separate_entries(self):
+        self.client.get(self.url)
+        user = get_user_model().objects.create_user(email='user@example.com', username='user', password='pass12345')
+        self.client.force_authenticate(user=user)
+        with self.assertNumQueries(2):  # cache versions, then one aggregate query
+            self.client.get(self.url)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'analytics': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/trackpulse-test-analytics-cache',
+        },
+    })
+    def test_file_based_backend_and_stats(self):
+        caches['analytics'].clear()
+        for _ in range(3):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        admin = get_user_model().objects.create_superuser(email='admin@example.com', username='admin', password='pass12345')
+        self.client.force_authenticate(user=admin)
+        stats = self.client.get(reverse('analytics-cache-stats')).data
+        self.assertEqual(stats['country_analysis'], {'hits': 2, 'misses': 1, 'hit_ratio': 0.6667})
+        caches['analytics'].clear()
+
+
+class IndexBenchmarkTests(TestCase):
+    def test_benchmark_reports_plans_before_and_after(self):
+        Artist.objects.create(name="Test Artist")
+        out = StringIO()
+        call_command('benchmark_indexes', repeat=1, stdout=out)
+        self.assertIn('artist_page_by_name', out.getvalue())
+        # The rolled-back drop must leave the index plan in place
+        self.assertIn('artist_name_idx', Artist.objects.order_by('name').explain())
+
+    def test_refuses_to_run_against_a_live_database(self):
+        with mock.patch('analytics.management.commands.benchmark_indexes.is_test_database', return_value=False):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_indexes', repeat=1, stdout=StringIO())
+
+
+class EndpointBenchmarkTests(TestCase):
+    def setUp(self):
+        caches['analytics'].clear()
+        customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        for _ in range(6):
+            Invoice.objects.create(customer=customer, invoice_date=timezone.now(), total=Decimal('1.98'))
+        get_user_model().objects.create_superuser(email='benchmark@example.com', username='benchmark', password='pass12345')
+
+    def test_streamed_bodies_are_read_inside_the_measurement(self):
+        route = ('invoice-export', reverse('invoice-export'), {})
+        with mock.patch('analytics.management.commands.benchmark_endpoints.discover_routes', return_value=[route]):
+            results = BenchmarkCommand(stdout=StringIO()).run_scale({'requests': 2, 'warm_cache': False})
+        self.assertEqual(results['invoice-export']['status'], status.HTTP_200_OK)
+        # The token's user, the cache versions, then the SELECT that only runs while the body is read
+        self.assertEqual(results['invoice-export']['queries'], 3)
+
+    def test_requests_are_authenticated_like_real_clients(self):
+        # Signed-in readers skip the shared cache that anonymous catalog reads use
+        response = fetch(benchmark_client(), reverse('artist-list'), {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_compare_fails_on_regressions(self):
+        route = {'p95_ms': 10.0, 'queries': 2}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'scales': {'1000': {'artist-list': route}}}, f)
+        self.addCleanup(os.remove, f.name)
+        command = BenchmarkCommand(stdout=StringIO())
+        command.compare(f.name, {'scales': {'1000': {'artist-list': {'p95_ms': 12.0, 'queries': 2}}}})
+        for current in ({'p95_ms': 30.0, 'queries': 2}, {'p95_ms': 10.0, 'queries': 3}):
+            with self.subTest(current=current), self.assertRaises(CommandError):
+                command.compare(f.name, {'scales': {'1000': {'artist-list': current}}})
+
+
+class LoadDatasetTests(TestCase):
+    def test_generated_invoices_are_consistent(self):
+        call_command(
+            'generate_load_dataset', customers=20, tracks=50, invoices=300,
+            batch_size=64, seed=3, stdout=StringIO()
+        )
+        self.assertEqual(Invoice.objects.count(), 300)
+        self.assertEqual(Track.objects.count(), 50)
+        for invoice in Invoice.objects.prefetch_related('invoiceline_set')[:50]:
+            self.assertEqual(invoice.total, sum(line.total_price for line in invoice.invoiceline_set.all()))
+        self.assertEqual(
+            sum(SalesRollup.objects.filter(granularity='year').values_list('total_orders', flat=True)), 300
+        )
+        self.assertEqual(
+            sum(TrackSales.objects.values_list('quantity_sold', flat=True)),
+            InvoiceLine.objects.aggregate(quantity=Sum('quantity'))['quantity']
+        )
+
+
+
+    def test_seed_data_is_bulk_inserted_at_scale(self):
+        random.seed(21)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('seed_analytics_data', scale=3, stdout=StringIO(), skip_derived=True)
+        # A few statements per table, not one per row
+        self.assertLess(len(queries), 40)
+        self.assertEqual(Artist.objects.count(), 45)
+        self.assertEqual(Customer.objects.count(), 90)
+        for invoice in Invoice.objects.prefetch_related('invoiceline_set')[:50]:
+            self.assertEqual(invoice.total, sum(line.total_price for line in invoice.invoiceline_set.all()))
+
+        call_command('seed_analytics_data', stdout=StringIO())
+        self.assertEqual(Artist.objects.count(), 45)
+        self.assertEqual(
+            sum(TrackSales.objects.values_list('quantity_sold', flat=True)),
+            InvoiceLine.objects.aggregate(quantity=Sum('quantity'))['quantity']
+        )
+
+class LoadChinookTests(TestCase):
+    def test_parses_statements_line_by_line(self):
+        sql = [
+            "CREATE TABLE artist (artist_id INT NOT NULL);\n",
+            "INSERT INTO artist (artist_id, name) VALUES\n",
+            "    (88, N'Guns N'' Roses'),\n",
+            "    (89, N'Split\n",
+            "Line; (Live)'), (90, NULL);\n",
+            "INSERT INTO invoice (invoice_id, total) VALUES (1, -1.98);\n",
+        ]
+        self.assertEqual(list(iter_rows(sql)), [
+            ('artist', ['artist_id', 'name'], ['88', "Guns N' Roses"]),
+            ('artist', ['artist_id', 'name'], ['89', 'Split\nLine; (Live)']),
+            ('artist', ['artist_id', 'name'], ['90', None]),
+            ('invoice', ['invoice_id', 'total'], ['1', '-1.98']),
+        ])
+
+    def test_loads_the_chinook_sample(self):
+        out = StringIO()
+        call_command('load_chinook', batch_size=500, stdout=out)
+        self.assertEqual(Artist.objects.count(), 275)
+        self.assertEqual(Track.objects.count(), 3503)
+        self.assertEqual(Invoice.objects.count(), 412)
+        self.assertEqual(InvoiceLine.objects.count(), 2240)
+        self.assertEqual(Artist.objects.get(pk=88).name, "Guns N' Roses")
+        invoice = Invoice.objects.get(pk=1)
+        self.assertEqual((invoice.customer_id, invoice.total, invoice.billing_state), (2, Decimal('1.98'), None))
+        self.assertEqual(invoice.invoice_date.isoformat(), '2021-01-01T00:00:00+00:00')
+        cents = Decimal('0.01')
+        self.assertEqual(TrackSales.objects.aggregate(total=Sum('revenue'))['total'].quantize(cents),
+                         Invoice.objects.aggregate(total=Sum('total'))['total'].quantize(cents))
+        self.assertIn('track: 3503 rows', out.getvalue())
+
+        with self.assertRaisesMessage(CommandError, '--flush'):
+            call_command('load_chinook', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            call_command('load_chinook', flush=True, skip_derived=True, stdout=StringIO())
+        self.assertEqual(Invoice.objects.count(), 412)
+        # One DELETE per table instead of per-row deletes and signals
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertLess(len(deletes), 20)
+        self.assertFalse(TrackSales.objects.exists())
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    budgeted_routes = [
+        ('artist-list', {}), ('artist-top-artists', {}), ('album-list', {}), ('album-top-albums', {}),
+        ('genre-list', {}), ('track-list', {}), ('track-top-tracks', {}), ('customer-list', {}),
+        ('customer-top-customers', {}), ('analytics-sales-overview', {}), ('analytics-genre-analysis', {}),
+        ('analytics-country-analysis', {}), ('analytics-dashboard-summary', {}),
+        ('analytics-yearly-comparison', {}), ('track-by-genre', {'genre_id': 1}), ('invoice-list', {}),
+        ('invoice-list', {'expand': 'invoice_lines'}), ('invoice-recent-orders', {}),
+        ('customer-segments', {}), ('customer-segment-top', {}),
+        ('pivot', {'dimensions': 'genre,country,year', 'measures': 'revenue,units,orders,average_order_value'}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(99)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_endpoints_stay_within_their_budgets(self):
+        for name, params in self.budgeted_routes:
+            with self.subTest(route=name):
+                response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertWithinQueryBudget(response)
+
+    def test_violations_are_logged(self):
+        action = AnalyticsViewSet.country_analysis
+        original = action.query_budget
+        action.query_budget = QueryBudget(max_queries=0)
+        try:
+            with self.assertLogs('analytics.middleware', 'WARNING') as logs:
+                self.client.get(reverse('analytics-country-analysis'))
+            self.assertIn('exceeded its query budget', logs.output[0])
+
+            caches['analytics'].clear()
+            with override_settings(QUERY_BUDGET_RAISE=True):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse('analytics-country-analysis'))
+        finally:
+            action.query_budget = original
+
+
+class InvoiceSerializationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(5)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def test_list_leaves_lines_out_unless_expanded(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('invoice-list'))
+        self.assertNotIn('invoice_lines', response.data['results'][0])
+
+        # Lines, tracks, albums, artists and genres arrive in one prefetch query
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('invoice-list'), {'expand': 'invoice_lines'})
+        first = response.data['results'][0]
+        invoice = Invoice.objects.get(pk=first['invoice_id'])
+        self.assertEqual(len(first['invoice_lines']), invoice.invoiceline_set.count())
+
+    def test_fields_selects_top_level_fields(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('invoice-list'), {'fields': 'invoice_id,total'})
+        self.assertEqual(set(response.data['results'][0]), {'invoice_id', 'total'})
+
+        response = self.client.get(reverse('invoice-recent-orders'), {'fields': 'invoice_id', 'limit': 3})
+        self.assertEqual([set(row) for row in response.data], [{'invoice_id'}] * 3)
+
+    def test_retrieve_includes_lines(self):
+        invoice = Invoice.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('invoice-detail', args=[invoice.pk]))
+        self.assertEqual(len(response.data['invoice_lines']), invoice.invoiceline_set.count())
+
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(11)
+        call_command('seed_analytics_data', stdout=StringIO())
+        # Ties on the leading ordering column must still page deterministically
+        Track.objects.filter(pk__in=Track.objects.values_list('pk', flat=True)[:30]).update(name='Same Name')
+        tied = Invoice.objects.order_by('invoice_id').values_list('pk', flat=True)[:25]
+        Invoice.objects.filter(pk__in=list(tied)).update(invoice_date=timezone.now() - timedelta(days=3))
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def walk(self, url, params):
+        ids, pages = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            ids.extend(response.data['results'])
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_tracks_in_keyset_order(self):
+        ids, pages = self.walk(reverse('track-list'), {'pagination': 'cursor'})
+        expected = list(Track.objects.order_by('name', 'track_id').values_list('track_id', flat=True))
+        self.assertEqual([row['track_id'] for row in ids], expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Following previous from the last page gives back the page before it
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_walks_invoices_newest_first(self):
+        ids, _ = self.walk(reverse('invoice-list'), {'pagination': 'cursor', 'ordering': 'total'})
+        expected = list(Invoice.objects.order_by('-invoice_date', 'invoice_id').values_list('invoice_id', flat=True))
+        self.assertEqual([row['invoice_id'] for row in ids], expected)
+
+    def test_keyset_pages_skip_the_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('invoice-list'), {'pagination': 'cursor'})
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_estimated_count(self):
+        response = self.client.get(reverse('track-list'), {'pagination': 'cursor', 'count': 'estimate'})
+        self.assertEqual(response.data['count'], Track.objects.count())
+        response = self.client.get(reverse('invoice-list'), {'count': 'estimate', 'page': 2})
+        self.assertEqual(response.data['count'], Invoice.objects.count())
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('track-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchIndexTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(13)
+        call_command('seed_analytics_data', stdout=StringIO())
+        cls.quorvexians = Artist.objects.create(name='The Quorvexians')
+        cls.happening = Artist.objects.create(name='Quorvex Happening')
+        Artist.objects.create(name='Upquorvex Orchestra')
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def names(self, query):
+        return list(search(Artist.objects.all(), query).values_list('name', flat=True))
+
+    def test_terms_match_as_prefixes(self):
+        self.assertCountEqual(self.names('quorvex'), ['The Quorvexians', 'Quorvex Happening'])
+        self.assertEqual(self.names('quorvex happ'), ['Quorvex Happening'])
+        self.assertEqual(self.names('"quorvex" OR *'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_indexed_backends_must_implement_match(self):
+        with self.assertRaises(TypeError):
+            IndexedSearchBackend(connection)
+        fallback = SearchBackend(connection).filter(Artist.objects.all(), ['quorvex'])
+        self.assertEqual(fallback.count(), 3)
+
+    def test_better_matches_rank_first(self):
+        Artist.objects.create(name='Zelk Zelk Zelk')
+        Artist.objects.create(name='Zelk and a Long Tail of Other Words')
+        self.assertEqual(self.names('zelk')[0], 'Zelk Zelk Zelk')
+
+    def test_index_follows_saves_and_deletes(self):
+        self.quorvexians.name = 'The Zorblat Stones'
+        self.quorvexians.save()
+        self.assertEqual(self.names('quorvex'), ['Quorvex Happening'])
+        self.assertEqual(self.names('zorblat'), ['The Zorblat Stones'])
+        self.happening.delete()
+        self.assertEqual(self.names('quorvex'), [])
+
+    def test_rebuild_command(self):
+        Artist.objects.filter(pk=self.quorvexians.pk).update(name='Renamed Quietly')
+        self.assertEqual(self.names('renamed'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.names('renamed'), ['Renamed Quietly'])
+        self.assertCountEqual(self.names('quorvex'), ['Quorvex Happening'])
+
+    def test_search_endpoints_use_one_query_per_entity(self):
+        customer = Customer.objects.first()
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('analytics-search-analytics'), {'q': customer.last_name})
+        self.assertIn(customer.pk, [row['customer_id'] for row in response.data['customers']])
+        self.assertEqual(response.data['total_results'], sum(
+            len(response.data[key]) for key in ('artists', 'albums', 'tracks', 'customers')
+        ))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('explore'), {'q': 'quorvex'})
+        self.assertEqual(
+            {row['name'] for row in response.data['artists']}, {'The Quorvexians', 'Quorvex Happening'}
+        )
+
+
+class AutocompleteTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = Artist.objects.create(name='The Quorvexians')
+        cls.album = Album.objects.create(title='Quorvex Live', artist=cls.artist)
+        cls.genre = Genre.objects.create(name='Rock')
+        cls.track = Track.objects.create(
+            name='Beyoncé Quorvexed', album=cls.album, genre=cls.genre, media_type_id=1,
+            composer='Ana Quorvex, Bo Smith', milliseconds=1000, unit_price=Decimal('0.99')
+        )
+
+    def setUp(self):
+        catalog_index.reset()
+
+    def labels(self, query):
+        response = self.client.get(reverse('autocomplete'), {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {(row['type'], row['label']) for row in response.data['results']}
+
+    def test_matches_word_prefixes_without_queries(self):
+        self.labels('x')  # builds the index
+        with self.assertNumQueries(0):
+            labels = self.labels('quorv')
+        self.assertEqual(labels, {
+            ('artist', 'The Quorvexians'), ('album', 'Quorvex Live'),
+            ('track', 'Beyoncé Quorvexed'), ('composer', 'Ana Quorvex'),
+        })
+        self.assertEqual(self.labels('beyonce'), {('track', 'Beyoncé Quorvexed')})
+        self.assertEqual(self.labels('the q'), {('artist', 'The Quorvexians')})
+
+    def test_follows_catalog_changes(self):
+        self.labels('x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.track.name = 'Renamed Song'
+            self.track.composer = 'Bo Smith'
+            self.track.save()
+        self.assertEqual(self.labels('quorvexed'), set())
+        self.assertEqual(self.labels('renamed'), {('track', 'Renamed Song')})
+        self.assertEqual(self.labels('ana'), set())
+        self.assertEqual(self.labels('bo'), {('composer', 'Bo Smith')})
+
+        # Deleting the artist cascades to its album and tracks
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artist.delete()
+        self.assertEqual(self.labels('quorv'), set())
+        self.assertEqual(self.labels('renamed'), set())
+        self.assertEqual(self.labels('bo'), set())
+
+    def test_writes_swap_in_a_new_list(self):
+        self.labels('x')
+        snapshot = catalog_index.entries
+        before = list(snapshot)
+        catalog_index.update('artist', self.artist.pk, 'Renamed Quietly')
+        # A lookup still scanning the old list sees it unchanged
+        self.assertEqual(snapshot, before)
+        self.assertEqual(self.labels('renamed'), {('artist', 'Renamed Quietly')})
+        # Entries that drifted from their keys are skipped instead of scanning past the end
+        catalog_index.keys[('artist', self.artist.pk)].add('zzz missing')
+        catalog_index.remove('artist', self.artist.pk)
+        self.assertEqual(self.labels('renamed'), set())
+
+    def test_rebuilds_after_writes_elsewhere(self):
+        self.labels('x')
+        Artist.objects.filter(pk=self.artist.pk).update(name='Quietly Renamed')
+        invalidate_model(Artist)
+        with override_settings(AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.assertEqual(self.labels('quietly'), {('artist', 'Quietly Renamed')})
+
+    @override_settings(QUERY_BUDGET_RAISE=True, AUTOCOMPLETE_REFRESH_SECONDS=0)
+    def test_builds_and_rebuilds_within_the_query_budget(self):
+        self.assertEqual(self.labels('quorv'), {
+            ('artist', 'The Quorvexians'), ('album', 'Quorvex Live'),
+            ('track', 'Beyoncé Quorvexed'), ('composer', 'Ana Quorvex'),
+        })
+        Artist.objects.filter(pk=self.artist.pk).update(name='Quietly Renamed')
+        invalidate_model(Artist)
+        # The freshness check and the rebuild share one version lookup
+        self.assertEqual(self.labels('quietly'), {('artist', 'Quietly Renamed')})
+
+    def test_requires_a_query(self):
+        response = self.client.get(reverse('autocomplete'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RandomSampleTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(17)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def test_samples_are_distinct_and_sized(self):
+        rng = random.Random(1)
+        sample = random_sample(Track.objects.all(), 50, rng)
+        self.assertEqual(len({track.pk for track in sample}), 50)
+        self.assertEqual(len(random_sample(Artist.objects.all(), 10 ** 6, rng)), Artist.objects.count())
+        self.assertEqual(random_sample(Artist.objects.none(), 5, rng), [])
+
+    def test_sparse_ids_still_fill_the_sample(self):
+        keep = list(Track.objects.order_by('pk').values_list('pk', flat=True)[::25])
+        Track.objects.exclude(pk__in=keep).delete()
+        invalidate_model(Track)
+        sample = random_sample(Track.objects.all(), 5, random.Random(2))
+        self.assertEqual(len({track.pk for track in sample}), 5)
+        self.assertTrue({track.pk for track in sample} <= set(keep))
+
+    def test_id_range_follows_writes(self):
+        random_sample(Artist.objects.all(), 1000, random.Random(3))
+        with self.captureOnCommitCallbacks(execute=True):
+            artist = Artist.objects.create(name='Newest Artist')
+        sample = random_sample(Artist.objects.all(), 1000, random.Random(3))
+        self.assertIn(artist.pk, [row.pk for row in sample])
+
+    def test_explore_sample_avoids_random_ordering(self):
+        for model in (Artist, Album, Track):
+            id_range(model)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('explore'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 4)  # cache versions, then one query per sample
+        self.assertFalse(any('RANDOM()' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(len(response.data['tracks']), 50)
+        self.assertEqual(len({row['track_id'] for row in response.data['tracks']}), 50)
+        track = Track.objects.get(pk=response.data['tracks'][0]['track_id'])
+        sold = TrackSales.objects.filter(track=track).values_list('quantity_sold', flat=True).first()
+        self.assertEqual(response.data['tracks'][0]['total_sales'], sold)
+
+
+class PublicCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.artist = Artist.objects.create(name='Cached Artist')
+        cls.user = get_user_model().objects.create_user(
+            email='reader@example.com', username='reader', password='secret-pass-123'
+        )
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def test_anonymous_reads_are_served_from_cache(self):
+        first = self.client.get(reverse('artist-list'))
+        self.assertEqual(first['Cache-Control'], 'public, max-age=60')
+        with self.assertNumQueries(1):  # the cache version lookup only
+            second = self.client.get(reverse('artist-list'))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Artist.objects.create(name='Another Artist')
+        third = self.client.get(reverse('artist-list'))
+        self.assertEqual(third.json()['count'], 2)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_conditional_requests(self):
+        response = self.client.get(reverse('artist-list'))
+        with self.assertNumQueries(1):  # the cache version lookup only
+            not_modified = self.client.get(reverse('artist-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        not_modified = self.client.get(reverse('artist-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.artist.name = 'Renamed Artist'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artist.save()
+        response = self.client.get(reverse('artist-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_validators_come_from_the_database(self):
+        first = self.client.get(reverse('artist-list'))
+        # Another worker, with its own empty cache, computes the same validators
+        caches['analytics'].clear()
+        second = self.client.get(reverse('artist-list'))
+        self.assertEqual((second['ETag'], second['Last-Modified']), (first['ETag'], first['Last-Modified']))
+        # A write made elsewhere (no signals here) is seen once its version is bumped
+        Artist.objects.bulk_create([Artist(name='Bulk Artist')])
+        invalidate_model(Artist)
+        response = self.client.get(reverse('artist-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_personal_data_is_private(self):
+        customer = Customer.objects.create(first_name="Jane", last_name="Doe", email="jane@example.com")
+        for url in (reverse('customer-list'), reverse('customer-detail', args=[customer.pk]), reverse('invoice-list')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Cache-Control'], 'private, no-cache')
+                self.assertIn('ETag', response)
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertGreater(len(queries), 1)
+
+    def test_rescoring_changes_customer_etags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                customer = Customer.objects.create(first_name=f"Jane{i}", last_name="Doe", email=f"j{i}@example.com")
+                for _ in range(i + 1):
+                    Invoice.objects.create(customer=customer, invoice_date=timezone.now(), total=Decimal('1.00'))
+        first = self.client.get(reverse('customer-segments'))
+        self.assertGreater(rescore_customer_metrics(), 0)
+        response = self.client.get(reverse('customer-segments'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_explore_is_not_response_cached(self):
+        response = self.client.get(reverse('explore'))
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Cache-Control', response)
+
+    def test_authenticated_reads_revalidate(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('artist-list'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('ETag', response)
+        # Not served from the anonymous cache
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('artist-list'))
+        self.assertGreater(len(queries), 0)
+
+
+@override_settings(EXPORT_CHUNK_SIZE=7)
+class StreamingExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(18)
+        call_command('seed_analytics_data', stdout=StringIO())
+        cls.user = get_user_model().objects.create_user(
+            email='finance@example.com', username='finance', password='secret-pass-123'
+        )
+        cls.admin = get_user_model().objects.create_user(
+            email='auditor@example.com', username='auditor', password='secret-pass-123', role='admin'
+        )
+
+    def setUp(self):
+        caches['analytics'].clear()
+        self.client.force_authenticate(self.user)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_invoice_csv_honours_list_filters(self):
+        country = Invoice.objects.values_list('billing_country', flat=True).first()
+        rows = list(csv.DictReader(StringIO(self.export('invoice-export', billing_country=country))))
+        expected = Invoice.objects.filter(billing_country=country).order_by('-invoice_date')
+        self.assertEqual(len(rows), expected.count())
+        self.assertEqual({row['billing_country'] for row in rows}, {country})
+        self.assertEqual(rows[0]['invoice_id'], str(expected.first().invoice_id))
+        self.assertEqual(rows[0]['customer_email'], expected.first().customer.email)
+
+    def test_invoice_lines_ndjson(self):
+        customer = Invoice.objects.values_list('customer', flat=True).first()
+        content = self.export('invoice-export-lines', customer=customer, file_format='ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        lines = InvoiceLine.objects.filter(invoice__customer=customer).order_by('invoice_id', 'invoice_line_id')
+        self.assertEqual([row['invoice_line_id'] for row in rows], [line.pk for line in lines])
+        self.assertEqual({row['customer_id'] for row in rows}, {customer})
+        self.assertEqual(Decimal(rows[0]['unit_price']), lines[0].unit_price)
+
+        everything = self.export('invoice-export-lines', file_format='ndjson')
+        self.assertEqual(len(everything.splitlines()), InvoiceLine.objects.count())
+
+    def test_rows_are_streamed_in_chunks(self):
+        response = self.client.get(reverse('invoice-export-lines'))
+        chunks = list(response.streaming_content)
+        # Header and 7 rows per chunk
+        self.assertGreaterEqual(len(chunks), InvoiceLine.objects.count() // 7)
+        self.assertEqual(len(chunks[0].decode().splitlines()), 8)
+
+    def test_audit_log_export(self):
+        self.client.force_authenticate(self.admin)
+        logs = AuditLog.objects.filter(action='LOGIN')
+        content = self.export('audit-logs-export', action='LOGIN', file_format='ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), logs.count())
+        self.assertTrue(all(row['action'] == 'LOGIN' for row in rows))
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('audit-logs-export')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requires_authentication_and_a_known_format(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('invoice-export')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('invoice-export'), {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        if 'parquet' not in export_formats():
+            response = self.client.get(reverse('invoice-export'), {'file_format': 'parquet'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('pyarrow', response.data['error'])
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet_row_groups(self):
+        import pyarrow.parquet
+        response = self.client.get(reverse('invoice-export'), {'file_format': 'parquet', 'ordering': 'invoice_id'})
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, Invoice.objects.count())
+        self.assertEqual(table.column('invoice_id').to_pylist()[:3], list(
+            Invoice.objects.order_by('invoice_id').values_list('invoice_id', flat=True)[:3]
+        ))
+        self.assertEqual(table.schema.field('total').type, pyarrow.decimal128(10, 2))
+
+
+class StarSchemaSnapshotTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(19)
+        call_command('seed_analytics_data', stdout=StringIO())
+        cls.admin = get_user_model().objects.create_user(
+            email='warehouse@example.com', username='warehouse', password='secret-pass-123', role='admin'
+        )
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(
+            SNAPSHOT_ROOT=f'{self.root}/snapshots', SNAPSHOT_ROW_GROUP_SIZE=10, MEDIA_ROOT=f'{self.root}/media'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.admin)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('snapshots')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('snapshots')).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unknown_format_is_rejected_before_queueing(self):
+        response = self.client.post(reverse('snapshots'), {'format': 'csv'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(GeneratedReport.objects.filter(report_type='snapshot').exists())
+
+    def test_snapshots_take_turns(self):
+        acquired = threading.Event()
+
+        def snapshot():
+            with snapshot_lock(snapshot_root()):
+                acquired.set()
+
+        with snapshot_lock(snapshot_root()):
+            thread = threading.Thread(target=snapshot)
+            thread.start()
+            self.assertFalse(acquired.wait(0.2))
+        thread.join(5)
+        self.assertTrue(acquired.is_set())
+
+    @unittest.skipIf(pyarrow, 'pyarrow is installed')
+    def test_requires_pyarrow(self):
+        response = self.client.post(reverse('snapshots'), {'format': 'parquet'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pyarrow', response.data['error'])
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_full_then_incremental_parquet(self):
+        import pyarrow.dataset
+        import pyarrow.parquet
+        response = self.client.post(reverse('snapshots'), {'format': 'parquet'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['report_type'], response.data['status']), ('snapshot', 'PENDING'))
+        self.assertIsNone(read_manifest())
+
+        call_command('run_report_worker', workers=1, once=True, stdout=StringIO())
+        report = GeneratedReport.objects.get(pk=response.data['id'])
+        self.assertEqual(report.status, 'COMPLETED')
+        manifest = read_manifest()
+        self.assertEqual(manifest['watermark'], Invoice.objects.order_by('-invoice_id').first().invoice_id)
+        summary = {row['table']: row for row in json.loads(report.file_path.read())}
+        self.assertEqual(summary['invoiceline']['rows'], InvoiceLine.objects.count())
+
+        lines = pyarrow.dataset.dataset(f'{self.root}/snapshots/invoiceline').to_table()
+        self.assertEqual(lines.num_rows, InvoiceLine.objects.count())
+        self.assertEqual(sorted(lines.column('invoice_line_id').to_pylist()),
+                         list(InvoiceLine.objects.order_by('pk').values_list('pk', flat=True)))
+        part = manifest['tables']['invoiceline']['parts'][0]
+        metadata = pyarrow.parquet.ParquetFile(f'{self.root}/snapshots/invoiceline/{part}').metadata
+        self.assertGreater(metadata.num_row_groups, 1)
+
+        invoice = Invoice.objects.create(
+            customer=Customer.objects.first(), invoice_date=timezone.now(), total=Decimal('0.99')
+        )
+        InvoiceLine.objects.create(invoice=invoice, track=Track.objects.first(), unit_price=Decimal('0.99'), quantity=1)
+        Artist.objects.create(name='Snapshot Newcomer')
+
+        out = StringIO()
+        call_command('snapshot_star_schema', incremental=True, stdout=out)
+        manifest = read_manifest()
+        self.assertEqual((manifest['mode'], manifest['watermark']), ('incremental', invoice.invoice_id))
+        self.assertEqual(len(manifest['tables']['invoice']['parts']), 2)
+        self.assertEqual(len(manifest['tables']['artist']['parts']), 1)
+        invoices = pyarrow.dataset.dataset(f'{self.root}/snapshots/invoice').to_table()
+        self.assertEqual(invoices.num_rows, Invoice.objects.count())
+        artists = pyarrow.dataset.dataset(f'{self.root}/snapshots/artist').to_table()
+        self.assertIn('Snapshot Newcomer', artists.column('name').to_pylist())
+
+        # Nothing new: the fact tables keep their parts
+        call_command('snapshot_star_schema', incremental=True, stdout=StringIO())
+        self.assertEqual(read_manifest()['tables']['invoice'], manifest['tables']['invoice'])
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_late_commits_below_the_watermark_write_a_full_snapshot(self):
+        late = Invoice.objects.order_by('invoice_id')[3]
+        lines = list(late.invoiceline_set.all())
+        Invoice.objects.filter(pk=late.pk).delete()
+        call_command('snapshot_star_schema', stdout=StringIO())
+        self.assertGreater(read_manifest()['watermark'], late.invoice_id)
+
+        # As if a transaction that took these ids earlier committed after the snapshot
+        Invoice.objects.bulk_create([late])
+        InvoiceLine.objects.bulk_create(lines)
+        call_command('snapshot_star_schema', incremental=True, stdout=StringIO())
+        manifest = read_manifest()
+        self.assertEqual(manifest['mode'], 'full')
+        self.assertEqual(manifest['tables']['invoice']['rows'], Invoice.objects.count())
+        self.assertEqual(manifest['tables']['invoiceline']['rows'], InvoiceLine.objects.count())
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow_ipc(self):
+        import pyarrow.ipc
+        call_command('snapshot_star_schema', file_format='arrow', stdout=StringIO())
+        part = read_manifest()['tables']['genre']['parts'][0]
+        with pyarrow.ipc.open_file(f'{self.root}/snapshots/genre/{part}') as reader:
+            self.assertEqual(reader.read_all().num_rows, Genre.objects.count())
+
+
+@override_settings(ANALYTICS_CUBE_REFRESH_SECONDS=0)
+class SalesCubeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(23)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        caches['analytics'].clear()
+        sales_cube.reset()
+        self.addCleanup(sales_cube.reset)
+        self.url = reverse('cube')
+
+    @unittest.skipIf(numpy, 'numpy is installed')
+    def test_requires_numpy(self):
+        response = self.client.get(self.url, {'group_by': 'genre'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('numpy', response.data['error'])
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_group_by_matches_orm_aggregates(self):
+        response = self.client.get(self.url, {
+            'group_by': 'genre,country', 'measures': 'revenue,units,orders', 'limit': 1000
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = {
+            (row['track__genre__name'], row['invoice__customer__country']): (
+                Decimal(str(row['revenue'])).quantize(Decimal('0.01')), row['units'], row['orders']
+            )
+            for row in InvoiceLine.objects.values('track__genre__name', 'invoice__customer__country').annotate(
+                revenue=Sum(InvoiceLine.revenue_expression()), units=Sum('quantity'),
+                orders=Count('invoice', distinct=True)
+            )
+        }
+        rows = response.data['rows']
+        self.assertEqual(response.data['total_groups'], len(expected))
+        self.assertEqual(
+            {(row['genre'], row['country']): (row['revenue'], row['units'], row['orders']) for row in rows},
+            expected
+        )
+        self.assertEqual([row['revenue'] for row in rows], sorted((row['revenue'] for row in rows), reverse=True))
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_filters_and_time_dimensions(self):
+        invoice = Invoice.objects.order_by('invoice_id').first()
+        day = invoice.invoice_date.date()
+        month = f'{day.year}-{day.month:02d}'
+        response = self.client.get(self.url, {
+            'group_by': 'month', 'measures': 'orders,customers', 'country': invoice.customer.country,
+            'start_date': day.isoformat(), 'end_date': day.isoformat()
+        })
+        expected = Invoice.objects.filter(
+            customer__country=invoice.customer.country, invoice_date__date=day, invoiceline__isnull=False
+        ).distinct()
+        self.assertEqual(response.data['rows'], [{
+            'month': month, 'orders': expected.count(),
+            'customers': expected.values('customer').distinct().count()
+        }])
+
+        response = self.client.get(self.url, {'country': 'Atlantis'})
+        self.assertEqual(response.data['rows'], [])
+        for params in ({'group_by': 'planet'}, {'measures': 'profit'}, {'limit': 'ten'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_new_lines_are_appended_and_rewrites_reload(self):
+        before = self.client.get(self.url, {'measures': 'revenue,units'}).data['rows'][0]
+        lines = sales_cube.size
+        rewrites = sales_cube.rewrites
+        invoice = Invoice.objects.create(
+            customer=Customer.objects.first(), invoice_date=timezone.now(), total=Decimal('1.98')
+        )
+        line = InvoiceLine.objects.create(invoice=invoice, track=Track.objects.first(),
+                                          unit_price=Decimal('0.99'), quantity=2)
+        after = self.client.get(self.url, {'measures': 'revenue,units'}).data['rows'][0]
+        self.assertEqual(after['units'], before['units'] + 2)
+        self.assertEqual(after['revenue'], before['revenue'] + Decimal('1.98'))
+        self.assertEqual((sales_cube.size, sales_cube.rewrites), (lines + 1, rewrites))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            line.delete()
+        # The rewrite is recorded in the database, not in this process's cache
+        caches['analytics'].clear()
+        response = self.client.get(self.url, {'measures': 'revenue,units'})
+        self.assertEqual(response.data['rows'][0], before)
+        self.assertEqual(sales_cube.size, lines)
+        self.assertNotEqual(sales_cube.rewrites, rewrites)
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_lines_committed_late_with_lower_ids_reload(self):
+        late = InvoiceLine.objects.order_by('pk')[5]
+        InvoiceLine.objects.filter(pk=late.pk).delete()
+        before = self.client.get(self.url, {'measures': 'units'}).data['rows'][0]
+        self.assertLess(late.pk, sales_cube.watermark)
+
+        # bulk_create sends no signals: as if a transaction that took the id earlier committed now
+        InvoiceLine.objects.bulk_create([late])
+        after = self.client.get(self.url, {'measures': 'units'}).data['rows'][0]
+        self.assertEqual(after['units'], before['units'] + late.quantity)
+        self.assertEqual(sales_cube.size, InvoiceLine.objects.count())
+
+
+class PivotTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(24)
+        call_command('seed_analytics_data', stdout=StringIO())
+
+    def setUp(self):
+        caches['analytics'].clear()
+        self.url = reverse('pivot')
+
+    def test_grouped_measures_match_the_orm_in_one_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {
+                'dimensions': 'genre,year', 'measures': 'revenue,units,orders,customers,average_order_value'
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = InvoiceLine.objects.values('track__genre__name', 'invoice__invoice_date__year').annotate(
+            revenue=Sum(InvoiceLine.revenue_expression()), units=Sum('quantity'),
+            orders=Count('invoice', distinct=True), customers=Count('invoice__customer', distinct=True)
+        )
+        cents = Decimal('0.01')
+        self.assertEqual(response.data['row_count'], len(expected))
+        rows = {(row['genre'], row['year']): row for row in response.data['rows']}
+        for item in expected:
+            row = rows[(item['track__genre__name'], item['invoice__invoice_date__year'])]
+            revenue = Decimal(str(item['revenue'])).quantize(cents)
+            self.assertEqual(row['revenue'], revenue)
+            self.assertEqual((row['units'], row['orders'], row['customers']),
+                             (item['units'], item['orders'], item['customers']))
+            self.assertEqual(row['average_order_value'], (revenue / item['orders']).quantize(cents))
+        self.assertEqual([(row['genre'], row['year']) for row in response.data['rows']], sorted(rows))
+
+    def test_filters_ordering_and_time_labels(self):
+        invoice = Invoice.objects.order_by('invoice_id').first()
+        day = invoice.invoice_date.date()
+        response = self.client.get(
+            f'{self.url}?dimensions=month,quarter,country&measures=orders&order_by=-orders'
+            f'&country={invoice.customer.country}&start_date={day}&end_date={day}'
+        )
+        self.assertEqual(response.data['rows'], [{
+            'month': day.strftime('%Y-%m'), 'quarter': f'{day.year}-Q{(day.month - 1) // 3 + 1}',
+            'country': invoice.customer.country,
+            'orders': Invoice.objects.filter(
+                customer__country=invoice.customer.country, invoice_date__date=day
+            ).count(),
+        }])
+
+        response = self.client.get(self.url, {'dimensions': 'country', 'order_by': '-revenue'})
+        revenues = [row['revenue'] for row in response.data['rows']]
+        self.assertEqual(revenues, sorted(revenues, reverse=True))
+
+        response = self.client.get(self.url)
+        total = InvoiceLine.objects.aggregate(total=Sum(InvoiceLine.revenue_expression()))['total']
+        self.assertEqual(response.data['rows'], [{'revenue': Decimal(str(total)).quantize(Decimal('0.01'))}])
+
+    def test_invalid_requests_and_size_guard(self):
+        for params in ({'dimensions': 'planet'}, {'measures': 'profit'}, {'dimensions': 'genre,genre'},
+                       {'month': '2024-01'}, {'year': 'last'}, {'dimensions': 'genre', 'order_by': 'units'},
+                       {'start_date': 'soon'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('error', response.data)
+
+        with override_settings(PIVOT_MAX_ROWS=3):
+            response = self.client.get(self.url, {'dimensions': 'album'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('more than 3 rows', response.data['error'])
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ArtistViewSet, AlbumViewSet, GenreViewSet, TrackViewSet,
-    CustomerViewSet, InvoiceViewSet, AnalyticsViewSet
+    CustomerViewSet, InvoiceViewSet, AnalyticsViewSet, AutocompleteView, CubeView, PivotView, SnapshotView
 )
 
 router = DefaultRouter()
@@ -15,5 +15,9 @@ router.register(r'invoices', InvoiceViewSet)
 router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
+    path('cube/', CubeView.as_view(), name='cube'),
+    path('pivot/', PivotView.as_view(), name='pivot'),
+    path('snapshots/', SnapshotView.as_view(), name='snapshots'),
     path('', include(router.urls)),
 ]
@@ -1,19 +1,103 @@
-from django.db.models import Sum, Count, Avg, Q
-from django.db.models.functions import TruncMonth, TruncYear
+import zoneinfo
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum, Count, Avg, F, Prefetch, Window
+from django.db.models.functions import Round, RowNumber
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .models import Artist, Album, Genre, Track, Customer, Invoice, InvoiceLine
+from users.models import UserProfile
+from users.permissions import IsAdmin
+from reports.jobs import enqueue
+from reports.models import GeneratedReport
+from reports.serializers import GeneratedReportSerializer
+from .models import Artist, Album, Genre, Track, Customer, CustomerMetrics, Invoice, InvoiceLine, TrackSales
 from .serializers import (
     ArtistSerializer, AlbumSerializer, GenreSerializer, TrackSerializer,
     CustomerSerializer, InvoiceSerializer, SalesAnalyticsSerializer,
-    GenreAnalyticsSerializer, CountryAnalyticsSerializer
+    GenreAnalyticsSerializer, CountryAnalyticsSerializer, CustomerMetricsSerializer,
+    CustomerSegmentSerializer
 )
-
-
+from .autocomplete import catalog_index
+from .budgets import query_budget
+from .exports import ExportMixin
+from .cube import DIMENSIONS as CUBE_DIMENSIONS, CubeError, sales_cube
+from .customer_metrics import SEGMENTS
+from .pivot import DIMENSIONS as PIVOT_DIMENSIONS, pivot
+from .cache import CATALOG_MODELS, CUSTOMER_MODELS, TRACKED_MODELS, cached_action, get_cache_stats, public_cache
+from .rollups import (
+    SERIES_GRANULARITIES, add_rolling_average, fill_gaps, period_label, period_start, previous_period, sales_series
+)
+from .search import search
+from .snapshots import SnapshotError, check_format, read_manifest
+
+
+def _parse_date_param(value):
+    """Parse a YYYY-MM-DD (or ISO datetime) query parameter into a date"""
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = parsed.date()
+    return parsed
+
+
+def _request_timezone(request):
+    """The caller's UserProfile time zone; the server's for anonymous callers or unknown names"""
+    if not hasattr(request, '_analytics_timezone'):
+        name = None
+        if request.user and request.user.is_authenticated:
+            name = UserProfile.objects.filter(user=request.user).values_list('timezone', flat=True).first()
+        try:
+            tz = zoneinfo.ZoneInfo(name) if name else timezone.get_current_timezone()
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            tz = timezone.get_current_timezone()
+        request._analytics_timezone = tz
+    return request._analytics_timezone
+
+
+def _to_decimal(value):
+    # SQLite returns SUM/AVG over decimal columns as floats
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def _dashboard_totals():
+    """Catalog counts and invoice aggregates for the dashboard in one round-trip"""
+    quote = connection.ops.quote_name
+    counts = ', '.join(
+        f'(SELECT COUNT(*) FROM {quote(model._meta.db_table)})'
+        for model in (Customer, Track, Artist, Album)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {counts}, SUM(total), COUNT(*), AVG(total) FROM {quote(Invoice._meta.db_table)}'
+        )
+        customers, tracks, artists, albums, revenue, orders, average = cursor.fetchone()
+    return {
+        'total_customers': customers,
+        'total_tracks': tracks,
+        'total_artists': artists,
+        'total_albums': albums,
+        'total_revenue': _to_decimal(revenue),
+        'total_orders': orders,
+        'average_order_value': _to_decimal(average),
+    }
+
+
+@method_decorator(public_cache(CATALOG_MODELS), name='dispatch')
+@query_budget(max_queries=2)
 class ArtistViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Artist model"""
     queryset = Artist.objects.all()
@@ -25,20 +109,25 @@ class ArtistViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['name']
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=2)
+    @cached_action(depends_on=CATALOG_MODELS)
     def top_artists(self, request):
         """Get top artists by total sales"""
-        top_artists = Artist.objects.annotate(
-            total_sales=Sum('album__track__invoiceline__invoice__total'),
+        ranking = TrackSales.objects.filter(artist__isnull=False).values('artist').annotate(
+            total_sales=Round(Sum('revenue'), 2)
+        ).order_by('-total_sales', 'artist_id')[:10]
+        artists = Artist.objects.annotate(
             total_tracks=Count('album__track', distinct=True),
             total_albums=Count('album', distinct=True)
-        ).filter(total_sales__isnull=False).order_by('-total_sales')[:10]
-        
+        ).in_bulk([row['artist'] for row in ranking])
+
         # Add calculated fields to serializer data
         data = []
-        for artist in top_artists:
+        for row in ranking:
+            artist = artists[row['artist']]
             artist_data = ArtistSerializer(artist).data
             artist_data.update({
-                'total_sales': artist.total_sales,
+                'total_sales': row['total_sales'],
                 'total_tracks': artist.total_tracks,
                 'total_albums': artist.total_albums
             })
@@ -47,6 +136,8 @@ class ArtistViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(data)
 
 
+@method_decorator(public_cache(CATALOG_MODELS), name='dispatch')
+@query_budget(max_queries=2)
 class AlbumViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Album model"""
     queryset = Album.objects.select_related('artist').all()
@@ -59,18 +150,23 @@ class AlbumViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['title']
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=2)
+    @cached_action(depends_on=CATALOG_MODELS)
     def top_albums(self, request):
         """Get top-selling albums"""
-        top_albums = Album.objects.annotate(
-            total_sales=Sum('track__invoiceline__invoice__total'),
+        ranking = TrackSales.objects.filter(album__isnull=False).values('album').annotate(
+            total_sales=Round(Sum('revenue'), 2)
+        ).order_by('-total_sales', 'album_id')[:10]
+        albums = Album.objects.select_related('artist').annotate(
             track_count=Count('track', distinct=True)
-        ).filter(total_sales__isnull=False).order_by('-total_sales')[:10]
-        
+        ).in_bulk([row['album'] for row in ranking])
+
         data = []
-        for album in top_albums:
+        for row in ranking:
+            album = albums[row['album']]
             album_data = AlbumSerializer(album).data
             album_data.update({
-                'total_sales': album.total_sales,
+                'total_sales': row['total_sales'],
                 'track_count': album.track_count
             })
             data.append(album_data)
@@ -78,6 +174,8 @@ class AlbumViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(data)
 
 
+@method_decorator(public_cache(CATALOG_MODELS), name='dispatch')
+@query_budget(max_queries=2)
 class GenreViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Genre model"""
     queryset = Genre.objects.all()
@@ -89,6 +187,8 @@ class GenreViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['name']
 
 
+@method_decorator(public_cache(CATALOG_MODELS), name='dispatch')
+@query_budget(max_queries=2)
 class TrackViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Track model"""
     queryset = Track.objects.select_related('album__artist', 'genre').all()
@@ -99,21 +199,23 @@ class TrackViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['name', 'album__title', 'album__artist__name', 'composer']
     ordering_fields = ['name', 'unit_price', 'milliseconds']
     ordering = ['name']
+    keyset_ordering = ('name', 'track_id')
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=1)
+    @cached_action(depends_on=CATALOG_MODELS)
     def top_tracks(self, request):
         """Get top-selling tracks"""
-        top_tracks = Track.objects.annotate(
-            total_sold=Sum('invoiceline__quantity'),
-            total_revenue=Sum('invoiceline__invoice__total')
-        ).filter(total_sold__isnull=False).order_by('-total_sold')[:10]
-        
+        top_tracks = TrackSales.objects.select_related(
+            'track__album__artist', 'track__genre'
+        ).order_by('-quantity_sold', 'track_id')[:10]
+
         data = []
-        for track in top_tracks:
-            track_data = TrackSerializer(track).data
+        for sales in top_tracks:
+            track_data = TrackSerializer(sales.track).data
             track_data.update({
-                'total_sold': track.total_sold,
-                'total_revenue': track.total_revenue
+                'total_sold': sales.quantity_sold,
+                'total_revenue': sales.revenue
             })
             data.append(track_data)
         
@@ -132,6 +234,8 @@ class TrackViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
+@method_decorator(public_cache(CUSTOMER_MODELS, private=True), name='dispatch')
+@query_budget(max_queries=2)
 class CustomerViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Customer model"""
     queryset = Customer.objects.all()
@@ -142,26 +246,84 @@ class CustomerViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['first_name', 'last_name', 'email', 'company']
     ordering_fields = ['first_name', 'last_name', 'email', 'customer_id']
     ordering = ['last_name', 'first_name']
+    max_segment_limit = 50
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=1)
+    @cached_action(depends_on=CUSTOMER_MODELS)
     def top_customers(self, request):
         """Get top customers by total spending"""
-        top_customers = Customer.objects.annotate(
-            total_spent=Sum('invoice__total'),
-            total_orders=Count('invoice', distinct=True)
-        ).filter(total_spent__isnull=False).order_by('-total_spent')[:10]
-        
+        top_customers = CustomerMetrics.objects.select_related('customer').order_by('-lifetime_value')[:10]
+
         data = []
-        for customer in top_customers:
-            customer_data = CustomerSerializer(customer).data
+        for metrics in top_customers:
+            customer_data = CustomerSerializer(metrics.customer).data
             customer_data.update({
-                'total_spent': customer.total_spent,
-                'total_orders': customer.total_orders
+                'total_spent': metrics.lifetime_value,
+                'total_orders': metrics.order_count
             })
             data.append(customer_data)
-        
+
         return Response(data)
 
+    @action(detail=False, methods=['get'])
+    @query_budget(max_queries=1)
+    @cached_action(depends_on=CUSTOMER_MODELS)
+    def segments(self, request):
+        """Get customer counts and value per RFM segment"""
+        totals = {
+            row['segment']: row
+            for row in CustomerMetrics.objects.values('segment').annotate(
+                customer_count=Count('pk'),
+                total_value=Sum('lifetime_value'),
+                average_customer_value=Avg('lifetime_value'),
+                average_orders=Avg('order_count')
+            ).order_by()
+        }
+        data = []
+        for segment in SEGMENTS:
+            row = totals.get(segment, {})
+            data.append({
+                'segment': segment,
+                'customer_count': row.get('customer_count', 0),
+                'lifetime_value': _to_decimal(row.get('total_value')),
+                'average_customer_value': _to_decimal(row.get('average_customer_value')),
+                'average_orders': _to_decimal(row.get('average_orders'))
+            })
+
+        serializer = CustomerSegmentSerializer(data, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='segments/top')
+    @query_budget(max_queries=1)
+    @cached_action(depends_on=CUSTOMER_MODELS)
+    def segment_top(self, request):
+        """Get the top customers by lifetime value in each RFM segment"""
+        segment = request.query_params.get('segment')
+        if segment and segment not in SEGMENTS:
+            return Response({'error': f"segment must be one of {', '.join(SEGMENTS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 5)), self.max_segment_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        metrics = CustomerMetrics.objects.all()
+        if segment:
+            metrics = metrics.filter(segment=segment)
+        # One query: rank within each segment and keep the first ``limit`` rows of each
+        ranked = metrics.annotate(rank=Window(
+            RowNumber(),
+            partition_by=[F('segment')],
+            order_by=[F('lifetime_value').desc(), F('customer_id').asc()]
+        )).filter(rank__lte=max(limit, 1)).order_by('segment', 'rank')
+
+        customers = {name: [] for name in ([segment] if segment else SEGMENTS)}
+        for row in ranked:
+            customers[row.segment].append(CustomerMetricsSerializer(row).data)
+        return Response([{'segment': name, 'customers': rows} for name, rows in customers.items()])
+
     @action(detail=False, methods=['get'])
     def by_country(self, request):
         """Get customers by country"""
@@ -175,9 +337,36 @@ class CustomerViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class InvoiceViewSet(viewsets.ReadOnlyModelViewSet):
+INVOICE_EXPORT_COLUMNS = {
+    'invoice_id': 'invoice_id',
+    'invoice_date': 'invoice_date',
+    'customer_id': 'customer',
+    'customer_email': 'customer__email',
+    'billing_address': 'billing_address',
+    'billing_city': 'billing_city',
+    'billing_state': 'billing_state',
+    'billing_country': 'billing_country',
+    'billing_postal_code': 'billing_postal_code',
+    'total': 'total',
+}
+
+INVOICE_LINE_EXPORT_COLUMNS = {
+    'invoice_line_id': 'invoice_line_id',
+    'invoice_id': 'invoice',
+    'invoice_date': 'invoice__invoice_date',
+    'customer_id': 'invoice__customer',
+    'track_id': 'track',
+    'track_name': 'track__name',
+    'unit_price': 'unit_price',
+    'quantity': 'quantity',
+}
+
+
+@method_decorator(public_cache(TRACKED_MODELS, private=True), name='dispatch')
+@query_budget(max_queries=3)
+class InvoiceViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for Invoice model"""
-    queryset = Invoice.objects.select_related('customer').all()
+    queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -185,73 +374,137 @@ class InvoiceViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['customer__first_name', 'customer__last_name', 'customer__email']
     ordering_fields = ['invoice_date', 'total', 'invoice_id']
     ordering = ['-invoice_date']
+    keyset_ordering = ('-invoice_date', 'invoice_id')
+
+    def get_queryset(self):
+        """Join or prefetch only the relations the serializer will render"""
+        queryset = Invoice.objects.all()
+        fields = self.get_serializer().fields
+        if 'customer' in fields:
+            queryset = queryset.select_related('customer')
+        if 'invoice_lines' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'invoiceline_set',
+                queryset=InvoiceLine.objects.select_related('track__album__artist', 'track__genre')
+            ))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Single invoices show their lines; lists need ?expand=invoice_lines
+        context['expand_by_default'] = self.action == 'retrieve'
+        return context
 
     @action(detail=False, methods=['get'])
     def recent_orders(self, request):
         """Get recent orders"""
         limit = int(request.query_params.get('limit', 10))
-        recent_invoices = self.queryset.order_by('-invoice_date')[:limit]
+        recent_invoices = self.get_queryset().order_by('-invoice_date')[:limit]
         serializer = self.get_serializer(recent_invoices, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream the invoices matching the list filters as CSV, NDJSON or Parquet"""
+        invoices = self.filter_queryset(Invoice.objects.all())
+        return self.export_queryset(invoices, INVOICE_EXPORT_COLUMNS, 'invoices')
+
+    @action(detail=False, methods=['get'], url_path='lines/export', permission_classes=[IsAuthenticated])
+    def export_lines(self, request):
+        """Stream the lines of the invoices matching the list filters"""
+        invoices = self.filter_queryset(Invoice.objects.all())
+        lines = InvoiceLine.objects.order_by('invoice_id', 'invoice_line_id')
+        if invoices.query.has_filters():
+            lines = lines.filter(invoice__in=invoices.order_by().values('pk'))
+        return self.export_queryset(lines, INVOICE_LINE_EXPORT_COLUMNS, 'invoice-lines')
+
 
 class AnalyticsViewSet(viewsets.ViewSet):
     """ViewSet for analytics endpoints"""
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    max_rolling_window = 90
+
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=4, max_sql_ms=200)
+    @cached_action(vary_on=lambda request: str(_request_timezone(request)))
     def sales_overview(self, request):
-        """Get sales overview analytics"""
+        """Get sales per day, week, month, quarter or year, with empty periods filled in"""
         # Get date range parameters
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        
-        queryset = Invoice.objects.all()
-        if start_date:
-            queryset = queryset.filter(invoice_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(invoice_date__lte=end_date)
-        
-        # Monthly sales data
-        monthly_sales = queryset.annotate(
-            month=TruncMonth('invoice_date')
-        ).values('month').annotate(
-            total_sales=Sum('total'),
-            total_orders=Count('invoice_id'),
-            average_order_value=Avg('total')
-        ).order_by('month')
-
-        # Convert to list and format data
+        try:
+            start_date = _parse_date_param(request.query_params.get('start_date'))
+            end_date = _parse_date_param(request.query_params.get('end_date'))
+        except ValueError:
+            return Response({'error': 'start_date and end_date must be dates in YYYY-MM-DD format'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        granularity = request.query_params.get('granularity', 'month')
+        if granularity not in SERIES_GRANULARITIES:
+            return Response({'error': f"granularity must be one of {', '.join(SERIES_GRANULARITIES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rolling = request.query_params.get('rolling', '0')
+        if not rolling.isdigit() or int(rolling) > self.max_rolling_window:
+            return Response({'error': f'rolling must be a number of periods from 1 to {self.max_rolling_window}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rolling = int(rolling)
+
+        # Reach back far enough that the first rolling average covers a full window;
+        # the earlier periods only feed the average, so the first one stays partial
+        first = series_start = period_start(start_date, granularity) if start_date else None
+        for _ in range(rolling - 1):
+            if series_start:
+                series_start = previous_period(series_start, granularity)
+
+        tz = _request_timezone(request)
+        rows = sales_series(granularity, start_date, end_date, tz=tz)
+        if series_start != first:
+            rows = sales_series(granularity, series_start, first - timedelta(days=1), tz=tz) + rows
+        try:
+            rows = fill_gaps(rows, granularity, series_start, end_date)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if rolling:
+            add_rolling_average(rows, rolling)
+
         data = []
-        for item in monthly_sales:
-            data.append({
-                'period': item['month'].strftime('%Y-%m'),
-                'total_sales': item['total_sales'] or 0,
-                'total_orders': item['total_orders'] or 0,
-                'average_order_value': item['average_order_value'] or 0
-            })
+        for item in rows:
+            if first and item['period'] < first:
+                continue
+            row = {
+                'period': period_label(item['period'], granularity),
+                'total_sales': item['total_sales'],
+                'total_orders': item['total_orders'],
+                'average_order_value': item['average_order_value']
+            }
+            if rolling:
+                row['rolling_average'] = item['rolling_average']
+            data.append(row)
 
         serializer = SalesAnalyticsSerializer(data, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=2, max_sql_ms=200)
+    @cached_action(depends_on=CATALOG_MODELS)
     def genre_analysis(self, request):
         """Get genre-based analytics"""
-        genre_data = Genre.objects.annotate(
-            total_sales=Sum('track__invoiceline__invoice__total'),
-            track_count=Count('track', distinct=True)
-        ).filter(total_sales__isnull=False).order_by('-total_sales')
+        genre_data = TrackSales.objects.filter(genre__isnull=False).values('genre', 'genre__name').annotate(
+            total_sales=Round(Sum('revenue'), 2)
+        ).order_by('-total_sales', 'genre_id')
+        track_counts = dict(
+            Track.objects.filter(genre__in=[item['genre'] for item in genre_data])
+            .values_list('genre').annotate(Count('track_id'))
+        )
 
         # Calculate total sales for percentage calculation
-        total_revenue = sum(item.total_sales for item in genre_data if item.total_sales)
+        total_revenue = sum(item['total_sales'] for item in genre_data if item['total_sales'])
 
         data = []
-        for genre in genre_data:
-            percentage = (genre.total_sales / total_revenue * 100) if total_revenue > 0 else 0
+        for item in genre_data:
+            percentage = (item['total_sales'] / total_revenue * 100) if total_revenue > 0 else 0
             data.append({
-                'genre_name': genre.name,
-                'total_sales': genre.total_sales,
-                'track_count': genre.track_count,
+                'genre_name': item['genre__name'],
+                'total_sales': item['total_sales'],
+                'track_count': track_counts.get(item['genre'], 0),
                 'percentage': round(percentage, 2)
             })
 
@@ -259,15 +512,14 @@ class AnalyticsViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=1, max_sql_ms=200)
+    @cached_action(depends_on=CUSTOMER_MODELS)
     def country_analysis(self, request):
         """Get country-based analytics"""
-        country_data = Customer.objects.values('country').annotate(
-            total_sales=Sum('invoice__total'),
-            customer_count=Count('customer_id', distinct=True),
-            average_customer_value=Avg('invoice__total')
-        ).filter(
-            total_sales__isnull=False,
-            country__isnull=False
+        country_data = CustomerMetrics.objects.filter(country__isnull=False).values('country').annotate(
+            total_sales=Sum('lifetime_value'),
+            customer_count=Count('pk'),
+            average_customer_value=Avg('lifetime_value')
         ).order_by('-total_sales')
 
         data = []
@@ -283,18 +535,16 @@ class AnalyticsViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=2, max_sql_ms=200)
+    @cached_action(depends_on=(Invoice, Customer, Track, Artist, Album), timeout=settings.DASHBOARD_CACHE_TTL)
     def dashboard_summary(self, request):
         """Get dashboard summary statistics"""
-        total_customers = Customer.objects.count()
-        total_tracks = Track.objects.count()
-        total_artists = Artist.objects.count()
-        total_albums = Album.objects.count()
-        total_revenue = Invoice.objects.aggregate(Sum('total'))['total__sum'] or 0
-        total_orders = Invoice.objects.count()
-        avg_order_value = Invoice.objects.aggregate(Avg('total'))['total__avg'] or 0
+        totals = _dashboard_totals()
 
         # Get recent activity
-        recent_orders = Invoice.objects.order_by('-invoice_date')[:5]
+        recent_orders = Invoice.objects.select_related('customer').only(
+            'invoice_id', 'invoice_date', 'total', 'customer__first_name', 'customer__last_name'
+        ).order_by('-invoice_date')[:5]
         recent_orders_data = []
         for order in recent_orders:
             recent_orders_data.append({
@@ -305,41 +555,30 @@ class AnalyticsViewSet(viewsets.ViewSet):
             })
 
         data = {
-            'total_customers': total_customers,
-            'total_tracks': total_tracks,
-            'total_artists': total_artists,
-            'total_albums': total_albums,
-            'total_revenue': total_revenue,
-            'total_orders': total_orders,
-            'average_order_value': round(avg_order_value, 2) if avg_order_value else 0,
+            **totals,
             'recent_orders': recent_orders_data
         }
-
         return Response(data)
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=3, max_sql_ms=200)
+    @cached_action()
     def yearly_comparison(self, request):
         """Get year-over-year comparison"""
-        yearly_data = Invoice.objects.annotate(
-            year=TruncYear('invoice_date')
-        ).values('year').annotate(
-            total_sales=Sum('total'),
-            total_orders=Count('invoice_id'),
-            average_order_value=Avg('total')
-        ).order_by('year')
-
         data = []
-        for item in yearly_data:
+        for item in sales_series('year'):
             data.append({
-                'year': item['year'].strftime('%Y'),
-                'total_sales': item['total_sales'] or 0,
-                'total_orders': item['total_orders'] or 0,
-                'average_order_value': item['average_order_value'] or 0
+                'year': item['period'].strftime('%Y'),
+                'total_sales': item['total_sales'],
+                'total_orders': item['total_orders'],
+                'average_order_value': item['average_order_value']
             })
 
         return Response(data)
 
     @action(detail=False, methods=['get'])
+    @query_budget(max_queries=4)
+    @cached_action(depends_on=TRACKED_MODELS)
     def search_analytics(self, request):
         """Search across all entities"""
         query = request.query_params.get('q', '')
@@ -347,22 +586,128 @@ class AnalyticsViewSet(viewsets.ViewSet):
             return Response({'error': 'q parameter is required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
-        # Search across different models
-        artists = Artist.objects.filter(name__icontains=query)[:5]
-        albums = Album.objects.filter(title__icontains=query)[:5]
-        tracks = Track.objects.filter(name__icontains=query)[:5]
-        customers = Customer.objects.filter(
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) | 
-            Q(email__icontains=query)
-        )[:5]
+        # One ranked full-text query per entity
+        artists = list(search(Artist.objects.all(), query)[:5])
+        albums = list(search(Album.objects.select_related('artist'), query)[:5])
+        tracks = list(search(Track.objects.select_related('album__artist', 'genre'), query)[:5])
+        customers = list(search(Customer.objects.all(), query)[:5])
 
         data = {
             'artists': ArtistSerializer(artists, many=True).data,
             'albums': AlbumSerializer(albums, many=True).data,
             'tracks': TrackSerializer(tracks, many=True).data,
             'customers': CustomerSerializer(customers, many=True).data,
-            'total_results': artists.count() + albums.count() + tracks.count() + customers.count()
+            'total_results': len(artists) + len(albums) + len(tracks) + len(customers)
         }
 
         return Response(data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def cache_stats(self, request):
+        """Cache hit/miss counters per analytics action, for tuning TTLs"""
+        return Response(get_cache_stats())
+
+
+# Lookups run no queries; building the index (first request, outside writes) runs
+# three plus the request's cache version lookup, which the budget allows for
+@query_budget(max_queries=3)
+class AutocompleteView(APIView):
+    """Typeahead suggestions from the in-memory catalog index"""
+    # Public catalog names only, so skip authentication and its user lookup
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    max_limit = 25
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({'error': 'q parameter is required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        return Response({'query': query, 'results': catalog_index.lookup(query, max(limit, 1), request)})
+
+
+class CubeView(APIView):
+    """Ad-hoc group-by/filter/sum over the in-memory sales cube (see analytics.cube)"""
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    max_limit = 1000
+
+    def get(self, request):
+        params = request.query_params
+        group_by = [name for name in params.get('group_by', '').split(',') if name]
+        measures = [name for name in params.get('measures', 'revenue,units').split(',') if name]
+        filters = {name: params.getlist(name) for name in CUBE_DIMENSIONS if name in params}
+        try:
+            start_date = _parse_date_param(params.get('start_date'))
+            end_date = _parse_date_param(params.get('end_date'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(params.get('limit', 100)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = sales_cube.query(
+                group_by, measures, filters, start_date, end_date,
+                order_by=params.get('order_by'), limit=max(limit, 1)
+            )
+        except CubeError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'group_by': group_by, 'measures': measures, **result})
+
+
+@method_decorator(public_cache(TRACKED_MODELS), name='dispatch')
+@query_budget(max_queries=1, max_sql_ms=500)
+class PivotView(APIView):
+    """Measures grouped by any dimensions, compiled to one query (see analytics.pivot)"""
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        params = request.query_params
+        dimensions = [name for name in params.get('dimensions', '').split(',') if name]
+        measures = [name for name in params.get('measures', 'revenue').split(',') if name]
+        filters = {name: params.getlist(name) for name in PIVOT_DIMENSIONS if name in params}
+        try:
+            start_date = _parse_date_param(params.get('start_date'))
+            end_date = _parse_date_param(params.get('end_date'))
+            rows = pivot(dimensions, measures, filters, start_date, end_date, order_by=params.get('order_by'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'dimensions': dimensions, 'measures': measures, 'rows': rows, 'row_count': len(rows)})
+
+
+class SnapshotView(APIView):
+    """Admin-only columnar snapshots of the sales star schema (see analytics.snapshots)"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        """The latest snapshot's manifest"""
+        manifest = read_manifest()
+        if manifest is None:
+            return Response({'error': 'No snapshot has been written yet'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(manifest)
+
+    def post(self, request):
+        """
+        Queue a snapshot: {"format": "parquet"|"arrow", "incremental": bool}.
+        A report worker writes it; poll the returned report for its status.
+        """
+        file_format = request.data.get('format', 'parquet')
+        incremental = str(request.data.get('incremental', False)).lower() in ('1', 'true', 'yes')
+        try:
+            check_format(file_format)
+        except SnapshotError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        report = GeneratedReport.objects.create(
+            user=request.user,
+            name='Star schema snapshot',
+            report_type='snapshot',
+            parameters={'format': 'json', 'snapshot_format': file_format, 'incremental': incremental}
+        )
+        enqueue(report)
+        return Response(GeneratedReportSerializer(report).data, status=status.HTTP_202_ACCEPTED)
@@ -12,6 +12,11 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', 'id'], name='auditlog_timestamp_idx'),
+            models.Index(fields=['action', '-timestamp'], name='auditlog_action_ts_idx'),
+            models.Index(fields=['resource_type', '-timestamp'], name='auditlog_resource_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.action} on {self.resource_type} by {self.user} at {self.timestamp}"
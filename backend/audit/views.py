@@ -4,18 +4,35 @@ from rest_framework.response import Response
 from .models import AuditLog
 from .serializers import AuditLogSerializer
 from users.permissions import IsAdmin
+from analytics.budgets import query_budget
+from analytics.exports import ExportMixin
 from django.db.models import Count
 from django.db.models.functions import TruncDay
 from django.utils import timezone
 from datetime import timedelta
 
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AuditLog.objects.all()
+AUDIT_LOG_EXPORT_COLUMNS = {
+    'id': 'id',
+    'timestamp': 'timestamp',
+    'user_id': 'user',
+    'user_email': 'user__email',
+    'action': 'action',
+    'resource_type': 'resource_type',
+    'resource_id': 'resource_id',
+    'ip_address': 'ip_address',
+    'details': 'details',
+}
+
+
+@query_budget(max_queries=3)
+class AuditLogViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = AuditLog.objects.select_related('user').all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAdmin]
     filterset_fields = ['action', 'resource_type', 'user']
     search_fields = ['resource_id', 'details']
     ordering_fields = ['timestamp', 'action', 'resource_type']
+    keyset_ordering = ('-timestamp', 'id')
 
     @action(detail=False, methods=['get'])
     def visualizations(self, request):
@@ -47,11 +64,6 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=['get'])
     def export(self, request):
-        # In a real app, this would generate CSV/PDF
-        # For now, just return a message and the data
-        logs = self.get_queryset()[:100]
-        serializer = self.get_serializer(logs, many=True)
-        return Response({
-            'message': 'Export started. You will be notified when it is ready.',
-            'data': serializer.data
-        })
+        """Stream the logs matching the list filters as CSV, NDJSON or Parquet"""
+        logs = self.filter_queryset(self.get_queryset())
+        return self.export_queryset(logs, AUDIT_LOG_EXPORT_COLUMNS, 'audit-logs')
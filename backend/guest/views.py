@@ -1,10 +1,13 @@
-from django.db.models import Count, Sum
+from django.db.models import Count, F
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import ContactMessage, NewsletterSubscription
 from .serializers import ContactMessageSerializer, NewsletterSubscriptionSerializer
 from analytics.models import Artist, Album, Track
+from analytics.budgets import query_budget
+from analytics.sampling import random_sample
+from analytics.search import search
 from analytics.serializers import ArtistSerializer, AlbumSerializer, TrackSerializer
 
 class ContactMessageView(generics.CreateAPIView):
@@ -17,32 +20,34 @@ class NewsletterSubscriptionView(generics.CreateAPIView):
     serializer_class = NewsletterSubscriptionSerializer
     permission_classes = [permissions.AllowAny]
 
+# One query per entity; a sample re-reads a changed table's id range (one more query each).
+# Not response-cached: each request draws a fresh random sample.
+@query_budget(max_queries=6)
 class ExploreView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request, *args, **kwargs):
         try:
             search_query = request.query_params.get('q', None)
-            
+            artist_queryset = Artist.objects.annotate(
+                track_count=Count('album__track', distinct=True),
+                album_count=Count('album', distinct=True)
+            )
+            album_queryset = Album.objects.select_related('artist')
+            # Sold quantities come from the per-track sales facts, not a SUM over invoice lines
+            track_queryset = Track.objects.select_related('album__artist', 'genre').annotate(
+                total_sales=F('sales__quantity_sold')
+            )
+
             if search_query:
-                artists = Artist.objects.filter(name__icontains=search_query).annotate(
-                    track_count=Count('album__track', distinct=True),
-                    album_count=Count('album', distinct=True)
-                )[:10]
-                albums = Album.objects.filter(title__icontains=search_query)[:10]
-                tracks = Track.objects.filter(name__icontains=search_query).annotate(
-                    total_sales=Sum('invoiceline__quantity')
-                )[:10]
+                artists = search(artist_queryset, search_query)[:10]
+                albums = search(album_queryset, search_query)[:10]
+                tracks = search(track_queryset, search_query)[:10]
             else:
-                # Get a sample of artists, albums, and tracks
-                artists = Artist.objects.order_by('?').annotate(
-                    track_count=Count('album__track', distinct=True),
-                    album_count=Count('album', distinct=True)
-                )[:10]
-                albums = Album.objects.order_by('?')[:20]
-                tracks = Track.objects.order_by('?').annotate(
-                    total_sales=Sum('invoiceline__quantity')
-                )[:50]
+                # Sample random ids instead of sorting whole tables with ORDER BY RANDOM()
+                artists = random_sample(artist_queryset, 10, request=request)
+                albums = random_sample(album_queryset, 20, request=request)
+                tracks = random_sample(track_queryset, 50, request=request)
 
             # Serialize the data
             artist_data = []
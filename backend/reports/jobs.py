@@ -0,0 +1,148 @@
+"""
+Database-backed job queue for report generation.
+
+``enqueue`` queues a ReportJob for a report and returns straight away, so
+requests never render anything themselves. ``run_report_worker`` processes
+poll with ``claim_next_job``, whose conditional UPDATE lets exactly one
+worker win a job on any database, then ``run_job`` renders the file while
+recording progress on the report. Each progress write also refreshes the
+job's ``locked_at`` heartbeat; workers periodically requeue RUNNING jobs
+whose heartbeat is older than ``REPORT_JOB_STALE_AFTER``, and a worker
+whose job was requeued that way abandons it at its next heartbeat.
+Snapshot jobs cannot heartbeat while they run (a snapshot reads every
+table inside one read-only transaction), so they are only requeued after
+``SNAPSHOT_JOB_STALE_AFTER``.
+Failures are retried with exponential backoff until the job runs out of
+attempts.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import GeneratedReport, ReportJob
+from .rendering import ReportError, render_report
+
+logger = logging.getLogger(__name__)
+
+# Runnable jobs a worker considers per poll before giving up to its rivals
+CLAIM_CANDIDATES = 10
+# Report types that stay silent while rendering -> setting bounding that silence
+QUIET_REPORT_TYPES = {'snapshot': 'SNAPSHOT_JOB_STALE_AFTER'}
+
+
+class JobLost(Exception):
+    """The job was requeued away from this worker (its heartbeat went stale)"""
+
+
+def enqueue(report, run_after=None):
+    """Queue ``report`` for rendering (at ``run_after``, default now)"""
+    GeneratedReport.objects.filter(pk=report.pk).update(
+        status='PENDING', progress=0, error_message='', updated_at=timezone.now()
+    )
+    report.status, report.progress, report.error_message = 'PENDING', 0, ''
+    return ReportJob.objects.create(
+        report=report,
+        run_after=run_after or timezone.now(),
+        max_attempts=settings.REPORT_JOB_MAX_ATTEMPTS
+    )
+
+
+def claim_next_job(worker_id):
+    """Mark the oldest runnable job as RUNNING for ``worker_id`` and return it, or None"""
+    now = timezone.now()
+    candidates = ReportJob.objects.filter(
+        status='QUEUED', run_after__lte=now
+    ).order_by('run_after', 'id').values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+    for pk in candidates:
+        claimed = ReportJob.objects.filter(pk=pk, status='QUEUED').update(
+            status='RUNNING', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+        )
+        if claimed:
+            return ReportJob.objects.select_related('report').get(pk=pk)
+    return None
+
+
+def _set_report(report, **fields):
+    GeneratedReport.objects.filter(pk=report.pk).update(updated_at=timezone.now(), **fields)
+    for name, value in fields.items():
+        setattr(report, name, value)
+
+
+def heartbeat(job):
+    """Refresh a running job's lock; raises JobLost if it is no longer this worker's"""
+    still_ours = ReportJob.objects.filter(pk=job.pk, status='RUNNING', locked_by=job.locked_by).update(
+        locked_at=timezone.now()
+    )
+    if not still_ours:
+        raise JobLost(f'Report job {job.pk} was requeued away from {job.locked_by}')
+
+
+def run_job(job):
+    """Render a claimed job's report and record the outcome"""
+    report = job.report
+
+    def on_progress(percent):
+        heartbeat(job)
+        _set_report(report, progress=percent)
+
+    _set_report(report, status='IN_PROGRESS', progress=0)
+    try:
+        render_report(report, on_progress=on_progress)
+        heartbeat(job)
+    except JobLost:
+        # Whichever worker holds the job now records the outcome
+        logger.warning('Report job %s was requeued while %s was running it', job.pk, job.locked_by)
+        return job
+    except ReportError as exc:
+        _fail(job, str(exc), retry=False)
+    except Exception as exc:
+        logger.exception('Report job %s failed on attempt %s', job.pk, job.attempts)
+        _fail(job, f'{type(exc).__name__}: {exc}', retry=True)
+    else:
+        report.status, report.progress, report.error_message = 'COMPLETED', 100, ''
+        report.save(update_fields=['status', 'progress', 'error_message', 'file_path', 'updated_at'])
+        job.status, job.last_error = 'SUCCEEDED', ''
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+    return job
+
+
+def _fail(job, error, retry):
+    if retry and job.attempts < job.max_attempts:
+        delay = settings.REPORT_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.status, job.run_after = 'QUEUED', timezone.now() + timedelta(seconds=delay)
+        _set_report(job.report, status='PENDING', progress=0, error_message=error)
+    else:
+        job.status = 'FAILED'
+        _set_report(job.report, status='FAILED', error_message=error)
+    job.last_error, job.locked_by = error, ''
+    job.save(update_fields=['status', 'run_after', 'last_error', 'locked_by', 'updated_at'])
+
+
+def _stale(older_than):
+    now = timezone.now()
+    condition = Q(locked_at__lt=now - timedelta(seconds=older_than)) & ~Q(report__report_type__in=QUIET_REPORT_TYPES)
+    for report_type, setting in QUIET_REPORT_TYPES.items():
+        limit = max(older_than, getattr(settings, setting))
+        condition |= Q(report__report_type=report_type, locked_at__lt=now - timedelta(seconds=limit))
+    return condition
+
+
+def requeue_stale_jobs(older_than):
+    """
+    Return RUNNING jobs whose heartbeat is older than ``older_than`` seconds
+    (dead workers) to the queue; quiet report types get their own, longer limit
+    """
+    requeued = 0
+    for job in ReportJob.objects.select_related('report').filter(_stale(older_than), status='RUNNING'):
+        # Take the lock first: concurrent sweeps requeue a job once, a fresh heartbeat
+        # wins, and the old worker's next heartbeat finds the job gone
+        taken = ReportJob.objects.filter(pk=job.pk, status='RUNNING', locked_at=job.locked_at).update(
+            locked_by='', locked_at=timezone.now()
+        )
+        if taken:
+            _fail(job, f'Worker {job.locked_by} stopped responding', retry=True)
+            requeued += 1
+    return requeued
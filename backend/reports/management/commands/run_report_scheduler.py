@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.customer_metrics import rescore_customer_metrics
+from reports.scheduling import dispatch_due_reports
+
+
+class Command(BaseCommand):
+    help = (
+        'Queues SCHEDULED reports for run_report_worker as they fall due, and periodically '
+        're-ranks the customer RFM scores so recency decays without new invoices'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=30.0, help='Seconds between checks for due reports')
+        parser.add_argument('--batch-size', type=int, default=100, help='Due reports queued per check')
+        parser.add_argument('--rescore-interval', type=float, default=settings.CUSTOMER_METRICS_RESCORE_INTERVAL,
+                            help='Seconds between customer metric rescores (0 disables them)')
+        parser.add_argument('--once', action='store_true', help='Queue the reports due now, rescore and exit')
+
+    def handle(self, *args, **options):
+        rescored_at = None
+        try:
+            while True:
+                dispatched = dispatch_due_reports(limit=options['batch_size'])
+                if dispatched:
+                    self.stdout.write(f'Queued {len(dispatched)} scheduled reports.')
+                interval = options['rescore_interval']
+                if interval > 0 and (rescored_at is None or time.monotonic() - rescored_at >= interval):
+                    rescored = rescore_customer_metrics()
+                    rescored_at = time.monotonic()
+                    if rescored:
+                        self.stdout.write(f'Rescored {rescored} customers.')
+                if options['once']:
+                    break
+                # A full batch means more may be due already
+                if len(dispatched) < options['batch_size']:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler stopped.')
@@ -0,0 +1,101 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from reports.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+stopping = threading.Event()
+
+
+def work(worker_id, poll_interval, once, stale_after):
+    """Claim and run jobs until stopped (or, with ``once``, until the queue is empty)"""
+    processed = 0
+    # Sweep for jobs whose worker died a few times per stale period, not just at startup
+    sweep_interval = max(stale_after / 4, poll_interval)
+    next_sweep = time.monotonic() + sweep_interval
+    while not stopping.is_set():
+        if time.monotonic() >= next_sweep:
+            requeue_stale_jobs(stale_after)
+            next_sweep = time.monotonic() + sweep_interval
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            stopping.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def pooled_work(worker_id, poll_interval, once, stale_after):
+    # Threads and processes each open their own connection; close it when done
+    try:
+        return work(worker_id, poll_interval, once, stale_after)
+    finally:
+        connections.close_all()
+
+
+def init_process():
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Processes queued report jobs with a pool of worker threads or processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Concurrent jobs')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run workers as threads or as separate processes')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='Requeue RUNNING jobs whose heartbeat is this many seconds old, '
+                                 'at startup and periodically while polling '
+                                 '(default: settings.REPORT_JOB_STALE_AFTER)')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        stale_after = options['stale_after'] or settings.REPORT_JOB_STALE_AFTER
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs.')
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        stopping.clear()
+        if workers == 1:
+            processed = work(f'{prefix}:0', options['poll_interval'], options['once'], stale_after)
+        else:
+            processed = self.run_pool(prefix, workers, stale_after, options)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} report jobs.'))
+
+    def run_pool(self, prefix, workers, stale_after, options):
+        if options['pool'] == 'process':
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_process)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        with pool:
+            futures = [
+                pool.submit(
+                    pooled_work, f'{prefix}:{index}', options['poll_interval'], options['once'], stale_after
+                )
+                for index in range(workers)
+            ]
+            try:
+                return sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping after the current jobs...')
+                stopping.set()
+                return sum(future.result() for future in futures)
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class ReportTemplate(models.Model):
     name = models.CharField(max_length=100)
@@ -21,6 +22,8 @@ class GeneratedReport(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reports')
     template = models.ForeignKey(ReportTemplate, on_delete=models.SET_NULL, null=True, blank=True)
+    # The recurring schedule this report is a run of
+    source = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='runs')
     name = models.CharField(max_length=255)
     report_type = models.CharField(max_length=50)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
@@ -29,9 +32,46 @@ class GeneratedReport(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     scheduled_for = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    error_message = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # run_report_scheduler polls for due SCHEDULED reports
+            models.Index(fields=['status', 'scheduled_for'], name='report_status_sched_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.status})"
+
+
+class ReportJob(models.Model):
+    """A queued run of a GeneratedReport, claimed and executed by run_report_worker"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    report = models.ForeignKey(GeneratedReport, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # Workers poll for the oldest runnable QUEUED job
+            models.Index(fields=['status', 'run_after'], name='reportjob_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} for report {self.report_id} ({self.status})"
@@ -0,0 +1,154 @@
+"""
+Report file rendering.
+
+Each report type maps to a renderer that turns the report's ``parameters``
+into a header, a row iterator and a row count. ``render_report`` streams
+those rows into a CSV or JSON file (``parameters['format']``), reports
+progress as it goes and stores the result in the report's ``file_path``.
+"""
+import csv
+import io
+import json
+import tempfile
+
+from django.core.files import File
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Round
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from analytics.models import TrackSales
+from analytics.rollups import SERIES_GRANULARITIES, sales_series
+from analytics.snapshots import SnapshotError, write_snapshot
+
+FORMATS = ('csv', 'json')
+# Progress is written at most once per this many percentage points
+PROGRESS_STEP = 5
+
+RENDERERS = {}
+
+
+class ReportError(Exception):
+    """A report that can never succeed as requested (unknown type, bad parameters); not retried"""
+
+
+def renderer(*report_types):
+    """Register a renderer for one or more (case-insensitive) report types"""
+    def decorator(func):
+        for report_type in report_types:
+            RENDERERS[report_type] = func
+        return func
+    return decorator
+
+
+def _date_param(parameters, name):
+    value = parameters.get(name)
+    if not value:
+        return None
+    parsed = parse_date(str(value))
+    if parsed is None:
+        raise ReportError(f'Invalid {name}: {value}')
+    return parsed
+
+
+def _limit(queryset, parameters):
+    limit = parameters.get('limit')
+    if limit is None:
+        return queryset
+    try:
+        return queryset[:int(limit)]
+    except (TypeError, ValueError):
+        raise ReportError(f'Invalid limit: {limit}')
+
+
+@renderer('financial', 'revenue', 'sales')
+def sales_report(parameters):
+    granularity = parameters.get('granularity', 'month')
+    if granularity not in SERIES_GRANULARITIES:
+        raise ReportError(f'Invalid granularity: {granularity}')
+    rows = sales_series(granularity, _date_param(parameters, 'start_date'), _date_param(parameters, 'end_date'))
+    header = ['period', 'total_sales', 'total_orders', 'average_order_value']
+    return header, ([row[column] for column in header] for row in rows), len(rows)
+
+
+@renderer('analytics', 'artists')
+def artist_report(parameters):
+    header = ['artist_id', 'artist_name', 'tracks_sold', 'quantity_sold', 'revenue']
+    ranking = _limit(TrackSales.objects.filter(artist__isnull=False).values('artist_id').annotate(
+        artist_name=F('artist__name'),
+        tracks_sold=Count('track_id'),
+        quantity_sold=Sum('quantity_sold'),
+        revenue=Round(Sum('revenue'), 2)
+    ).order_by('-revenue', 'artist_id').values_list(*header), parameters)
+    return header, ranking.iterator(), ranking.count()
+
+
+@renderer('performance', 'tracks')
+def track_report(parameters):
+    header = ['track_id', 'track_name', 'album_title', 'artist_name', 'quantity_sold', 'revenue', 'last_sale_date']
+    ranking = _limit(TrackSales.objects.annotate(
+        track_name=F('track__name'),
+        album_title=F('album__title'),
+        artist_name=F('artist__name'),
+    ).order_by('-revenue', 'track_id').values_list(*header), parameters)
+    return header, ranking.iterator(), ranking.count()
+
+
+@renderer('snapshot')
+def snapshot_report(parameters):
+    """Write a star schema snapshot (see analytics.snapshots) and list its tables"""
+    try:
+        manifest = write_snapshot(
+            parameters.get('snapshot_format', 'parquet'), incremental=bool(parameters.get('incremental'))
+        )
+    except SnapshotError as exc:
+        raise ReportError(str(exc))
+    header = ['snapshot_id', 'mode', 'watermark', 'table', 'rows', 'parts']
+    rows = [
+        [manifest['snapshot_id'], manifest['mode'], manifest['watermark'], name, table['rows'], len(table['parts'])]
+        for name, table in manifest['tables'].items()
+    ]
+    return header, iter(rows), len(rows)
+
+
+def _write_csv(stream, header, rows):
+    writer = csv.writer(stream)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        yield
+
+
+def _write_json(stream, header, rows):
+    stream.write('[')
+    for index, row in enumerate(rows):
+        stream.write(',\n' if index else '\n')
+        stream.write(json.dumps(dict(zip(header, row)), default=str))
+        yield
+    stream.write('\n]\n')
+
+
+def render_report(report, on_progress=None):
+    """Render ``report`` into its ``file_path`` (not saved to the database)"""
+    parameters = report.parameters or {}
+    render = RENDERERS.get((report.report_type or '').strip().lower())
+    if render is None:
+        raise ReportError(f'Unknown report type: {report.report_type}')
+    file_format = parameters.get('format', 'csv')
+    if file_format not in FORMATS:
+        raise ReportError(f'Unsupported format: {file_format}')
+
+    header, rows, total = render(parameters)
+    write = _write_csv if file_format == 'csv' else _write_json
+    reported = 0
+    with tempfile.TemporaryFile() as raw:
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        for written, _ in enumerate(write(stream, header, rows), 1):
+            percent = written * 100 // total
+            if on_progress and percent - reported >= PROGRESS_STEP and percent < 100:
+                reported = percent
+                on_progress(percent)
+        stream.flush()
+        stream.detach()
+        raw.seek(0)
+        report.file_path.save(f'{slugify(report.name) or "report"}-{report.pk}.{file_format}', File(raw), save=False)
@@ -0,0 +1,201 @@
+"""
+Scheduled and recurring reports.
+
+A report is scheduled by giving it a ``scheduled_for`` time and/or a cron
+expression in ``parameters['schedule']`` (evaluated in
+``parameters['timezone']``, default ``settings.TIME_ZONE``). It then sits in
+SCHEDULED status until ``run_report_scheduler`` finds it due and hands it to
+the report worker queue.
+
+One-off reports are queued themselves. Recurring reports stay SCHEDULED as
+the schedule definition: each run is a new report linked back through
+``source``, and ``scheduled_for`` moves on to the next occurrence. Both
+transitions are conditional UPDATEs on the ``scheduled_for`` that was read,
+so concurrent schedulers never dispatch the same occurrence twice.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import GeneratedReport
+
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+# Give up on expressions that never match (e.g. 30 February) after this many years
+SEARCH_YEARS = 5
+
+
+class ScheduleError(ValueError):
+    """An invalid cron expression or timezone"""
+
+
+def _parse_value(value, low, names):
+    value = value.lower()
+    if value in names:
+        return names.index(value) + low
+    if not value.isdigit():
+        raise ScheduleError(f'Invalid value: {value}')
+    return int(value)
+
+
+def _parse_field(spec, low, high, names=()):
+    values = set()
+    for part in spec.split(','):
+        part, _, step = part.partition('/')
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (_parse_value(value, low, names) for value in part.split('-', 1))
+        else:
+            start = end = _parse_value(part, low, names)
+            if step:
+                end = high
+        step = int(step) if step.isdigit() else (1 if not step else 0)
+        if step < 1 or not low <= start <= end <= high:
+            raise ScheduleError(f'Invalid field: {spec}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A standard five-field cron expression: minute hour day-of-month month day-of-week"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ScheduleError(f'Expected five cron fields: {expression}')
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+        # 7 is also Sunday
+        self.weekdays = {day % 7 for day in _parse_field(fields[4], 0, 7, DAY_NAMES)}
+        # As in cron, when both day fields are restricted a day matching either runs
+        self.any_day = fields[2] != '*' and fields[4] != '*'
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        return in_month or in_week if self.any_day else in_month and in_week
+
+    def next_after(self, moment):
+        """First naive wall-clock minute strictly after naive ``moment`` that matches"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment.year + SEARCH_YEARS
+        while moment.year <= limit:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(year=moment.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ScheduleError(f'Schedule never runs: {self.expression}')
+
+
+def get_zone(parameters):
+    name = (parameters or {}).get('timezone') or settings.TIME_ZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ScheduleError(f'Unknown timezone: {name}')
+
+
+def validate_schedule(parameters):
+    """Raise ScheduleError unless ``parameters`` holds a usable schedule (if any)"""
+    get_zone(parameters)
+    expression = (parameters or {}).get('schedule')
+    if expression is not None:
+        if not isinstance(expression, str):
+            raise ScheduleError('schedule must be a cron expression string')
+        CronSchedule(expression).next_after(datetime(2000, 1, 1))
+
+
+def next_run(report, after):
+    """Next occurrence of ``report``'s recurring schedule after aware ``after``; None if one-off"""
+    expression = (report.parameters or {}).get('schedule')
+    if not expression:
+        return None
+    zone = get_zone(report.parameters)
+    local = timezone.localtime(after, zone).replace(tzinfo=None)
+    return timezone.make_aware(CronSchedule(expression).next_after(local), zone)
+
+
+def schedule(report):
+    """Put ``report`` in SCHEDULED status if it asks for a later or recurring run; return whether it did"""
+    first = report.scheduled_for or next_run(report, timezone.now())
+    if first is None:
+        return False
+    GeneratedReport.objects.filter(pk=report.pk).update(status='SCHEDULED', scheduled_for=first)
+    report.status, report.scheduled_for = 'SCHEDULED', first
+    return True
+
+
+def _dispatch(report, now):
+    due = report.scheduled_for
+    following = next_run(report, max(now, due))
+    if following is None:
+        if GeneratedReport.objects.filter(pk=report.pk, status='SCHEDULED', scheduled_for=due).update(
+            status='PENDING', updated_at=now
+        ):
+            enqueue(report)
+            return report
+        return None
+
+    # Missed occurrences (scheduler downtime) collapse into this one run
+    if not GeneratedReport.objects.filter(pk=report.pk, status='SCHEDULED', scheduled_for=due).update(
+        scheduled_for=following, updated_at=now
+    ):
+        return None
+    parameters = {key: value for key, value in report.parameters.items() if key not in ('schedule', 'timezone')}
+    run = GeneratedReport.objects.create(
+        user_id=report.user_id,
+        template_id=report.template_id,
+        source=report,
+        name=report.name,
+        report_type=report.report_type,
+        parameters=parameters,
+        scheduled_for=due,
+    )
+    enqueue(run)
+    return run
+
+
+def dispatch_due_reports(now=None, limit=100):
+    """Queue up to ``limit`` due SCHEDULED reports; return the reports queued"""
+    now = now or timezone.now()
+    due = GeneratedReport.objects.filter(
+        status='SCHEDULED', scheduled_for__lte=now
+    ).order_by('scheduled_for', 'id')[:limit]
+    dispatched = []
+    for report in due:
+        # A claim and its job commit together, so a crash can't lose an occurrence
+        try:
+            with transaction.atomic():
+                run = _dispatch(report, now)
+        except ScheduleError as exc:
+            GeneratedReport.objects.filter(pk=report.pk, status='SCHEDULED').update(
+                status='FAILED', error_message=str(exc), updated_at=now
+            )
+            continue
+        if run is not None:
+            dispatched.append(run)
+    return dispatched
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import ReportTemplate, GeneratedReport
+from .scheduling import ScheduleError, validate_schedule
 
 class ReportTemplateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,6 +15,17 @@ class GeneratedReportSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'template', 'template_name', 'name', 
             'report_type', 'status', 'file_path', 'parameters', 
-            'created_at', 'updated_at', 'scheduled_for'
+            'created_at', 'updated_at', 'scheduled_for', 'progress', 'error_message', 'source'
         ]
-        read_only_fields = ['user', 'status', 'file_path', 'created_at', 'updated_at']
+        read_only_fields = [
+            'user', 'status', 'file_path', 'created_at', 'updated_at', 'progress', 'error_message', 'source'
+        ]
+
+    def validate_parameters(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object.')
+        try:
+            validate_schedule(value)
+        except ScheduleError as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
@@ -1,3 +1,271 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from analytics.models import TrackSales
+from . import jobs
+from .jobs import claim_next_job, enqueue, requeue_stale_jobs, run_job
+from .management.commands.run_report_worker import work
+from .models import GeneratedReport, ReportJob
+from .scheduling import CronSchedule, ScheduleError, _dispatch, dispatch_due_reports
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, REPORT_JOB_RETRY_DELAY=0)
+class ReportJobTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(21)
+        call_command('seed_analytics_data', stdout=StringIO())
+        cls.user = get_user_model().objects.create_user(
+            email='analyst@example.com', username='analyst', password='secret-pass-123'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_report(self, report_type='performance', **parameters):
+        return GeneratedReport.objects.create(
+            user=self.user, name='Track Performance', report_type=report_type, parameters=parameters
+        )
+
+    def test_generate_only_queues_the_report(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('reports-generate'), {
+            'name': 'Revenue', 'report_type': 'Financial', 'parameters': {'granularity': 'year'}
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertEqual(ReportJob.objects.get(report_id=response.data['id']).status, 'QUEUED')
+
+        call_command('run_report_worker', workers=1, once=True, stdout=StringIO())
+        report = GeneratedReport.objects.get(pk=response.data['id'])
+        self.assertEqual((report.status, report.progress), ('COMPLETED', 100))
+        with report.file_path.open('r') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['period', 'total_sales', 'total_orders', 'average_order_value'])
+
+    def test_renders_json_rankings_with_progress(self):
+        report = self.create_report(format='json')
+        enqueue(report)
+        job = claim_next_job('test-worker')
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('RUNNING', 1, 'test-worker'))
+        self.assertIsNone(claim_next_job('rival-worker'))
+
+        with mock.patch('reports.jobs._set_report', wraps=jobs._set_report) as set_report:
+            run_job(job)
+        progress = [call.kwargs['progress'] for call in set_report.call_args_list if 'progress' in call.kwargs]
+        self.assertTrue(any(0 < percent < 100 for percent in progress))
+        self.assertEqual(progress, sorted(progress))
+
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED')
+        with report.file_path.open('r') as f:
+            rows = json.load(f)
+        self.assertEqual(len(rows), TrackSales.objects.count())
+        self.assertEqual(rows[0]['track_id'], TrackSales.objects.order_by('-revenue', 'track_id').first().track_id)
+
+    def test_failures_are_retried_then_marked_failed(self):
+        report = self.create_report()
+        job = enqueue(report)
+        with mock.patch('reports.jobs.render_report', side_effect=RuntimeError('disk full')):
+            for attempt in range(1, 4):
+                with self.assertLogs('reports.jobs', 'ERROR'):
+                    run_job(claim_next_job('test-worker'))
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIsNone(claim_next_job('test-worker'))
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.error_message), ('FAILED', 'RuntimeError: disk full'))
+
+    def test_bad_requests_fail_without_retrying(self):
+        job = enqueue(self.create_report(report_type='horoscope'))
+        run_job(claim_next_job('test-worker'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 1))
+        self.assertEqual(job.report.error_message, 'Unknown report type: horoscope')
+
+    def test_stale_jobs_are_requeued(self):
+        job = enqueue(self.create_report())
+        claim_next_job('dead-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(older_than=60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertEqual(job.report.status, 'PENDING')
+
+    @override_settings(SNAPSHOT_JOB_STALE_AFTER=3 * 3600)
+    def test_snapshot_jobs_get_a_longer_stale_limit(self):
+        job = enqueue(self.create_report('snapshot'))
+        claim_next_job('busy-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(older_than=60), 0)
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=4))
+        self.assertEqual(requeue_stale_jobs(older_than=60), 1)
+
+    def test_progress_keeps_long_jobs_locked(self):
+        enqueue(self.create_report())
+        job = claim_next_job('slow-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        swept = []
+
+        def render(report, on_progress):
+            on_progress(50)
+            swept.append(requeue_stale_jobs(older_than=60))
+
+        with mock.patch('reports.jobs.render_report', side_effect=render):
+            run_job(job)
+        self.assertEqual(swept, [0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'SUCCEEDED')
+
+    def test_requeued_jobs_are_abandoned_by_their_old_worker(self):
+        report = self.create_report()
+        enqueue(report)
+        job = claim_next_job('stuck-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        def render(report, on_progress):
+            self.assertEqual(requeue_stale_jobs(older_than=60), 1)
+            on_progress(50)
+
+        with mock.patch('reports.jobs.render_report', side_effect=render), self.assertLogs('reports.jobs', 'WARNING'):
+            run_job(job)
+        job.refresh_from_db()
+        report.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('QUEUED', ''))
+        self.assertEqual(report.status, 'PENDING')
+
+    def test_workers_sweep_for_stale_jobs_while_polling(self):
+        job = enqueue(self.create_report())
+        claim_next_job('dead-worker')
+        ReportJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('reports.management.commands.run_report_worker.requeue_stale_jobs',
+                        wraps=requeue_stale_jobs) as sweep:
+            # stale_after=0: the sweep is due on the first poll
+            processed = work('live-worker', poll_interval=0, once=True, stale_after=0)
+        sweep.assert_called_with(0)
+        self.assertEqual(processed, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('SUCCEEDED', 2))
+
+
+class CronScheduleTests(APITestCase):
+    def next_runs(self, expression, start, count=3):
+        schedule, runs = CronSchedule(expression), []
+        for _ in range(count):
+            start = schedule.next_after(start)
+            runs.append(start)
+        return runs
+
+    def test_fields_ranges_steps_and_names(self):
+        self.assertEqual(self.next_runs('*/20 9-10 * * mon-fri', datetime(2024, 3, 1, 10, 30)), [
+            datetime(2024, 3, 1, 10, 40), datetime(2024, 3, 4, 9, 0), datetime(2024, 3, 4, 9, 20)
+        ])
+        self.assertEqual(self.next_runs('@monthly', datetime(2024, 1, 31, 12)), [
+            datetime(2024, 2, 1), datetime(2024, 3, 1), datetime(2024, 4, 1)
+        ])
+        # Restricting both day fields runs on either
+        self.assertEqual(self.next_runs('0 6 13 * 5', datetime(2024, 9, 1)), [
+            datetime(2024, 9, 6, 6), datetime(2024, 9, 13, 6), datetime(2024, 9, 20, 6)
+        ])
+
+    def test_invalid_expressions(self):
+        for expression in ['* * * *', '61 * * * *', '*/0 * * * *', '0 0 * foo *']:
+            with self.subTest(expression=expression), self.assertRaises(ScheduleError):
+                CronSchedule(expression)
+        with self.assertRaises(ScheduleError):
+            CronSchedule('0 0 30 2 *').next_after(datetime(2024, 1, 1))
+
+
+class ReportSchedulerTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='scheduler@example.com', username='scheduler', password='secret-pass-123'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_generate_schedules_recurring_reports(self):
+        response = self.client.post(reverse('reports-generate'), {
+            'name': 'Weekly Revenue', 'report_type': 'financial',
+            'parameters': {'schedule': '0 7 * * mon', 'timezone': 'Africa/Nairobi'}
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        report = GeneratedReport.objects.get(pk=response.data['id'])
+        self.assertEqual(report.status, 'SCHEDULED')
+        # 07:00 in Nairobi (UTC+3) on a Monday
+        self.assertEqual((report.scheduled_for.weekday(), report.scheduled_for.hour), (0, 4))
+        self.assertFalse(ReportJob.objects.exists())
+
+        response = self.client.post(reverse('reports-generate'), {
+            'name': 'Broken', 'report_type': 'financial', 'parameters': {'schedule': 'every day'}
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parameters', response.data)
+
+    def test_dispatches_one_off_and_recurring_reports_once(self):
+        now = timezone.now()
+        one_off = GeneratedReport.objects.create(
+            user=self.user, name='Once', report_type='tracks', status='SCHEDULED',
+            scheduled_for=now - timedelta(minutes=5)
+        )
+        recurring = GeneratedReport.objects.create(
+            user=self.user, name='Hourly', report_type='tracks', status='SCHEDULED',
+            scheduled_for=now - timedelta(hours=3), parameters={'schedule': '@hourly', 'limit': 10}
+        )
+        later = GeneratedReport.objects.create(
+            user=self.user, name='Later', report_type='tracks', status='SCHEDULED',
+            scheduled_for=now + timedelta(hours=1)
+        )
+
+        call_command('run_report_scheduler', once=True, stdout=StringIO())
+        self.assertEqual(dispatch_due_reports(), [])
+
+        one_off.refresh_from_db()
+        self.assertEqual(one_off.status, 'PENDING')
+        self.assertEqual(one_off.jobs.count(), 1)
+
+        # Missed hours collapse into one run, and the schedule moves past now
+        recurring.refresh_from_db()
+        self.assertEqual(recurring.status, 'SCHEDULED')
+        self.assertGreater(recurring.scheduled_for, now)
+        self.assertEqual(recurring.scheduled_for.minute, 0)
+        run = recurring.runs.get()
+        self.assertEqual((run.status, run.parameters), ('PENDING', {'limit': 10}))
+        self.assertEqual(run.jobs.count(), 1)
+
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'SCHEDULED')
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+    def test_claims_are_exclusive(self):
+        due = timezone.now() - timedelta(minutes=1)
+        report = GeneratedReport.objects.create(
+            user=self.user, name='Daily', report_type='tracks', status='SCHEDULED',
+            scheduled_for=due, parameters={'schedule': '@daily'}
+        )
+        # A rival scheduler already advanced the schedule after this one read it
+        stale = GeneratedReport.objects.get(pk=report.pk)
+        GeneratedReport.objects.filter(pk=report.pk).update(scheduled_for=due + timedelta(days=1))
+        self.assertIsNone(_dispatch(stale, timezone.now()))
+        self.assertFalse(report.runs.exists())
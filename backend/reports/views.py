@@ -3,8 +3,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import ReportTemplate, GeneratedReport
 from .serializers import ReportTemplateSerializer, GeneratedReportSerializer
-from django.utils import timezone
-import time
+from .jobs import enqueue
+from .scheduling import schedule
 
 class ReportTemplateViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ReportTemplate.objects.all()
@@ -19,7 +19,7 @@ class GeneratedReportViewSet(viewsets.ModelViewSet):
         return GeneratedReport.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        schedule(serializer.save(user=self.request.user))
 
     @action(detail=False, methods=['get'])
     def recent(self, request):
@@ -37,14 +37,11 @@ class GeneratedReportViewSet(viewsets.ModelViewSet):
     def generate(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            report = serializer.save(user=self.request.user, status='IN_PROGRESS')
-            
-            # In a real app, this would be a Celery task
-            # For this MVP, we just mark it as completed after a small delay
-            # (Note: In a real request/response, we shouldn't sleep, 
-            # but this is just to simulate the backend doing work)
-            report.status = 'COMPLETED'
-            report.save()
-            
-            return Response(self.get_serializer(report).data, status=status.HTTP_201_CREATED)
+            report = serializer.save(user=self.request.user)
+            if schedule(report):
+                # Queued by run_report_scheduler when due
+                return Response(self.get_serializer(report).data, status=status.HTTP_201_CREATED)
+            # Rendered by run_report_worker; clients poll status and progress
+            enqueue(report)
+            return Response(self.get_serializer(report).data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
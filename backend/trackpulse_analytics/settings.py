@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'analytics.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'trackpulse_analytics.urls'
@@ -85,6 +86,66 @@ DATABASES = {
     }
 }
 
+# Cache
+# The analytics cache backend is pluggable: 'locmem', 'file' or a full backend path
+ANALYTICS_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+ANALYTICS_CACHE_BACKEND = config('ANALYTICS_CACHE_BACKEND', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trackpulse',
+    },
+    'analytics': {
+        'BACKEND': ANALYTICS_CACHE_BACKENDS.get(ANALYTICS_CACHE_BACKEND, ANALYTICS_CACHE_BACKEND),
+        'LOCATION': config('ANALYTICS_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'analytics')),
+        'TIMEOUT': config('ANALYTICS_CACHE_TTL', default=300, cast=int),
+    },
+}
+
+# Seconds the analytics dashboard summary is served from cache
+DASHBOARD_CACHE_TTL = config('DASHBOARD_CACHE_TTL', default=30, cast=int)
+
+# Seconds browsers and shared caches may reuse anonymous responses of public endpoints
+PUBLIC_CACHE_MAX_AGE = config('PUBLIC_CACHE_MAX_AGE', default=60, cast=int)
+
+# Seconds between checks for catalog writes made by other processes (autocomplete index)
+AUTOCOMPLETE_REFRESH_SECONDS = config('AUTOCOMPLETE_REFRESH_SECONDS', default=60, cast=int)
+
+# Seconds between checks for new invoice lines and rewrites (in-process sales cube)
+ANALYTICS_CUBE_REFRESH_SECONDS = config('ANALYTICS_CUBE_REFRESH_SECONDS', default=30, cast=int)
+
+# Largest result the pivot endpoint returns before asking for more filters
+PIVOT_MAX_ROWS = config('PIVOT_MAX_ROWS', default=5000, cast=int)
+
+# Rows fetched and encoded per chunk by streaming exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Star schema snapshots (snapshot_star_schema): output directory and rows per row group
+SNAPSHOT_ROOT = config('SNAPSHOT_ROOT', default=str(BASE_DIR / 'snapshots'))
+SNAPSHOT_ROW_GROUP_SIZE = config('SNAPSHOT_ROW_GROUP_SIZE', default=50000, cast=int)
+
+# Report jobs (run_report_worker): attempts per job, first retry delay in seconds
+# (doubling per attempt) and how long a RUNNING job may go silent before it is requeued
+REPORT_JOB_MAX_ATTEMPTS = config('REPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+REPORT_JOB_RETRY_DELAY = config('REPORT_JOB_RETRY_DELAY', default=30, cast=int)
+REPORT_JOB_STALE_AFTER = config('REPORT_JOB_STALE_AFTER', default=1800, cast=int)
+# Snapshot jobs only heartbeat when they start and finish, so they get longer
+SNAPSHOT_JOB_STALE_AFTER = config('SNAPSHOT_JOB_STALE_AFTER', default=21600, cast=int)
+
+# Seconds between run_report_scheduler's re-rankings of the customer RFM scores
+CUSTOMER_METRICS_RESCORE_INTERVAL = config('CUSTOMER_METRICS_RESCORE_INTERVAL', default=3600, cast=int)
+
+# Requests over their declared @query_budget are logged; tests can make them raise
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=False, cast=bool)
+# Extra queries tolerated on authenticated requests (session and user lookups)
+QUERY_BUDGET_AUTH_ALLOWANCE = 2
+# Extra query tolerated on cached views (reading the shared cache versions)
+QUERY_BUDGET_CACHE_ALLOWANCE = 1
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -127,7 +188,7 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'analytics.pagination.SelectablePagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
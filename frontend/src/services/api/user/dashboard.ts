@@ -6,6 +6,7 @@ import type {
   TopCustomer,
   RecentOrder,
   MonthlySales,
+  SalesGranularity,
   GenreAnalysis,
   CountryAnalysis,
   DashboardSummary,
@@ -49,11 +50,18 @@ export const dashboardApi = {
     return response.data;
   },
 
-  getSalesOverview: async (startDate?: string, endDate?: string): Promise<MonthlySales[]> => {
+  getSalesOverview: async (
+    startDate?: string,
+    endDate?: string,
+    granularity?: SalesGranularity,
+    rolling?: number
+  ): Promise<MonthlySales[]> => {
     let url = "/analytics/analytics/sales_overview/";
     const params = new URLSearchParams();
     if (startDate) params.append("start_date", startDate);
     if (endDate) params.append("end_date", endDate);
+    if (granularity) params.append("granularity", granularity);
+    if (rolling) params.append("rolling", String(rolling));
     if (params.toString()) url += `?${params.toString()}`;
     const response = await api.get<MonthlySales[]>(url);
     return response.data;
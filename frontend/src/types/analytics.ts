@@ -51,11 +51,14 @@ export interface RecentOrder {
   date: string;
 }
 
+export type SalesGranularity = "day" | "week" | "month" | "quarter" | "year";
+
 export interface MonthlySales {
-  period: string; // YYYY-MM
+  period: string; // YYYY-MM (YYYY-MM-DD, YYYY-Www, YYYY-Qn or YYYY for other granularities)
   total_sales: number;
   total_orders: number;
   average_order_value: number;
+  rolling_average?: number | null; // only with ?rolling=N
 }
 
 export interface GenreAnalysis {